@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 from main.dataset.remote_dataset_factory import RemoteDatasetFactory
 from main.search_engine import yahoo_images, bing_images, flickr_images, google_images, howold_images
-import sys
 
 __author__ = "Ivan de Paz Centeno"
 
@@ -20,14 +19,12 @@ dataset_name = dataset_names[0]
 session = remote_dataset_factory.get_session_from_dataset_name(dataset_name)
 
 print("size:", session.size())
-while session.pop_new_search_request() is not None:
-    print(".",end="")
-    sys.stdout.flush()
 
-print("size:", session.size())
+# The backup replaces the content of the session atomically, so there is no need to drain it before.
+if session.load_session("Backup_snapshot_test.json"):
+    print("Backup loaded.")
 
-session.load_session("Backup_snapshot_test.json")
-print("Backup loaded.")
+print("size:", session.size())
 
-#session.save_session("Backup_snapshot_test.json")
-#print("Backup saved.")
\ No newline at end of file
+#session.save_session("Backup_snapshot_test.ndjson")
+#print("Backup saved.")
@@ -18,7 +18,10 @@ def print_usage():
     """
     Prints the usage pattern.
     """
-    print("Usage: crawler URL -w WORKERS_COUNT -t TIME_WAIT_BETWEEN_TRIES_IN_SECONDS")
+    print("Usage: crawler URL -w WORKERS_COUNT -t TIME_WAIT_BETWEEN_TRIES_IN_SECONDS [-x] [-f] [-l]")
+    print("  -x: run the browsers in a virtual display shared by the workers, instead of in headless mode.")
+    print("  -f: load the pages fully (images, fonts, trackers), instead of with the lean profile.")
+    print("  -l: fetch with plain HTTP requests, without a browser, the pages of the engines that don't need one.")
 
 def get_options():
     """
@@ -44,6 +47,12 @@ def get_options():
                 key = "workers"
             elif arg == "-t":
                 key = "wait_time_between_tries"
+            elif arg == "-x":
+                options["shared_display"] = True
+            elif arg == "-f":
+                options["full_pages"] = True
+            elif arg == "-l":
+                options["light"] = True
             else:
                 options["url"] = arg
 
@@ -74,7 +83,10 @@ def signal_handler(signal, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-crawling_process = CrawlingProcess(options['url'], int(options['workers']), float(options['wait_time_between_tries']))
+crawling_process = CrawlingProcess(options['url'], int(options['workers']), float(options['wait_time_between_tries']),
+                                   headless=not options.get('shared_display', False),
+                                   lean=not options.get('full_pages', False),
+                                   light=options.get('light', False))
 
 crawling_process.start()
 
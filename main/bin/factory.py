@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 from flask import Flask
 import sys
+from main.controllers.compression_middleware import CompressionMiddleware
 from main.controllers.controller_factory import ControllerFactory
 from main.search_engine import yahoo_images, bing_images, google_images, howold_images, flickr_images
-from main.dataset.dataset_factory import DatasetFactory
+from main.dataset.dataset_factory import DatasetFactory, SESSION_STORES, SESSION_STORE_MEMORY
 from main.service.global_status import global_status
 
 
@@ -18,7 +19,7 @@ def print_usage():
     """
     Prints the usage pattern.
     """
-    print("Usage: factory HOST -p PORT -d DATASETS_DESTINATION_URI")
+    print("Usage: factory HOST -p PORT -d DATASETS_DESTINATION_URI [-j SESSIONS_JOURNAL_DIR] [-s memory|sqlite]")
 
 def get_options():
     """
@@ -41,6 +42,10 @@ def get_options():
                 key = "port"
             elif arg == "-d":
                 key = "datasets_destination_uri"
+            elif arg == "-j":
+                key = "sessions_dir"
+            elif arg == "-s":
+                key = "session_store"
             elif arg == "-h":
                 print_usage()
                 force_exit()
@@ -56,6 +61,18 @@ def get_options():
         if "datasets_destination_uri" not in options:
             options['datasets_destination_uri'] = "/var/www/html/datasets/"
 
+        if "sessions_dir" not in options:
+            options['sessions_dir'] = None
+
+        if "session_store" not in options:
+            options['session_store'] = SESSION_STORE_MEMORY
+
+        if options['session_store'] not in SESSION_STORES:
+            raise Exception("Unknown session store: {}.".format(options['session_store']))
+
+        if options['session_store'] != SESSION_STORE_MEMORY and options['sessions_dir'] is None:
+            raise Exception("The {} session store requires a sessions dir (-j).".format(options['session_store']))
+
         for key in required_options:
             if key not in options:
                 raise Exception("Missing option: {}.".format(key))
@@ -70,8 +87,10 @@ def get_options():
 options = get_options()
 
 app = Flask(__name__)
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
-dataset_factory = DatasetFactory(publish_dir=options['datasets_destination_uri'])
+dataset_factory = DatasetFactory(publish_dir=options['datasets_destination_uri'], sessions_dir=options['sessions_dir'],
+                                 session_store=options['session_store'])
 
 controller_factory = ControllerFactory(app, dataset_factory=dataset_factory)
 
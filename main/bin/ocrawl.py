@@ -6,14 +6,16 @@ import os
 import random
 
 import sys
-from time import sleep, time
+from time import time
 import datetime
 from main.dataset.remote_dataset_factory import RemoteDatasetFactory
 from main.search_engine.bing_images import BingImages
 from main.search_engine.google_images import GoogleImages
 from main.search_engine.yahoo_images import YahooImages
 from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import PROGRESS_WAIT_TIME
 from main.service.global_status import global_status
+from main.service.http_client import get_http_client
 from main.service.status import SERVICE_CREATED_DATASET, get_status_name, SERVICE_STATUS_UNKNOWN, SERVICE_RUNNING, \
     get_status_by_name
 
@@ -170,8 +172,8 @@ def generate_search_requests(keywords, append_adjetives=None, portraits=False):
     if append_adjetives:
         keywords_list = ["{} {}".format(keywords, adjetive) for adjetive in append_adjetives]
 
-    return [SearchRequest(adjetived_keywords, _options, search_engine) for search_engine in search_engines for
-            adjetived_keywords in keywords_list]
+    return [SearchRequest(adjetived_keywords, _options, search_engine, group=keywords) for search_engine in
+            search_engines for adjetived_keywords in keywords_list]
 
 try:
     remote_dataset_factory.create_dataset(dataset_name)
@@ -203,7 +205,8 @@ try:
         previous_status: True,
     }
 
-    time_passed = 0
+    last_backup_time = time()
+    percent_data = {}
 
     logging.info("*****************************")
     logging.info("Dataset creation requested with name {}".format(dataset_name))
@@ -215,7 +218,9 @@ try:
     completed = False
 
     while status != SERVICE_CREATED_DATASET:
-        percent_data = remote_dataset_factory.get_dataset_builder_percent(dataset_name)
+        # The factory answers as soon as the build progresses, instead of being polled every second.
+        percent_data = remote_dataset_factory.wait_for_dataset_builder_percent(
+            dataset_name, percent_data, min(PROGRESS_WAIT_TIME, backup_time_seconds))
         status = get_status_by_name(percent_data['status'])
 
         if status == SERVICE_STATUS_UNKNOWN and 'percent' not in percent_data:
@@ -247,20 +252,19 @@ try:
             print_progress(percent, 100, get_status_name(status), "Complete", bar_length=50)
             progress_completed[status] = percent == 100
 
-        sleep(1)
-        time_passed += 1
+        if not completed and time() - last_backup_time >= backup_time_seconds:
+            last_backup_time = time()
+            completion_progress = remote_session.get_completion_progress()
+            completed = completion_progress == 100
 
-        if not completed:
-            completed = remote_session.get_completion_progress() == 100
-
-            if time_passed % backup_time_seconds == 0:
-                remote_session.save_session(
-                    os.path.join(options['backup_folder'],
-                                 "backup_{}_{}.json".format(dataset_name, remote_session.get_completion_progress())
-                                 )
-                )
+            remote_session.save_session(
+                os.path.join(options['backup_folder'],
+                             "backup_{}_{}.ndjson".format(dataset_name, completion_progress)
+                             )
+            )
 
     print("Dataset is now hosted by the factory. Visit the factory public interface to access it.")
+    logging.info("Calls to the factory: {}".format(get_http_client().get_stats()))
 except Exception as ex:
     logging.info("Error: {}".format(ex))
 
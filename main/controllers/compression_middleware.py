@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+
+from main.service.compression import CODECS, SUPPORTED_ENCODINGS, MIN_COMPRESS_SIZE, MAX_DECOMPRESSED_SIZE, \
+    choose_encoding, is_compressible, compress_stream, decompress_stream
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class CompressionMiddleware(object):
+    """
+    WSGI middleware that compresses transparently the bodies of the requests and the responses of the controllers.
+
+    - Request bodies sent with a Content-Encoding (gzip, or zstd if available) are decompressed on the fly, so the
+      controllers read them as usual, even if they are streamed. Bodies that expand beyond max_body_size raise
+      ContentTooLarge while they are read, which the controllers answer with a 413.
+    - Responses are compressed with the preferred encoding of the Accept-Encoding header of the request, if their
+      content type is compressible and they are not too small. Streamed responses are compressed chunk by chunk.
+    - Every response advertises the encodings accepted for the request bodies in its Accept-Encoding header
+      (RFC 7694), so the clients know they can compress the next ones.
+    """
+
+    def __init__(self, wsgi_app, min_size=MIN_COMPRESS_SIZE, max_body_size=MAX_DECOMPRESSED_SIZE):
+        """
+        :param wsgi_app: WSGI application to wrap, like flask_app.wsgi_app.
+        :param min_size: minimum size of a response to be compressed, if it is known beforehand.
+        :param max_body_size: maximum size of a decompressed request body. None for no limit.
+        """
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.max_body_size = max_body_size
+
+    def __call__(self, environ, start_response):
+        request_encoding = environ.get('HTTP_CONTENT_ENCODING', "").strip().lower()
+
+        if request_encoding and request_encoding != "identity":
+            if request_encoding not in CODECS:
+                return self._reject_encoding(request_encoding, start_response)
+
+            # The size of the decompressed body is unknown, so it is read until the end of the compressed one.
+            content_length = environ.pop('CONTENT_LENGTH', None)
+            length = int(content_length) if content_length else None
+
+            if length is None and not environ.get('wsgi.input_terminated', False):
+                length = 0
+
+            environ['wsgi.input'] = decompress_stream(environ['wsgi.input'], request_encoding, length,
+                                                     self.max_body_size)
+            environ['wsgi.input_terminated'] = True
+            environ.pop('HTTP_CONTENT_ENCODING', None)
+
+        response_encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', None))
+        compressed = []
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = [(name, value) for name, value in headers if name.lower() != "accept-encoding"]
+            headers.append(("Accept-Encoding", ", ".join(SUPPORTED_ENCODINGS)))
+
+            if response_encoding and self._should_compress(headers):
+                headers = [(name, value) for name, value in headers if name.lower() != "content-length"]
+                headers.append(("Content-Encoding", response_encoding))
+                headers.append(("Vary", "Accept-Encoding"))
+                compressed.append(True)
+
+            return start_response(status, headers, exc_info)
+
+        response = self.wsgi_app(environ, compressing_start_response)
+
+        if not compressed:
+            return response
+
+        return self._compress_response(response, response_encoding)
+
+    def _should_compress(self, headers):
+        headers = {name.lower(): value for name, value in headers}
+
+        if 'content-encoding' in headers or not is_compressible(headers.get('content-type', None)):
+            return False
+
+        content_length = headers.get('content-length', None)
+
+        return content_length is None or int(content_length) >= self.min_size
+
+    @staticmethod
+    def _compress_response(response, encoding):
+        try:
+            for chunk in compress_stream(response, encoding):
+                yield chunk
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+    @staticmethod
+    def _reject_encoding(encoding, start_response):
+        body = json.dumps({'message': "Content-Encoding {} is not supported.".format(encoding)}).encode()
+
+        start_response("415 UNSUPPORTED MEDIA TYPE", [("Content-Type", "application/json"),
+                                                      ("Content-Length", str(len(body))),
+                                                      ("Accept-Encoding", ", ".join(SUPPORTED_ENCODINGS))])
+        return [body]
@@ -3,12 +3,17 @@
 
 from functools import partial
 from multiprocessing import Lock
-from flask import jsonify, request
+from flask import Response, request
 from main.exceptions.invalid_request import InvalidRequest
+from main.search_session.search_session import SearchSession, MAX_LEASE_TIME
+from main.service.codec import choose_content_type, decode, encode
+from main.service.compression import ContentTooLarge
 
 
 __author__ = "Ivan de Paz Centeno"
 
+MAX_WAIT_TIME = 30  # seconds a long-poll request is held at most
+
 
 def route(*args, **kwargs):
     """
@@ -51,7 +56,7 @@ def error_handler(*args, **kwargs):
 
             partial_func = partial(func, self)
 
-            app.register_error_handler(*(args, partial_func))
+            app.register_error_handler(*(args + (partial_func,)))
 
         return decorator2
 
@@ -76,7 +81,8 @@ class Controller(object):
         self.dataset_factory = dataset_factory
 
         self.exposed_methods = [
-            self.handle_invalid_request
+            self.handle_invalid_request,
+            self.handle_content_too_large
         ]
 
     def _init_exposed_methods(self):
@@ -103,6 +109,82 @@ class Controller(object):
 
         return request_args
 
+    @staticmethod
+    def _get_request_content():
+        """
+        Decodes the body of the request, which may be in any of the supported formats (JSON or msgpack), as stated by
+        its Content-Type.
+        :return: the content of the body.
+        """
+        try:
+            content = decode(request.get_data(), request.content_type)
+        except ValueError as ex:
+            raise InvalidRequest("The body of the request could not be decoded: {}".format(ex))
+
+        return content
+
+    @staticmethod
+    def _respond(content, status_code=200):
+        """
+        Builds the response for the given content, encoded in the format preferred by the Accept header of the
+        request (JSON by default).
+        """
+        content_type = choose_content_type(request.headers.get('Accept', None))
+
+        return Response(encode(content, content_type), status=status_code, mimetype=content_type)
+
+    @staticmethod
+    def _get_lease_time(request_args):
+        """
+        Retrieves the optional lease time parameter from the request.
+        :return: lease time in seconds, or None if not specified.
+        """
+        lease_time = request_args.get('lease_time', None)
+
+        if lease_time is not None:
+            try:
+                lease_time = float(lease_time)
+            except (TypeError, ValueError):
+                lease_time = None
+
+            if not SearchSession.is_valid_lease_time(lease_time):
+                raise InvalidRequest("Parameter 'lease_time' must be a number of seconds greater than 0 and up to "
+                                     "{}.".format(MAX_LEASE_TIME))
+
+        return lease_time
+
+    @staticmethod
+    def _serialize_leased_request(search_request):
+        """
+        Serializes a popped search request, attaching its lease.
+        """
+        serial = search_request.serialize()
+        serial['lease'] = {'id': search_request.get_lease_id(), 'lease_time': search_request.get_lease_time()}
+
+        return serial
+
+    @staticmethod
+    def _get_wait_time(request_args):
+        """
+        Retrieves the optional 'wait' parameter of the long-poll requests: seconds to hold the request until there
+        is something new to answer. It is capped to MAX_WAIT_TIME.
+        :return: seconds to wait, or None if not specified.
+        """
+        wait_time = request_args.get('wait', None)
+
+        if wait_time is None:
+            return None
+
+        try:
+            wait_time = float(wait_time)
+        except ValueError:
+            wait_time = -1
+
+        if not 0 <= wait_time < float("inf"):
+            raise InvalidRequest("Parameter 'wait' must be a number of seconds greater or equal than 0.")
+
+        return min(wait_time, MAX_WAIT_TIME)
+
     @error_handler(InvalidRequest)
     def handle_invalid_request(self, error):
         """
@@ -110,9 +192,16 @@ class Controller(object):
         :param error: dict containing the explanation of the error.
         :return:
         """
-        response = jsonify(error.to_dict())
-        response.status_code = error.status_code
-        return response
+        return self._respond(error.to_dict(), error.status_code)
+
+    @error_handler(ContentTooLarge)
+    def handle_content_too_large(self, error):
+        """
+        Handles a compressed request body that expands beyond the size allowed.
+        :param error: exception raised while the body was read.
+        :return:
+        """
+        return self._respond({'message': str(error)}, 413)
 
     def release_services(self, wait_for_close=True):
         """
@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import logging
-from flask import jsonify
 from main.controllers.controller import route, Controller
 from main.dataset.dataset import DATASET_TYPES
+from main.dataset.dataset_factory import DEFAULT_PERCENT_DELTA
 from main.dataset.generic_dataset import GenericDataset
 from main.exceptions.invalid_request import InvalidRequest
 
@@ -29,6 +29,7 @@ class DatasetFactoryController(Controller):
             self.remove_dataset,
             self.get_running_datasets_list,
             self.get_dataset_progress,
+            self.lease_search_requests,
         ]
 
         self._init_exposed_methods()
@@ -41,21 +42,66 @@ class DatasetFactoryController(Controller):
         """
         datasets_names = self.dataset_factory.get_dataset_builder_names()
 
-        return jsonify({'result': [name for name in datasets_names]})
+        return self._respond({'result': [name for name in datasets_names]})
 
     @route("/dataset/<dataset_name>/progress", methods=['GET'])
     def get_dataset_progress(self, dataset_name):
         """
         Retrieves the progress of the specified dataset.
+
+        Accepts long-polling: if 'wait' (seconds) is specified, the response is held until the progress moves from
+        the one known by the client, given by 'status' and 'percent', at least 'delta' percent (1 by default), or
+        the status changes.
         :return:
         """
+        request = self._get_validated_request()
+        wait_time = self._get_wait_time(request)
+
+        if wait_time is None:
+            status = self.dataset_factory.get_dataset_builder_percent(dataset_name)
+
+        else:
+            try:
+                previous = {'status': request.get('status', None), 'percent': float(request.get('percent', -1))}
+                min_delta = float(request.get('delta', DEFAULT_PERCENT_DELTA))
+            except ValueError:
+                raise InvalidRequest("Parameters 'percent' and 'delta' must be numbers.")
 
-        status = self.dataset_factory.get_dataset_builder_percent(dataset_name)
+            status = self.dataset_factory.wait_for_dataset_builder_percent(dataset_name, previous, wait_time,
+                                                                           min_delta)
 
         #if status['status'] == 'UNKNOWN':
         #    raise InvalidRequest("No dataset found in progress.", status_code=404)
 
-        return jsonify(status)
+        return self._respond(status)
+
+    @route("/crawl/lease", methods=['POST'])
+    def lease_search_requests(self):
+        """
+        Leases the best pending search requests across all the datasets being built, up to 'max_requests' (1 by
+        default) for 'lease_time' seconds (optional). Each request carries its lease and the name of its dataset,
+        where it must be reported. The result is empty if there is no work left.
+        :return:
+        """
+        request = self._get_validated_request()
+
+        try:
+            max_requests = int(request.get('max_requests', 1))
+        except ValueError:
+            raise InvalidRequest("Parameter 'max_requests' must be an integer.")
+
+        if max_requests < 0:
+            raise InvalidRequest("Parameter 'max_requests' can't be negative.")
+
+        leased_requests = self.dataset_factory.lease_search_requests(max_requests, self._get_lease_time(request))
+        result = []
+
+        for name, search_request in leased_requests:
+            serial = self._serialize_leased_request(search_request)
+            serial['dataset'] = name
+            result.append(serial)
+
+        return self._respond({'result': result})
 
     @route("/dataset/<dataset_name>/", methods=['DELETE'])
     def remove_dataset(self, dataset_name):
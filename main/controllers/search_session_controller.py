@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import jsonify
+from flask import Response
 from flask import request
 
 from main.controllers.controller import route, Controller
@@ -34,11 +34,29 @@ class SearchSessionController(Controller):
             self.get_completion_progress,
             self.get_session_data,
             self.set_session_data,
+            self.stream_session_data,
+            self.replace_session_data,
             self.get_history,
+            self.renew_lease,
+            self.release_lease,
+            self.exchange_search_requests,
         ]
 
         self._init_exposed_methods()
 
+    @staticmethod
+    def _deserialize_search_requests(serials):
+        """
+        Deserializes the search requests sent by the client.
+        :return: list of search requests.
+        """
+        try:
+            search_requests = [SearchRequest.deserialize(serial) for serial in serials]
+        except (KeyError, ValueError, TypeError) as ex:
+            raise InvalidRequest("Search request is malformed: {}".format(ex))
+
+        return search_requests
+
     @route("/dataset/<dataset_name>/session/size", methods=['GET'])
     def size(self, dataset_name):
         """
@@ -56,6 +74,7 @@ class SearchSessionController(Controller):
     def pop_request(self, dataset_name):
         """
         Retrieves a request from the specified dataset name.
+        The request is leased for 'lease_time' seconds (optional parameter); the lease is attached to the response.
         :param dataset_name:
         :return: search_request
         """
@@ -65,14 +84,16 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        new_request = session.pop_new_search_request()
+        lease_time = self._get_lease_time(self._get_validated_request())
+
+        new_request = session.pop_new_search_request(lease_time)
 
         if new_request:
-            new_request = new_request.serialize()
+            new_request = self._serialize_leased_request(new_request)
         else:
             raise InvalidRequest("No requests available for the session.", status_code=404)
 
-        return jsonify(new_request)
+        return self._respond(new_request)
 
     @route("/dataset/<dataset_name>/session/search-request", methods=['PUT'])
     def append_search_requests(self, dataset_name):
@@ -86,7 +107,7 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        resquest_json = request.get_json()
+        resquest_json = self._get_request_content()
 
         if 'search_request' in resquest_json:
             resquest_json['search_requests'] = [resquest_json['search_requests']]
@@ -94,7 +115,7 @@ class SearchSessionController(Controller):
         elif 'search_requests' not in resquest_json:
             raise InvalidRequest("No search requests provided to append.")
 
-        search_requests = [SearchRequest.deserialize(search_request) for search_request in resquest_json['search_requests']]
+        search_requests = self._deserialize_search_requests(resquest_json['search_requests'])
 
         session.append_search_requests(search_requests)
 
@@ -112,21 +133,94 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        request_json = request.get_json()
+        request_json = self._get_request_content()
 
         if 'search_request' not in request_json:
             raise InvalidRequest("No search request provided to reset.")
 
-        search_request = SearchRequest.deserialize(request_json['search_request'])
+        search_request = self._deserialize_search_requests([request_json['search_request']])[0]
 
         session.reset_search_request(search_request)
 
         return ""
 
+    @route("/dataset/<dataset_name>/session/exchange", methods=['POST'])
+    def exchange_search_requests(self, dataset_name):
+        """
+        Reports the search requests processed by a crawler and leases new ones in the same call.
+        The content is a JSON with the optional keys 'history' (processed search requests with their results),
+        'reset' (search requests that could not be processed), 'max_requests' (number of requests to lease, 1 by
+        default, capped by the session) and 'lease_time'.
+        :return: the leased search requests as 'result' and the completion progress of the session as 'progress'.
+        """
+        session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
+
+        if session is None:
+            raise InvalidRequest("Dataset does not exist.", status_code=401)
+
+        request_json = self._get_request_content()
+
+        if request_json is None:
+            raise InvalidRequest("No exchange data provided.")
+
+        if not isinstance(request_json, dict):
+            raise InvalidRequest("Exchange data is malformed.")
+
+        try:
+            finished_requests = [SearchRequest.deserialize(serial) for serial in request_json.get('history', [])]
+            failed_requests = [SearchRequest.deserialize(serial) for serial in request_json.get('reset', [])]
+            max_requests = int(request_json.get('max_requests', 1))
+        except (KeyError, ValueError, TypeError, AttributeError):
+            raise InvalidRequest("Exchange data is malformed.")
+
+        if max_requests < 0:
+            raise InvalidRequest("Parameter 'max_requests' can't be negative.")
+
+        leased_requests, progress = session.exchange_search_requests(finished_requests, failed_requests,
+                                                                     max_requests,
+                                                                     self._get_lease_time(request_json))
+
+        return self._respond({'result': [self._serialize_leased_request(search_request) for search_request in
+                                   leased_requests],
+                        'progress': progress})
+
+    @route("/dataset/<dataset_name>/session/lease/<lease_id>", methods=['PATCH'])
+    def renew_lease(self, dataset_name, lease_id):
+        """
+        Renews the lease of a search request in progress for 'lease_time' seconds (optional parameter).
+        :return:
+        """
+        session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
+
+        if session is None:
+            raise InvalidRequest("Dataset does not exist.", status_code=401)
+
+        if not session.renew_lease(lease_id, self._get_lease_time(self._get_validated_request())):
+            raise InvalidRequest("Lease does not exist.", status_code=404)
+
+        return ""
+
+    @route("/dataset/<dataset_name>/session/lease/<lease_id>", methods=['DELETE'])
+    def release_lease(self, dataset_name, lease_id):
+        """
+        Releases the lease of a search request in progress, making it available again.
+        :return:
+        """
+        session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
+
+        if session is None:
+            raise InvalidRequest("Dataset does not exist.", status_code=401)
+
+        session.release_lease(lease_id)
+
+        return ""
+
     @route("/dataset/<dataset_name>/session/completion-progress", methods=['GET'])
     def get_completion_progress(self, dataset_name):
         """
-        Retrieves the completion progress for the session from the dataset_name
+        Retrieves the completion progress for the session from the dataset_name.
+        Accepts long-polling: if 'wait' (seconds) is specified, the response is held until the progress is different
+        than the one known by the client, given by 'progress'.
         :return:
         """
         session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
@@ -134,7 +228,18 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        return str(session.get_completion_progress())
+        request = self._get_validated_request()
+        wait_time = self._get_wait_time(request)
+
+        if wait_time is None:
+            return str(session.get_completion_progress())
+
+        try:
+            progress = int(request.get('progress', -1))
+        except ValueError:
+            raise InvalidRequest("Parameter 'progress' must be an integer.")
+
+        return str(session.wait_for_completion_progress(progress, wait_time))
 
     @route("/dataset/<dataset_name>/session/data", methods=['GET'])
     def get_session_data(self, dataset_name):
@@ -154,7 +259,7 @@ class SearchSessionController(Controller):
         else:
             dump_in_progress_as_pending = request['dump_in_progress_as_pending']
 
-        return jsonify({'result': session.serialize(dump_in_progress_as_pending=dump_in_progress_as_pending)})
+        return self._respond({'result': session.serialize(dump_in_progress_as_pending=dump_in_progress_as_pending)})
 
     @route("/dataset/<dataset_name>/session/data", methods=['PUT'])
     def set_session_data(self, dataset_name):
@@ -172,7 +277,7 @@ class SearchSessionController(Controller):
         if 'load_in_progress_as_pending' not in request_args:
             raise InvalidRequest("Boolean flag load_in_progress_as_pending missing in the request.")
 
-        resquest_json = request.get_json()
+        resquest_json = self._get_request_content()
 
         if 'data' not in resquest_json:
             raise InvalidRequest("Data missing in the request content.")
@@ -188,10 +293,63 @@ class SearchSessionController(Controller):
 
         return ""
 
+    @staticmethod
+    def _get_flag(request_args, name, default):
+        """
+        Retrieves an optional boolean flag from the request.
+        """
+        value = request_args.get(name, None)
+
+        if value is None:
+            return default
+
+        return str(value).lower() in ["true", "1", "yes"]
+
+    @route("/dataset/<dataset_name>/session/stream", methods=['GET'])
+    def stream_session_data(self, dataset_name):
+        """
+        Streams the data of the session from the dataset_name in NDJSON format (chunked), one search request per line.
+        Accepts the optional flag 'dump_in_progress_as_pending' (true by default).
+        :return:
+        """
+        session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
+
+        if session is None:
+            raise InvalidRequest("Dataset does not exist.", status_code=401)
+
+        dump_in_progress_as_pending = self._get_flag(self._get_validated_request(), 'dump_in_progress_as_pending', True)
+
+        return Response(session.stream_serialize(dump_in_progress_as_pending), mimetype="application/x-ndjson")
+
+    @route("/dataset/<dataset_name>/session/stream", methods=['PUT'])
+    def replace_session_data(self, dataset_name):
+        """
+        Replaces atomically the data of the session for the dataset_name with the NDJSON content of the request body,
+        which is read line by line. Accepts the optional flag 'load_in_progress_as_pending' (true by default).
+        :return:
+        """
+        session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
+
+        if session is None:
+            raise InvalidRequest("Dataset does not exist.", status_code=401)
+
+        load_in_progress_as_pending = self._get_flag(self._get_validated_request(), 'load_in_progress_as_pending', True)
+
+        try:
+            session.stream_deserialize(request.stream, load_in_progress_as_pending)
+
+        except ValueError as ex:
+            raise InvalidRequest("Session could not deserialize the data. It seems to be malformed: {}".format(ex))
+
+        return ""
+
     @route("/dataset/<dataset_name>/session/history", methods=['GET'])
     def get_history(self, dataset_name):
         """
-        Retrieves the history of the session from the dataset_name
+        Retrieves the history of the session from the dataset_name.
+        Accepts the optional parameters 'since' (sequence number of the last entry already retrieved) and 'limit'
+        (maximum number of entries) to retrieve only the new entries. The sequence number to continue from is returned
+        as 'next'.
         :return:
         """
         session = self.dataset_factory.get_session_from_dataset_name(dataset_name)
@@ -199,10 +357,25 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        session_history = session.get_search_history()
+        request_args = self._get_validated_request()
+
+        try:
+            since = int(request_args.get('since', 0))
+            limit = request_args.get('limit', None)
+
+            if limit is not None:
+                limit = int(limit)
+
+            if since < 0 or (limit is not None and limit < 0):
+                raise ValueError()
+
+        except ValueError:
+            raise InvalidRequest("Parameters 'since' and 'limit' must be non-negative integers.")
+
+        search_requests, next_sequence = session.get_history_since(since, limit)
 
-        return jsonify({'result':[session_history[search_request_hash].serialize() for search_request_hash in
-                                  session_history]})
+        return self._respond({'result': [search_request.serialize() for search_request in search_requests],
+                        'next': next_sequence})
 
     @route("/dataset/<dataset_name>/session/history", methods=['PUT'])
     def add_to_history(self, dataset_name):
@@ -216,12 +389,12 @@ class SearchSessionController(Controller):
         if session is None:
             raise InvalidRequest("Dataset does not exist.", status_code=401)
 
-        resquest_json = request.get_json()
+        resquest_json = self._get_request_content()
 
         if 'search_request' not in resquest_json:
             raise InvalidRequest("No search request provided for history.")
 
-        search_request = SearchRequest.deserialize(resquest_json['search_request'])
+        search_request = self._deserialize_search_requests([resquest_json['search_request']])[0]
 
         session.add_history_entry(search_request)
 
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import math
 from threading import Lock
+from main.search_session.search_session import MAX_EXCHANGE_REQUESTS
 from main.service.request_pool import RequestPool
 from main.service.service import Service, SERVICE_STOPPED
-from time import sleep
+from time import time
 import logging
 from main.service.global_status import  global_status
 
@@ -12,22 +14,45 @@ from main.service.global_status import  global_status
 __author__ = "Ivan de Paz Centeno"
 
 
-QUEUE_BUFFER = 1
+IDLE_WAIT_TIME = 0.5  # seconds to wait before asking for requests again when there were none
+WAKEUP_INTERVAL = 1  # seconds between checks of the internal thread (ping and leases) when there is nothing to do
+MAX_PREFETCH_PER_PROCESS = 4  # requests buffered at most per worker
+LATENCY_SMOOTHING = 0.2  # weight of the last exchange in the mean latency of the exchanges
 
 
 class CrawlerService(Service, RequestPool):
 
-    def __init__(self, search_session, time_secs_between_requests=0.5, processes=1):
+    def __init__(self, search_session=None, time_secs_between_requests=0.5, processes=1, dataset_factory=None,
+                 idle_wait_time=IDLE_WAIT_TIME, warm_transport_cores=None, max_pages_per_core=None,
+                 max_core_memory=None, light_transport_core=None):
+        """
+        :param search_session: session to take the search requests from.
+        :param time_secs_between_requests:
+        :param processes: number of crawling processes.
+        :param dataset_factory: dataset factory (local or remote) to take the search requests from, instead of a
+        single session. The best pending requests across all its datasets are leased, so the crawler works as long
+        as any dataset has work left.
+        :param idle_wait_time: seconds to wait before asking for requests again when there were none.
+        :param warm_transport_cores: list of transport core protos that each crawling process launches when it
+        starts.
+        :param max_pages_per_core: pages a transport core may load before it is recycled. None for no limit.
+        :param max_core_memory: memory in MB a transport core may use before it is recycled. None for no limit.
+        :param light_transport_core: transport core proto to serve the requests of the search engines that can do
+        without a browser, like HttpCore. None to serve the requests with the transport core they ask for.
+        """
         logging.info("Initializing Crawler Service for {} processes and {} secs between requests.".format(
             processes, time_secs_between_requests
         ))
 
         Service.__init__(self)
-        RequestPool.__init__(self, processes, time_secs_between_requests)
+        RequestPool.__init__(self, processes, time_secs_between_requests, warm_transport_cores, max_pages_per_core,
+                             max_core_memory, light_transport_core)
 
         self.time_secs_between_requests = time_secs_between_requests
         self.processes = processes
         self.search_session = search_session
+        self.dataset_factory = dataset_factory
+        self.idle_wait_time = idle_wait_time
         self.on_process_finished = None
 
         # Anti freeze system. Ping can be set externally, meanwhile pong is set internally.
@@ -35,7 +60,18 @@ class CrawlerService(Service, RequestPool):
         self.pong = 0
         self.ping_lock = Lock()
 
-        assert self.search_session
+        # Requests leased from the session and not reported yet. Their leases are renewed while they are processed.
+        self.leased_requests = {}  # lease id: [search request, session it was leased from]
+        self.leases_lock = Lock()
+
+        # Processed requests waiting to be reported in the next exchange, as [session, request, succeeded], so they
+        # are reported to the session they were leased from even if the session is switched meanwhile.
+        self.outbox = []
+        self.outbox_lock = Lock()
+        self.completion_progress = 0
+        self.exchange_latency = None  # mean seconds an exchange with the backend takes
+
+        assert self.search_session or self.dataset_factory
         logging.info("Crawler Service initialized. Listening and waiting for requests.")
 
     def do_ping(self, value):
@@ -51,6 +87,7 @@ class CrawlerService(Service, RequestPool):
     def update_search_session(self, search_session):
         """
         Updates the search session of the current crawler.
+        The requests leased from the previous session keep being renewed and reported to it.
         :param search_session:
         :return:
         """
@@ -60,33 +97,197 @@ class CrawlerService(Service, RequestPool):
     def register_on_process_finished(self, func):
         self.on_process_finished = func
 
+    def _get_search_session(self):
+        with self.lock:
+            search_session = self.search_session
+
+        return search_session
+
+    def _track_lease(self, search_request, search_session):
+        if search_request.get_lease_id():
+            with self.leases_lock:
+                self.leased_requests[search_request.get_lease_id()] = [search_request, search_session]
+
+    def _untrack_lease(self, search_request):
+        with self.leases_lock:
+            self.leased_requests.pop(search_request.get_lease_id(), None)
+
+    def _get_lease_session(self, search_request):
+        """
+        :return: the session the request was leased from. The current session (if any) if it is not leased.
+        """
+        with self.leases_lock:
+            entry = self.leased_requests.get(search_request.get_lease_id())
+
+        return entry[1] if entry else self._get_search_session()
+
+    def _renew_leases(self):
+        """
+        Renews the leases of the requests being processed that are about to expire.
+        """
+        with self.leases_lock:
+            about_to_expire = [entry for entry in self.leased_requests.values() if
+                               entry[0].get_lease_deadline() - time() < entry[0].get_lease_time() / 2]
+
+        for search_request, search_session in about_to_expire:
+            try:
+                renewed = search_session.renew_lease(search_request.get_lease_id(), search_request.get_lease_time())
+            except Exception as ex:
+                logging.info("Could not renew the lease for request {}: {}".format(search_request, ex))
+                continue
+
+            if renewed:
+                search_request.set_lease(search_request.get_lease_id(), search_request.get_lease_time())
+            else:
+                logging.info("Lease for request {} was lost; it may be processed twice.".format(search_request))
+                self._untrack_lease(search_request)
+
+    def get_completion_progress(self):
+        """
+        :return: the completion progress of the session, as reported in the last exchange.
+        """
+        return self.completion_progress
+
+    def _exchange_requests(self, max_requests):
+        """
+        Reports to each session the requests processed since the previous exchange, and leases up to max_requests
+        new ones from the current session, in a single call per session. If a call fails, the processed requests of
+        that session are kept to be reported in the next exchange.
+        If the crawler works for a dataset factory, the new requests are leased from the factory instead.
+        :param max_requests: number of new requests to lease.
+        :return: list of leased requests.
+        """
+        with self.outbox_lock:
+            outbox, self.outbox = self.outbox, []
+
+        current_session = self._get_search_session()
+        search_sessions = []
+        involved_sessions = [entry[0] for entry in outbox]
+
+        if current_session is not None:
+            involved_sessions.append(current_session)
+
+        for search_session in involved_sessions:
+            if not any(search_session is known_session for known_session in search_sessions):
+                search_sessions.append(search_session)
+
+        leased_requests = []
+
+        for search_session in search_sessions:
+            is_current = search_session is current_session and self.dataset_factory is None
+            finished_requests = [entry[1] for entry in outbox if entry[0] is search_session and entry[2]]
+            failed_requests = [entry[1] for entry in outbox if entry[0] is search_session and not entry[2]]
+
+            if not finished_requests and not failed_requests and not (is_current and max_requests > 0):
+                continue
+
+            try:
+                session_leased_requests, progress = search_session.exchange_search_requests(
+                    finished_requests, failed_requests, max_requests if is_current else 0)
+
+            except Exception as ex:
+                logging.info("Could not exchange requests with the session: {}".format(ex))
+
+                with self.outbox_lock:
+                    self.outbox = [entry for entry in outbox if entry[0] is search_session] + self.outbox
+
+                continue
+
+            # Once reported, the requests are not leased by this crawler anymore.
+            [self._untrack_lease(search_request) for search_request in finished_requests + failed_requests]
+
+            if is_current:
+                leased_requests = session_leased_requests
+                [self._track_lease(search_request, search_session) for search_request in leased_requests]
+
+            if is_current or self.dataset_factory is not None:
+                self.completion_progress = progress
+
+                if finished_requests or failed_requests:
+                    global_status.update_proc_progress("Retrieving data from search engines...", progress)
+
+                    if progress == 100:
+                        logging.info("Crawler finished.")
+
+        if self.dataset_factory is not None and max_requests > 0:
+            leased_requests = self._lease_from_factory(max_requests)
+
+        return leased_requests
+
+    def _lease_from_factory(self, max_requests):
+        """
+        Leases up to max_requests new requests from the dataset factory, across all its datasets.
+        :return: list of leased requests.
+        """
+        try:
+            factory_leased_requests = self.dataset_factory.lease_search_requests(max_requests)
+        except Exception as ex:
+            logging.info("Could not lease requests from the dataset factory: {}".format(ex))
+            return []
+
+        leased_requests = []
+
+        for name, search_request in factory_leased_requests:
+            search_session = self.dataset_factory.get_session_from_dataset_name(name)
+
+            # The dataset may have been removed meanwhile. The lease will expire by itself.
+            if search_session is None:
+                logging.info("Dataset {} of request {} is gone. Skipped.".format(name, search_request))
+                continue
+
+            self._track_lease(search_request, search_session)
+            leased_requests.append(search_request)
+
+        return leased_requests
+
+    def _release_leases(self):
+        """
+        Releases the leases of the requests not reported yet, so that other crawlers can take them at once.
+        """
+        with self.leases_lock:
+            leased_requests = list(self.leased_requests.values())
+            self.leased_requests = {}
+
+        for search_request, search_session in leased_requests:
+            try:
+                search_session.release_lease(search_request.get_lease_id())
+            except Exception as ex:
+                logging.info("Could not release the lease for request {}: {}".format(search_request, ex))
+
+        if leased_requests:
+            logging.info("Released {} leases.".format(len(leased_requests)))
+
     def process_finished(self, wrapped_result):
         search_request = wrapped_result[0]
         crawl_result = wrapped_result[1]
 
-        if crawl_result is None:
+        # The results are reported to the session by the internal thread, in the next exchange.
+        search_session = self._get_lease_session(search_request)
+
+        if search_session is None:
+            logging.info("Session of request {} is unknown since its lease was lost. Result dropped.".format(
+                search_request))
+
+        elif crawl_result is None:
 
             # we need to mark as invalid the result in order to be reprocessed.
-            self.search_session.reset_search_request(search_request)
+            with self.outbox_lock:
+                self.outbox.append([search_session, search_request, False])
+
             logging.info("[{}%] Request {} could not be retrieved. Reseted.".format(
-                self.search_session.get_completion_progress(), search_request))
+                self.completion_progress, search_request))
 
         else:
 
             search_request.associate_result(crawl_result)
-            # Log to session
-            self.search_session.add_history_entry(search_request)
+
+            with self.outbox_lock:
+                self.outbox.append([search_session, search_request, True])
 
             logging.info("[{}%] Results for request {} retrieved: {}.".format(
-                self.search_session.get_completion_progress(), search_request, len(crawl_result)
+                self.completion_progress, search_request, len(crawl_result)
             ))
 
-        global_status.update_proc_progress("Retrieving data from search engines...",
-                                    self.search_session.get_completion_progress())
-
-        if self.search_session.get_completion_progress() == 100:
-            logging.info("Crawler finished.")
-
         if self.on_process_finished:
             self.on_process_finished(search_request, crawl_result)
 
@@ -107,36 +308,76 @@ class CrawlerService(Service, RequestPool):
         logging.info("Crawler stopped from digesting requests.")
         Service.stop(self, wait_for_finish)
 
+        # The buffered requests are not going to be processed: their leases are released below.
+        self.clear_queue()
+        self._exchange_requests(0)
+        self._release_leases()
+
+    def get_prefetch_size(self):
+        """
+        Number of requests to keep buffered, so the workers never wait for the backend. The buffer is refilled when
+        it drops to half of this size, so that half must last the round trip of an exchange: it is estimated from
+        the mean duration of the requests and the latency of the exchanges. It is kept between one and
+        MAX_PREFETCH_PER_PROCESS requests per worker.
+        :return: number of requests.
+        """
+        max_size = min(self.processes * MAX_PREFETCH_PER_PROCESS, MAX_EXCHANGE_REQUESTS)
+        request_duration = self.get_mean_request_duration()
+
+        if not request_duration or self.exchange_latency is None:
+            return min(self.processes, max_size)
+
+        size = int(math.ceil(2 * self.processes * self.exchange_latency / request_duration))
+
+        return max(min(self.processes, max_size), min(size, max_size))
+
+    def _account_exchange(self, elapsed):
+        if self.exchange_latency is None:
+            self.exchange_latency = elapsed
+        else:
+            self.exchange_latency += LATENCY_SMOOTHING * (elapsed - self.exchange_latency)
+
+    def _has_pending_reports(self):
+        with self.outbox_lock:
+            result = len(self.outbox) > 0
+
+        return result
+
     def __internal_thread__(self):
         Service.__internal_thread__(self)
-        do_sleep = 0
 
         while not self.__get_stop_flag__():
+            prefetch_size = self.get_prefetch_size()
+            queue_size = self.get_queue_size()
 
-            with self.lock:
-                if self.processing_queue.qsize() < QUEUE_BUFFER:
+            # Refilled in batches, once half of the buffer was consumed.
+            requests_needed = prefetch_size - queue_size if queue_size <= prefetch_size // 2 else 0
+            idle = False
 
-                    try:
-                        search_request = self.search_session.pop_new_search_request()
-                    except:
-                        search_request = None
+            if requests_needed > 0 or self._has_pending_reports():
+                start_time = time()
+                leased_requests = self._exchange_requests(requests_needed)
 
-                    if search_request:
-                        self.queue_request(search_request)
+                if requests_needed > 0:
+                    self._account_exchange(time() - start_time)
 
-                    else:
-                        do_sleep = 0.5
+                for search_request in leased_requests:
+                    self.queue_request(search_request)
 
-                else:
-                    do_sleep = 0.3
+                idle = requests_needed > 0 and not leased_requests
 
             with self.ping_lock:
                 self.pong = self.ping
 
-            if do_sleep:
-                sleep(do_sleep)
-                do_sleep = 0
+            self._renew_leases()
 
-            self.process_queue()
+            # Sleeps until there are results to report or room in the buffer. If there was no work left, the buffer
+            # is not refilled until the idle wait expires.
+            if idle:
+                self.wait_for_queue(lambda: self.__get_stop_flag__() or self._has_pending_reports(),
+                                    self.idle_wait_time)
+            else:
+                self.wait_for_queue(lambda: self.__get_stop_flag__() or self._has_pending_reports() or
+                                    len(self.processing_queue) <= self.get_prefetch_size() // 2, WAKEUP_INTERVAL)
 
         self.__set_status__(SERVICE_STOPPED)
@@ -1,121 +1,109 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import logging
-import random
+import os
 from time import sleep, time
 from main.crawler_service import CrawlerService
 from main.dataset.remote_dataset_factory import RemoteDatasetFactory
 from main.service.global_status import global_status
 from main.service.service import Service
+from main.transport_core.httpcore import HttpCore
+from main.transport_core.webcore import WebCore, HEADLESS_VARIABLE, LEAN_VARIABLE, start_shared_display, \
+    stop_shared_display
 
 __author__ = 'Iván de Paz Centeno'
 
+CRAWLER_CHECK_TIME = 10  # seconds between checks of the crawler
+MAX_PAGES_PER_BROWSER = 500  # pages a browser loads before it is recycled, to bound its memory growth
+MAX_BROWSER_MEMORY = 1536  # MB a browser may use before it is recycled
+
 
 class CrawlingProcess(Service):
 
-    def __init__(self, remote_url, crawler_processes=1, wait_time_between_tries=1):
+    def __init__(self, remote_url, crawler_processes=1, wait_time_between_tries=1, headless=True, lean=True,
+                 light=False):
         """
         Initializes the crawling process for the specified URL.
         :param remote_url: URL of a dataset factory.
         :param crawler_processes:
         :param wait_time_between_tries:
+        :param headless: True to run the browsers in headless mode. False to run them in a virtual display shared by
+        all the crawler processes.
+        :param lean: True to browse with the lean profile (no images, fonts nor trackers, eager page loads). False
+        to load the pages fully.
+        :param light: True to fetch the pages of the search engines that don't need a browser with plain HTTP
+        requests (HttpCore). False to use the transport core of the requests.
         :return:
         """
         Service.__init__(self)
         self.remote_url = remote_url
         self.crawler_processes = crawler_processes
         self.wait_time_between_tries = wait_time_between_tries
+        self.headless = headless
+        self.lean = lean
+        self.light = light
 
         self.crawler_service = None
         self.remote_dataset_factory = RemoteDatasetFactory(remote_url)
 
-    def _find_session(self):
+    def _start_crawler(self):
         """
-        Retrieves a valid session from the list.
-        :return:
+        Starts the crawler over the remote dataset factory. The factory hands out the best pending requests across
+        all its datasets, so the crawler keeps working as long as any of them has work left, without looking for a
+        session to crawl.
         """
-        global_status.update_proc("Accessing remote dataset factory at {}".format(self.remote_url))
-
-        try:
-            datasets_names = self.remote_dataset_factory.get_dataset_builder_names()
-        except Exception as ex:
-            raise Exception("Remote dataset factory is not active at {}".format(self.remote_url))
-
-        # We pick a random session from the list
-        selected_session = None
-
-        while len(datasets_names) > 0 and selected_session is None and not self.__get_stop_flag__():
-            name = random.choice(list(datasets_names))
-            random_session = self.remote_dataset_factory.get_session_from_dataset_name(name)
-            datasets_names.remove(name)
+        global_status.update_proc("Crawling the datasets of {}".format(self.remote_url))
 
-            if random_session.get_completion_progress() < 100:
-                selected_session = random_session
+        # The crawler processes inherit the environment, so they all use the same display and profile.
+        if not self.headless:
+            os.environ[HEADLESS_VARIABLE] = "0"
+            start_shared_display()
 
-            if len(datasets_names) == 0 and not selected_session:
-                raise Exception("No datasets' sessions available")
+        os.environ[LEAN_VARIABLE] = "1" if self.lean else "0"
 
-            logging.info("Selected session ({}) from dataset \"{}\" to crawl".format(selected_session.backend_url, name))
-            global_status.update_proc("Selected session \"{}\"".format(selected_session.backend_url))
+        self.crawler_service = CrawlerService(processes=self.crawler_processes,
+                                              dataset_factory=self.remote_dataset_factory,
+                                              idle_wait_time=self.wait_time_between_tries,
+                                              warm_transport_cores=[WebCore],
+                                              max_pages_per_core=MAX_PAGES_PER_BROWSER,
+                                              max_core_memory=MAX_BROWSER_MEMORY,
+                                              light_transport_core=HttpCore if self.light else None)
+        self.crawler_service.start()
 
-        return selected_session
-
-    def _feed_crawler(self, selected_session):
+    def _check_crawler(self):
         """
-        Feeds the crawler with the specified session.
-        :param session:
-        :return:
+        Checks that the crawler is still responsive.
         """
+        seconds_frozen = 0
+        ping_done = time()
+        self.crawler_service.do_ping(ping_done)
 
-        if self.crawler_service is None:
-
-            self.crawler_service = CrawlerService(selected_session, processes=self.crawler_processes)
-            self.crawler_service.start()
-
-        else:
-            self.crawler_service.update_search_session(search_session=selected_session)
-
-        global_status.update_proc("Waiting for session \"{}\"".format(selected_session.backend_url))
-        global_status.update_proc_progress("Retrieving data from search engines...",
-                                    selected_session.get_completion_progress())
-
-        while selected_session.get_completion_progress() != 100 and not self.__get_stop_flag__():
-            seconds_frozen = 0
-            ping_done = time()
-            self.crawler_service.do_ping(ping_done)
-
-            while self.crawler_service.get_pong() != ping_done and not self.__get_stop_flag__():
-                sleep(1)
-                seconds_frozen += 1
-
-                if seconds_frozen > 60:
-                    print("Crawler seems completely frozen!!!")
-
+        while self.crawler_service.get_pong() != ping_done and not self.__get_stop_flag__():
             sleep(1)
+            seconds_frozen += 1
 
-        #selected_session.wait_for_finish()
-
-        logging.info("Finished crawling session ({}) from "
-                     "dataset \"{}\" to crawl".format(selected_session.backend_url, name))
+            if seconds_frozen > 60:
+                print("Crawler seems completely frozen!!!")
 
     def stop(self, wait_for_finish=True):
         Service.stop(self, wait_for_finish=wait_for_finish)
 
         if self.crawler_service:
             self.crawler_service.stop(wait_for_finish=wait_for_finish)
+            self.crawler_service.terminate()
+
+        stop_shared_display()
 
     def __internal_thread__(self):
         """
         Background thread to be executed.
         :return:
         """
+        self._start_crawler()
+
         while not self.__get_stop_flag__():
-            try:
-                session = self._find_session()
-                self._feed_crawler(session)
-
-            except Exception as ex:
-                global_status.update_proc("Nothing to crawl: {}".format(ex))
-                logging.info("Nothing to crawl: {}".format(ex))
-                logging.info("Waiting {} seconds before querying again".format(self.wait_time_between_tries))
-                sleep(self.wait_time_between_tries)
+            self._check_crawler()
+            seconds_waited = 0
+
+            while seconds_waited < CRAWLER_CHECK_TIME and not self.__get_stop_flag__():
+                sleep(1)
+                seconds_waited += 1
@@ -49,10 +49,12 @@ class DataFetcher(FetchPool, Service):
         """
         Fetchs the data url associated with the request.
 
-        :param request_list: a list of JSON-formatted results retrieved from the search_session-crawled requests.
+        :param request_list: a list of JSON-formatted results retrieved from the search_session-crawled requests, or
+        a ResultSet.
         :return:
         """
         request_list = self._discard_invalid_requests(request_list)
+
         [self.database.append(request['url'], request) for request in request_list]
 
     @staticmethod
@@ -60,7 +62,7 @@ class DataFetcher(FetchPool, Service):
         new_request_list = []
 
         for request in request_list:
-            if 'url' in request and 'width' in request and 'height' in request and 'desc' in request and 'source' in request and 'searchwords' in request:
+            if 'url' in request and 'width' in request and 'height' in request and 'desc' in request and 'source' in request and 'searchwords' in request and request['url']:
                 new_request_list.append(request)
 
         discarded_requests = len(request_list) - len(new_request_list)
@@ -3,6 +3,7 @@
 import os
 from multiprocessing import Lock
 from shutil import make_archive, move, rmtree
+from threading import Condition
 
 import time
 
@@ -42,6 +43,7 @@ class DatasetBuilder(Service):
         self.percent_crawled = 0
         self.percent_fetched = 0
         self.lock = Lock()
+        self.progress_condition = Condition()
         self.autoclose_search_session_on_exit = autoclose_search_session_on_exit
         self.on_finished = on_finished
         self.name = name
@@ -56,6 +58,26 @@ class DatasetBuilder(Service):
     def get_search_session(self):
         return self.search_session
 
+    def __set_status__(self, status_value):
+        Service.__set_status__(self, status_value)
+        self._notify_progress()
+
+    def _notify_progress(self):
+        with self.progress_condition:
+            self.progress_condition.notify_all()
+
+    def wait_for_progress(self, predicate, timeout):
+        """
+        Waits for the status or the percentages of the build to change until the predicate is satisfied.
+        :param predicate: callable that returns True when the wait is over. It is evaluated on every change.
+        :param timeout: maximum seconds to wait.
+        :return: the last result of the predicate.
+        """
+        with self.progress_condition:
+            result = self.progress_condition.wait_for(predicate, timeout)
+
+        return result
+
     def __internal_thread__(self):
         Service.__internal_thread__(self)
 
@@ -89,9 +111,13 @@ class DatasetBuilder(Service):
                 percent_fetched = self.dataset.get_percent_fetched()
 
             with self.lock:
+                progressed = [self.percent_crawled, self.percent_fetched] != [percent_crawled, percent_fetched]
                 self.percent_crawled = percent_crawled
                 self.percent_fetched = percent_fetched
 
+            if progressed:
+                self._notify_progress()
+
             time.sleep(0.05)
 
         if not self.__get_stop_flag__():
@@ -1,16 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import glob
+import heapq
+import json
 import logging
+import os
+from threading import Lock
 
+from main.dataset.dataset import DATASET_TYPES
 from main.dataset.dataset_builder import DatasetBuilder
 from main.dataset.generic_dataset import GenericDataset
-from main.search_session.search_session import SearchSession
+from main.search_session.search_session import SearchSession, MAX_EXCHANGE_REQUESTS
+from main.search_session.session_journal import SessionJournal
+from main.search_session.session_store.sqlite_session_store import SQLiteSessionStore
 from main.service.service import Service, SERVICE_STOPPED
 from main.service.status import get_status_name, SERVICE_CRAWLING_DATA, SERVICE_FETCHING_DATA, \
     SERVICE_RUNNING
 
 __author__ = "Ivan de Paz Centeno"
 
+DATASET_DESCRIPTOR_EXTENSION = ".dataset"
+SQLITE_STORE_EXTENSION = ".sqlite"
+DEFAULT_PERCENT_DELTA = 1  # minimum change of the percent of a build to be notified to the waiters
+
+SESSION_STORE_MEMORY = "memory"
+SESSION_STORE_SQLITE = "sqlite"
+SESSION_STORES = [SESSION_STORE_MEMORY, SESSION_STORE_SQLITE]
+
 
 class DatasetFactory(Service):
     """
@@ -18,36 +34,102 @@ class DatasetFactory(Service):
     builds.
 
     It is Factory and a service, publishing some RPC through a TCP port.
+
+    If a sessions dir is specified, the search sessions of the datasets are persisted inside it, and the datasets
+    that were being built are recovered when the factory is started again. With the memory session store (default),
+    the sessions are kept in memory and journaled; with the sqlite store, they are kept in an SQLite database per
+    dataset, so the memory used doesn't depend on the size of the sessions.
+
+    The registry of dataset builders is copy-on-write: it is never modified in place, but replaced by an updated
+    copy. Lookups, which are done on every request of the crawlers, just read the current registry without any lock;
+    only the writers (creation and removal of datasets) are serialized. Dataset builders are built and stopped out of
+    the lock, so a dataset being created doesn't stall the crawlers of the others.
     """
 
-    def __init__(self, autostart=True, publish_dir="/tmp/"):
+    def __init__(self, autostart=True, publish_dir="/tmp/", sessions_dir=None, session_store=SESSION_STORE_MEMORY):
         Service.__init__(self)
 
         self.publish_dir = publish_dir
+        self.sessions_dir = sessions_dir
+        self.session_store = session_store
 
-        with self.lock:
-            self.datasets_builders_working = {}
+        if self.session_store != SESSION_STORE_MEMORY and not self.sessions_dir:
+            raise Exception("The {} session store requires a sessions dir.".format(self.session_store))
+
+        self.datasets_builders_working = {}  # name: DatasetBuilder. Replaced on every change, never modified.
+        self.reserved_names = set()  # names of the datasets being created
+        self.registry_lock = Lock()  # serializes the changes of the registry
+
+        if self.sessions_dir:
+            self._recover_datasets()
 
         if autostart:
             self.start()
 
-    def get_dataset_builders_sessions(self):
-        with self.lock:
-            result = [self.datasets_builders_working[dataset_builder_name].get_search_session() for dataset_builder_name
-                      in self.datasets_builders_working]
+    def _get_dataset_descriptor_filename(self, name):
+        return "{}{}".format(os.path.join(self.sessions_dir, name), DATASET_DESCRIPTOR_EXTENSION)
 
-        return result
+    def _recover_datasets(self):
+        """
+        Recreates the dataset builders whose sessions are journaled in the sessions dir.
+        """
+        if not os.path.exists(self.sessions_dir):
+            os.makedirs(self.sessions_dir)
 
-    def get_session_from_dataset_name(self, name):
+        for filename in glob.glob(os.path.join(glob.escape(self.sessions_dir), "*" + DATASET_DESCRIPTOR_EXTENSION)):
+            try:
+                with open(filename, 'r') as infile:
+                    descriptor = json.load(infile)
+
+                self.create_dataset(descriptor['name'], dataset_type=DATASET_TYPES[descriptor['dataset_type']])
+                logging.info("Recovered dataset {}".format(descriptor['name']))
+
+            except Exception as ex:
+                logging.info("Could not recover the dataset from {}. Reason: {}".format(filename, ex))
+
+    def _create_search_session(self, name, dataset_type):
+        """
+        Creates the search session for a new dataset. If the factory has a sessions dir, the session is persisted
+        there and recovered from it if it already exists.
+        """
+        if not self.sessions_dir:
+            return SearchSession()
 
-        with self.lock:
+        inv_dataset_types = {v: k for k, v in DATASET_TYPES.items()}
 
-            if name in self.datasets_builders_working:
-                search_session = self.datasets_builders_working[name].get_search_session()
-            else:
-                search_session = None
+        with open(self._get_dataset_descriptor_filename(name), 'w') as outfile:
+            json.dump({'name': name, 'dataset_type': inv_dataset_types[dataset_type]}, outfile)
 
-        return search_session
+        if self.session_store == SESSION_STORE_SQLITE:
+            return SearchSession(store=SQLiteSessionStore(
+                "{}{}".format(os.path.join(self.sessions_dir, name), SQLITE_STORE_EXTENSION)))
+
+        return SearchSession(journal=SessionJournal(os.path.join(self.sessions_dir, name)))
+
+    def _remove_search_session_files(self, name, search_session):
+        """
+        Removes the persisted session of a dataset, since it doesn't need to be recovered anymore.
+        """
+        if not self.sessions_dir:
+            return
+
+        if search_session.journal:
+            search_session.journal.remove()
+
+        with search_session.lock:
+            search_session.store.remove()
+
+        if os.path.exists(self._get_dataset_descriptor_filename(name)):
+            os.remove(self._get_dataset_descriptor_filename(name))
+
+    def get_dataset_builders_sessions(self):
+        return [dataset_builder.get_search_session() for dataset_builder in self.datasets_builders_working.values()]
+
+    def get_session_from_dataset_name(self, name):
+
+        dataset_builder = self.datasets_builders_working.get(name, None)
+
+        return dataset_builder.get_search_session() if dataset_builder is not None else None
 
     def get_dataset_builder_percent(self, name):
         """
@@ -63,39 +145,111 @@ class DatasetFactory(Service):
         :return: percent of completion of the dataset
         """
 
-        with self.lock:
-            if name in self.datasets_builders_working:
-                percent_crawled, percent_fetched = self.datasets_builders_working[name].get_percent_done()
-                percent_done_set = [percent_crawled, percent_fetched]
-                status = self.datasets_builders_working[name].get_status()
+        dataset_builder = self.datasets_builders_working.get(name, None)
+
+        if dataset_builder is None:
+            return {'status': 'UNKNOWN'}
+
+        return self._get_builder_percent(dataset_builder)
+
+    @staticmethod
+    def _get_builder_percent(dataset_builder):
+        percent_crawled, percent_fetched = dataset_builder.get_percent_done()
+        percent_done_set = [percent_crawled, percent_fetched]
+        status = dataset_builder.get_status()
+
+        percent_status_map = {
+            SERVICE_RUNNING: 0,
+            SERVICE_CRAWLING_DATA: percent_done_set[0],
+            SERVICE_FETCHING_DATA: percent_done_set[1],
+            #SERVICE_FILTERING_DATA: percent_done[2]
+        }
+
+        if status in percent_status_map:
+            percent_done = percent_status_map[status]
+        else:
+            percent_done = -1
+
+        return {'percent': percent_done, 'status': get_status_name(status)}
+
+    def wait_for_dataset_builder_percent(self, name, previous, timeout, min_delta=DEFAULT_PERCENT_DELTA):
+        """
+        Waits for the build of the specified dataset to progress from a known state, so that the progress can be
+        followed without polling it. Returns as soon as the status changes, the percent moves at least min_delta
+        (or reaches 100), or the timeout expires.
+        :param name: dataset name whose percent is desired.
+        :param previous: dict returned by the previous call to get_dataset_builder_percent(), known by the caller.
+        :param timeout: maximum seconds to wait.
+        :param min_delta: minimum change of the percent to be notified, to throttle the progress updates.
+        :return: percent of completion of the dataset, as in get_dataset_builder_percent().
+        """
+        dataset_builder = self.datasets_builders_working.get(name, None)
+
+        if dataset_builder is None:
+            return {'status': 'UNKNOWN'}
+
+        dataset_builder.wait_for_progress(
+            lambda: self._has_progressed(self._get_builder_percent(dataset_builder), previous, min_delta), timeout)
+
+        return self._get_builder_percent(dataset_builder)
+
+    @staticmethod
+    def _has_progressed(percent_data, previous, min_delta):
+        percent = percent_data['percent']
+        previous_percent = previous.get('percent', -1)
+
+        return percent_data['status'] != previous.get('status') or abs(percent - previous_percent) >= min_delta or \
+            (percent == 100 and previous_percent != 100)
+
+    def lease_search_requests(self, max_requests=1, lease_time=None):
+        """
+        Leases the best pending search requests across all the datasets being built, so that the crawlers don't need
+        to look for a session with work left. Requests are taken by priority; between sessions with the same
+        priority, the least completed one goes first, and the ones equally completed take turns, so no dataset is
+        left behind.
+        :param max_requests: maximum number of search requests to lease. Capped to MAX_EXCHANGE_REQUESTS.
+        :param lease_time: seconds for the leases to expire. If None, the default of each session is used.
+        :return: list of [dataset name, search request], with the leases attached. Empty if there is no work left.
+        :raises ValueError: if the lease time is not valid or max_requests is negative.
+        """
+        if max_requests < 0:
+            raise ValueError("The number of requests to lease can't be negative.")
+
+        max_requests = min(max_requests, MAX_EXCHANGE_REQUESTS)
+
+        candidates = []
+
+        for name, dataset_builder in self.datasets_builders_working.items():
+            search_session = dataset_builder.get_search_session()
+            priority = search_session.get_next_priority()
+
+            if priority is not None:
+                candidates.append((-priority, search_session.get_completion_progress(), 0, name, search_session))
+
+        heapq.heapify(candidates)
+        leased_requests = []
 
-                percent_status_map = {
-                    SERVICE_RUNNING: 0,
-                    SERVICE_CRAWLING_DATA: percent_done_set[0],
-                    SERVICE_FETCHING_DATA: percent_done_set[1],
-                    #SERVICE_FILTERING_DATA: percent_done[2]
-                }
+        while candidates and len(leased_requests) < max_requests:
+            _, progress, leased_count, name, search_session = heapq.heappop(candidates)
+            search_request = search_session.pop_new_search_request(lease_time)
 
-                if status in percent_status_map:
-                    percent_done = percent_status_map[status]
-                else:
-                    percent_done = -1
+            if search_request is None:
+                continue
 
-                result = {'percent': percent_done, 'status': get_status_name(status)}
-            else:
-                result = {'status': 'UNKNOWN'}
+            leased_requests.append([name, search_request])
+            priority = search_session.get_next_priority()
 
-        return result
+            if priority is not None:
+                heapq.heappush(candidates, (-priority, progress, leased_count + 1, name, search_session))
+
+        return leased_requests
 
     def get_dataset_builder_names(self):
         """
         Returns a list of names of the dataset builders in progress.
         :return:
         """
-        with self.lock:
-            result = [key for key in self.datasets_builders_working]
-
-        return result
+        return list(self.datasets_builders_working)
 
     def remove_dataset_builder_by_name(self, name):
         """
@@ -103,10 +257,14 @@ class DatasetFactory(Service):
         :param name: name of the dataset to remove from the list
         :return:
         """
-        with self.lock:
-            if name in self.datasets_builders_working:
-                self.datasets_builders_working[name].stop(False)
-                del self.datasets_builders_working[name]
+        with self.registry_lock:
+            dataset_builders = dict(self.datasets_builders_working)
+            dataset_builder = dataset_builders.pop(name, None)
+            self.datasets_builders_working = dataset_builders
+
+        if dataset_builder:
+            dataset_builder.stop(False)
+            self._remove_search_session_files(name, dataset_builder.get_search_session())
 
     def create_dataset(self, name, dataset_type=GenericDataset):
         """
@@ -118,20 +276,31 @@ class DatasetFactory(Service):
         want to keep compatibility with the remote_dataset_factory implementation.
         """
 
-        with self.lock:
-            name_taken = name in self.datasets_builders_working
+        # The name is reserved, so the same dataset is not created twice while it is built out of the lock.
+        with self.registry_lock:
+            if name in self.datasets_builders_working or name in self.reserved_names:
+                return None
 
-        if not name_taken:
-            with self.lock:
-                search_session = SearchSession()
-                dataset_builder = DatasetBuilder(search_session, name, autostart=True, dataset_type=dataset_type,
-                                                 autoclose_search_session_on_exit=True, publish_dir=self.publish_dir,
-                                                 on_finished=self._on_builder_finished)
-                logging.info("Started dataset builder for {}".format(name))
-                self.datasets_builders_working[name] = dataset_builder
+            self.reserved_names.add(name)
 
-        else:
-            dataset_builder = None
+        try:
+            search_session = self._create_search_session(name, dataset_type)
+            dataset_builder = DatasetBuilder(search_session, name, autostart=False, dataset_type=dataset_type,
+                                             autoclose_search_session_on_exit=True, publish_dir=self.publish_dir,
+                                             on_finished=self._on_builder_finished)
+
+            with self.registry_lock:
+                dataset_builders = dict(self.datasets_builders_working)
+                dataset_builders[name] = dataset_builder
+                self.datasets_builders_working = dataset_builders
+
+        finally:
+            with self.registry_lock:
+                self.reserved_names.discard(name)
+
+        # Started once registered, so it can always be found when it notifies that it finished.
+        dataset_builder.start()
+        logging.info("Started dataset builder for {}".format(name))
 
         return dataset_builder
 
@@ -24,6 +24,7 @@ class GenericDataset(Dataset):
         Dataset.__init__(self, root_folder, metadata_file, "Generic dataset", name)
 
         self.search_session = search_session
+        self.history_sequence = 0  # last entry of the session history already fed to the fetcher
         self.data_fetcher = DataFetcher(self.root_folder)
         self.data_fetcher.start()
 
@@ -31,6 +32,7 @@ class GenericDataset(Dataset):
         """
         Fetchs the crawled data from the search_session.
         The fetched content are stored internally, and can be used to build a metadata for the current dataset.
+        Only the history entries added since the previous invocation are fetched.
 
         :param wait_for_finish: waits until all the crawled data from search session is fetched.
                 Warning: if the search_session crawlers haven't finished yet it might be possible for this fetcher
@@ -42,11 +44,12 @@ class GenericDataset(Dataset):
         logging.info("Fetching data...")
         data_fetcher = self.data_fetcher
 
-        history = self.search_session.get_history()
+        search_requests, self.history_sequence = self.search_session.get_history_since(self.history_sequence)
 
-        result_sets = [history[search_request_key].get_result() for search_request_key in history]
+        result_sets = [search_request.get_result() for search_request in search_requests]
 
-        logging.info("Retrieved {} result sets".format(len(result_sets)))
+        logging.info("Retrieved {} result sets ({} results)".format(len(result_sets),
+                                                                   sum(len(result_set) for result_set in result_sets)))
 
         [data_fetcher.fetch_requests(result_set) for result_set in result_sets]
 
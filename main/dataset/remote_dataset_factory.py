@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import requests
 
 from main.dataset.dataset import DATASET_TYPES
+from main.dataset.dataset_factory import DEFAULT_PERCENT_DELTA
 from main.dataset.generic_dataset import GenericDataset
 from main.search_session.remote_search_session import RemoteSearchSession
+from main.search_session.search_request import SearchRequest
+from main.service.http_client import get_http_client
 
 __author__ = "Ivan de Paz Centeno"
 
@@ -14,16 +16,23 @@ class RemoteDatasetFactory():
     Proxies a remote dataset in order to create/manipulate datasets.
     """
 
-    def __init__(self, backend_url):
+    def __init__(self, backend_url, http_client=None):
         """
         Initializer for the proxy.
         :param backend_url:
+        :param http_client: HttpClient for the calls to the backend, shared with the proxies of the sessions. If None,
+        the client of the current process is used.
         """
 
         if backend_url[-1] == "/":
             backend_url = backend_url[:-1]
 
         self.backend_url = backend_url
+        self.http_client = http_client
+        self.remote_sessions = {}  # dataset name: RemoteSearchSession
+
+    def _get_http_client(self):
+        return self.http_client if self.http_client is not None else get_http_client()
 
     def get_dataset_builder_percent(self, name):
         """
@@ -33,12 +42,35 @@ class RemoteDatasetFactory():
         """
         url = "{}/dataset/{}/progress".format(self.backend_url, name)
 
-        response = requests.get(url)
+        response = self._get_http_client().get(url)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
-        return response.json()
+        return self._get_http_client().get_content(response)
+
+    def wait_for_dataset_builder_percent(self, name, previous, timeout, min_delta=DEFAULT_PERCENT_DELTA):
+        """
+        Waits for the build of the specified dataset to progress from a known state. The backend holds the request
+        until the status changes, the percent moves at least min_delta or the timeout expires (long-polling).
+        :param name: name of the dataset to request the build percent.
+        :param previous: dict returned by the previous call, known by the caller.
+        :param timeout: maximum seconds to wait.
+        :param min_delta: minimum change of the percent to be notified.
+        :return: a dictionary holding the status and the percentage of the status.
+        """
+        url = "{}/dataset/{}/progress".format(self.backend_url, name)
+        http_client = self._get_http_client()
+
+        params = {'status': previous.get('status'), 'percent': previous.get('percent', -1), 'delta': min_delta,
+                  'wait': timeout}
+
+        response = http_client.get(url, params=params, timeout=http_client.get_timeout(timeout))
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response!".format(url))
+
+        return self._get_http_client().get_content(response)
 
     def get_dataset_builder_names(self):
         """
@@ -47,12 +79,12 @@ class RemoteDatasetFactory():
         """
         url = "{}/dataset/".format(self.backend_url)
 
-        response = requests.get(url)
+        response = self._get_http_client().get(url)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
-        response = response.json()
+        response = self._get_http_client().get_content(response)
 
         if 'result' in response:
             result = response['result']
@@ -67,8 +99,40 @@ class RemoteDatasetFactory():
         :param name: name of the dataset to get the session from.
         :return:
         """
-        url = "{}/dataset/{}/session".format(self.backend_url, name)
-        return RemoteSearchSession(url)
+        # The same proxy is returned for a dataset, so the requests leased from it can be grouped by session.
+        if name not in self.remote_sessions:
+            url = "{}/dataset/{}/session".format(self.backend_url, name)
+            self.remote_sessions[name] = RemoteSearchSession(url, self.http_client)
+
+        return self.remote_sessions[name]
+
+    def lease_search_requests(self, max_requests=1, lease_time=None):
+        """
+        Leases the best pending search requests across all the datasets being built.
+        :param max_requests: maximum number of search requests to lease.
+        :param lease_time: seconds for the leases to expire. If None, the default of each session is used.
+        :return: list of [dataset name, search request], with the leases attached. Empty if there is no work left.
+        """
+        url = "{}/crawl/lease".format(self.backend_url)
+
+        params = {'max_requests': max_requests}
+
+        if lease_time is not None:
+            params['lease_time'] = lease_time
+
+        response = self._get_http_client().post(url, params=params)
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response!".format(url))
+
+        leased_requests = []
+
+        for serial in self._get_http_client().get_content(response)['result']:
+            search_request = SearchRequest.deserialize(serial)
+            search_request.set_lease(serial['lease']['id'], serial['lease']['lease_time'])
+            leased_requests.append([serial['dataset'], search_request])
+
+        return leased_requests
 
     def remove_dataset_builder_by_name(self, name):
         """
@@ -78,11 +142,13 @@ class RemoteDatasetFactory():
         """
         url = "{}/dataset/{}/".format(self.backend_url, name)
 
-        response = requests.delete(url)
+        response = self._get_http_client().delete(url)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
+        self.remote_sessions.pop(name, None)
+
     def create_dataset(self, name, dataset_type=GenericDataset):
         """
         Creates a new dataset builder and a search_session associated to it.
@@ -95,7 +161,7 @@ class RemoteDatasetFactory():
 
         url = "{}/dataset/".format(self.backend_url)
 
-        response = requests.put(url, params={'name': name, 'dataset_type': inv_dataset_types[dataset_type]})
+        response = self._get_http_client().put(url, params={'name': name, 'dataset_type': inv_dataset_types[dataset_type]})
 
         if response.status_code == 401:
             raise Exception("Name \"{}\" is already taken.".format(name))
@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import re
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 from main.service.global_status import global_status
 
 from main.transport_core.webcore import WebCore
+from main.transport_core.transport_cores import CAPABILITY_JAVASCRIPT
 import json
 import logging
 from bs4 import BeautifulSoup
@@ -20,6 +21,8 @@ class BingImages(SearchEngine):
     """
     Search engine that retrieves information of images from the bing images search engine.
     """
+    # More results are loaded as the page is scrolled.
+    required_capabilities = [CAPABILITY_JAVASCRIPT]
 
     def retrieve(self, search_request):
         """
@@ -30,10 +33,7 @@ class BingImages(SearchEngine):
                     that this flag enables. It will result in images of faces related with the given keywords.
         :return:
         """
-        # This way we cache the transport core.
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.debug("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         logging.info("Retrieving image links from request {}.".format(search_request))
         return self._retrieve_image_links_data(search_request.get_words(), search_request.get_options())
@@ -102,8 +102,7 @@ class BingImages(SearchEngine):
 
             previous_percent = current_percent
             self.transport_core.scroll_to_bottom()
-            elements = self.transport_core.get_elements_html_by_class("dg_u")
-            current_percent = len(elements)
+            current_percent = self.transport_core.wait_for_element_count("dg_u", previous_percent + 1)
 
         global_status.update_proc_progress("{} ({}) *Caching page*".format(self.__class__.__name__, search_words),
                                     100)
@@ -138,4 +137,4 @@ class BingImages(SearchEngine):
         return result
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(BingImages)] = BingImages
\ No newline at end of file
+register_search_engine(BingImages)
\ No newline at end of file
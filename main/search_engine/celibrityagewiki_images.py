@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 import html
 
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 from main.transport_core.webcore import WebCore
+from main.transport_core.transport_cores import CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION
 import urllib
 import urllib.parse as urlparse
 import json
@@ -19,6 +20,8 @@ class CelebrityAgeWikiImages(SearchEngine):
     """
     Search engine that retrieves information of images from the yahoo images search engine.
     """
+    # The search is typed in the page, and more results are loaded as it is scrolled.
+    required_capabilities = [CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION]
 
     def retrieve(self, search_request):
         """
@@ -29,10 +32,7 @@ class CelebrityAgeWikiImages(SearchEngine):
                     that this flag enables. It will result in images of faces related with the given keywords.
         :return:
         """
-        # This way we cache the transport core.
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.debug("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         logging.info("Retrieving image links from request {}.".format(search_request))
         return self._retrieve_image_links_data(search_request.get_words(), search_request.get_options())
@@ -103,14 +103,7 @@ class CelebrityAgeWikiImages(SearchEngine):
 
                 previous_percent = current_percent
                 self.transport_core.scroll_to_bottom()
-
-                try:
-                    self.transport_core.wait_for_elements_from_class("ld")
-                except Exception as ex:
-                    pass
-
-                elements = self.transport_core.get_elements_html_by_class("ld")
-                current_percent = len(elements)
+                current_percent = self.transport_core.wait_for_element_count("ld", previous_percent + 1)
             except Exception as ex:
                 logging.info("Error: {}".format(str(ex)))
                 finished = True
@@ -150,4 +143,4 @@ class CelebrityAgeWikiImages(SearchEngine):
         return result
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(YahooImages)] = YahooImages
\ No newline at end of file
+register_search_engine(YahooImages)
\ No newline at end of file
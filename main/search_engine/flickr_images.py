@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 from main.transport_core.webcore import WebCore
+from main.transport_core.transport_cores import CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION
 import urllib
 import urllib.request
 import logging
@@ -18,6 +19,8 @@ class FlickrImages(SearchEngine):
     """
     Search engine that retrieves information of images from the flickr images search engine.
     """
+    # The details of each image are read by clicking through the preview.
+    required_capabilities = [CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION]
 
     def retrieve(self, search_request):
         """
@@ -26,10 +29,7 @@ class FlickrImages(SearchEngine):
          search. The following options are currently accepted:
         :return:
         """
-        # This way we cache the transport core.
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.debug("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         logging.info("Retrieving image links from request {}.".format(search_request))
         return self._retrieve_image_links_data(search_request.get_words(), search_request.get_options())
@@ -98,7 +98,7 @@ class FlickrImages(SearchEngine):
         self.transport_core.manual_wait_for_element_from_class("follow-view")
 
         #if len(self.transport_core.get_elements_html_by_class("more-info")) == 0:
-        if len(self.transport_core.get_elements_html_by_class("follow-view")) > 0:
+        if self.transport_core.count_elements_by_class("follow-view") > 0:
 
             main_photo = BeautifulSoup(self.transport_core.get_elements_html_by_class("main-photo", False)[0], 'html.parser').find()
             image_json['url'] = self._prepend_http_protocol(main_photo["src"], is_ssl=True)
@@ -121,4 +121,4 @@ class FlickrImages(SearchEngine):
 
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(FlickrImages)] = FlickrImages
\ No newline at end of file
+register_search_engine(FlickrImages)
\ No newline at end of file
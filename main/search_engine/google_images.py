@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 from main.service.global_status import global_status
 from main.transport_core.webcore import WebCore
+from main.transport_core.transport_cores import CAPABILITY_JAVASCRIPT
 import urllib
 import json
 import logging
@@ -14,6 +15,8 @@ class GoogleImages(SearchEngine):
     """
     Search engine that retrieves information of images in the google images tab from google.
     """
+    # More results are loaded as the page is scrolled.
+    required_capabilities = [CAPABILITY_JAVASCRIPT]
 
     def retrieve(self, search_request):
         """
@@ -24,11 +27,7 @@ class GoogleImages(SearchEngine):
                     this flag enables. It will result in images of faces related with the given keywords.
         :return: A json wrapping all the result retrieved from the search_request.
         """
-        # This way we cache the transport core.
-
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.info("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         global_status.update_proc_progress("{} ({})".format(self.__class__.__name__, search_request.get_words()), 0)
 
@@ -80,11 +79,10 @@ class GoogleImages(SearchEngine):
         while previous_percent < current_percent:
             previous_percent = current_percent
             self.transport_core.scroll_to_bottom()
-            elements = self.transport_core.get_elements_html_by_class("rg_meta")
-            current_percent = len(elements)
+            current_percent = self.transport_core.wait_for_element_count("rg_meta", previous_percent + 1)
 
             global_status.update_proc_progress("{} ({}) *Caching page*".format(self.__class__.__name__, search_words),
                                         current_percent, max=400)
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(GoogleImages)] = GoogleImages
\ No newline at end of file
+register_search_engine(GoogleImages)
\ No newline at end of file
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 import urllib
 import logging
 from bs4 import BeautifulSoup
@@ -21,10 +21,7 @@ class HowOldImages(SearchEngine):
 
         :return:
         """
-        # This way we cache the transport core.
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.info("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         logging.debug("Retrieving image links from request {}.".format(search_request))
         return self._retrieve_image_links_data(search_request.get_words(), search_request.get_options())
@@ -61,4 +58,4 @@ class HowOldImages(SearchEngine):
 
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(HowOldImages)] = HowOldImages
+register_search_engine(HowOldImages)
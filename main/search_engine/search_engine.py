@@ -1,16 +1,66 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import logging
 import urllib
 from PIL import ImageFile
-from main.transport_core.webcore import WebCore
+
+from main.transport_core.transport_cores import get_missing_capabilities
 
 __author__ = "Ivan de Paz Centeno"
 
 
 class SearchEngine(object):
 
-    def __init__(self):
-        self.transport_core = WebCore()  # It is the preferable and the default transport core.
+    # Capabilities the transport core must offer to retrieve from the engine (see transport_cores.py). Engines that
+    # only read the pages they get need none, and can be served by a light transport core like HttpCore.
+    required_capabilities = []
+
+    def __init__(self, transport_core_provider=None, light_transport_core_proto=None):
+        """
+        :param transport_core_provider: callable that returns the transport core to use for a transport core proto,
+        so that several search engines can share them. If None, the search engine creates its own transport core.
+        :param light_transport_core_proto: transport core proto to use instead of the one of the requests, if it
+        offers the capabilities the engine needs. None to always use the one of the requests.
+        """
+        self.transport_core = None  # Created for the first request, of the transport core proto it asks for.
+        self.transport_core_provider = transport_core_provider
+        self.light_transport_core_proto = light_transport_core_proto
+
+    def _get_transport_core_proto(self, search_request):
+        """
+        :return: the transport core proto to serve the search request.
+        :raises ValueError: if it doesn't offer the capabilities the engine needs.
+        """
+        transport_core_proto = search_request.get_transport_core_proto()
+
+        if self.light_transport_core_proto is not None and not get_missing_capabilities(
+                self.light_transport_core_proto, self.required_capabilities):
+            transport_core_proto = self.light_transport_core_proto
+
+        missing_capabilities = get_missing_capabilities(transport_core_proto, self.required_capabilities)
+
+        if missing_capabilities:
+            raise ValueError("Transport core {} can't serve {}, since it lacks {}.".format(
+                transport_core_proto.__name__, self.__class__.__name__, ", ".join(missing_capabilities)))
+
+        return transport_core_proto
+
+    def _prepare_transport_core(self, search_request):
+        """
+        Sets the transport core for the search request. Without a provider, it is only replaced if the request asks
+        for a different transport core proto.
+        :param search_request:
+        :raises ValueError: if the transport core doesn't offer the capabilities the engine needs.
+        """
+        transport_core_proto = self._get_transport_core_proto(search_request)
+
+        # The provider is asked every time, since it may have replaced the transport core since the last request.
+        if self.transport_core_provider is not None:
+            self.transport_core = self.transport_core_provider(transport_core_proto)
+
+        elif self.transport_core is None or self.transport_core.__class__ != transport_core_proto:
+            self.transport_core = transport_core_proto()
+            logging.info("Transport core created from proto.")
 
     def retrieve(self, search_request):
         """
@@ -69,5 +119,21 @@ class SearchEngine(object):
 
 # This file reflects the search engines available in the project. Useful for serialization/deserialization
 
-# It is full of search-engine-proto-str : search-engine-proto lines
-SEARCH_ENGINES = {}
\ No newline at end of file
+# It is full of search-engine-id : search-engine-proto lines. Each search engine is registered by its compact id and by
+# its legacy id (str of the class), which older versions used to serialize it.
+SEARCH_ENGINES = {}
+
+
+def get_search_engine_id(search_engine_proto):
+    """
+    :return: compact id of the search engine, used to serialize it.
+    """
+    return search_engine_proto.__name__
+
+
+def register_search_engine(search_engine_proto):
+    """
+    Registers the search engine to enable its deserialization.
+    """
+    SEARCH_ENGINES[get_search_engine_id(search_engine_proto)] = search_engine_proto
+    SEARCH_ENGINES[str(search_engine_proto)] = search_engine_proto
@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 import html
 
-from main.search_engine.search_engine import SEARCH_ENGINES, SearchEngine
+from main.search_engine.search_engine import SearchEngine, register_search_engine
 from main.service.global_status import global_status
 from main.transport_core.webcore import WebCore
+from main.transport_core.transport_cores import CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION
 import urllib
 import urllib.parse as urlparse
 import json
@@ -21,6 +22,8 @@ class YahooImages(SearchEngine):
     """
     Search engine that retrieves information of images from the yahoo images search engine.
     """
+    # The search is typed in the page, and more results are loaded as it is scrolled.
+    required_capabilities = [CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION]
 
     def retrieve(self, search_request):
         """
@@ -31,10 +34,7 @@ class YahooImages(SearchEngine):
                     that this flag enables. It will result in images of faces related with the given keywords.
         :return:
         """
-        # This way we cache the transport core.
-        if not self.transport_core or search_request.get_transport_core_proto() != self.transport_core.__class__:
-            self.transport_core = search_request.get_transport_core_proto()()
-            logging.debug("Transport core created from proto.")
+        self._prepare_transport_core(search_request)
 
         global_status.update_proc_progress("{} ({})".format(self.__class__.__name__, search_request.get_words()), 0)
 
@@ -118,14 +118,7 @@ class YahooImages(SearchEngine):
 
                 previous_percent = current_percent
                 self.transport_core.scroll_to_bottom()
-
-                try:
-                    self.transport_core.wait_for_elements_from_class("ld")
-                except Exception as ex:
-                    pass
-
-                elements = self.transport_core.get_elements_html_by_class("ld")
-                current_percent = len(elements)
+                current_percent = self.transport_core.wait_for_element_count("ld", previous_percent + 1)
 
                 global_status.update_proc_progress("{} ({}) *Caching page*".format(self.__class__.__name__, search_words),
                                             current_percent, max=MAX_IMAGES_PER_REQUEST)
@@ -167,4 +160,4 @@ class YahooImages(SearchEngine):
         return result
 
 # Register the class to enable deserialization.
-SEARCH_ENGINES[str(YahooImages)] = YahooImages
\ No newline at end of file
+register_search_engine(YahooImages)
\ No newline at end of file
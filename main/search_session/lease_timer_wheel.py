@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import math
+import time
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class LeaseTimerWheel(object):
+    """
+    Timer wheel that tracks the deadlines of the leases of a session.
+
+    Deadlines are grouped in slots of `resolution` seconds. Adding, moving or removing a lease is O(1), and expiring
+    the leases costs the number of slots elapsed since the previous check plus the number of leases expired.
+    A lease expires in the first check done after its slot is over, so it may live up to `resolution` seconds longer
+    than its deadline.
+    """
+
+    def __init__(self, resolution=1.0):
+        self.resolution = resolution
+        self.slots = {}  # slot: set of lease ids
+        self.lease_slots = {}  # lease id: slot
+        self.next_slot = self._get_slot(time.time())  # first slot that hasn't been expired yet
+
+    def _get_slot(self, timestamp):
+        return int(math.floor(timestamp / self.resolution))
+
+    def add(self, lease_id, deadline):
+        """
+        Adds a lease to the wheel. If the lease already exists, it is moved to the new deadline.
+        :param lease_id: id of the lease.
+        :param deadline: timestamp at which the lease expires.
+        """
+        self.remove(lease_id)
+
+        slot = max(self._get_slot(deadline), self.next_slot)
+
+        if slot not in self.slots:
+            self.slots[slot] = set()
+
+        self.slots[slot].add(lease_id)
+        self.lease_slots[lease_id] = slot
+
+    def remove(self, lease_id):
+        """
+        Removes the lease from the wheel, if it exists.
+        :param lease_id: id of the lease.
+        """
+        slot = self.lease_slots.pop(lease_id, None)
+
+        if slot is not None:
+            self.slots[slot].discard(lease_id)
+
+            if not self.slots[slot]:
+                del self.slots[slot]
+
+    def expire(self, now=None):
+        """
+        Removes from the wheel the leases whose slot is already over.
+        :param now: current timestamp.
+        :return: list of ids of the expired leases.
+        """
+        if now is None:
+            now = time.time()
+
+        current_slot = self._get_slot(now)
+        expired = []
+
+        # If the wheel was not checked for a long time, it is cheaper to look at the used slots only.
+        if current_slot - self.next_slot > len(self.slots):
+            slots_to_check = sorted(slot for slot in self.slots if slot < current_slot)
+        else:
+            slots_to_check = range(self.next_slot, current_slot)
+
+        for slot in slots_to_check:
+            for lease_id in self.slots.pop(slot, ()):
+                del self.lease_slots[lease_id]
+                expired.append(lease_id)
+
+        self.next_slot = max(self.next_slot, current_slot)
+
+        return expired
+
+    def __len__(self):
+        return len(self.lease_slots)
@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
 import logging
-import time
-import requests
+import os
 
 from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import PROGRESS_WAIT_TIME
+from main.service.http_client import get_http_client
 
 
 __author__ = "Ivan de Paz Centeno"
@@ -17,12 +17,18 @@ class RemoteSearchSession():
     It acts as a proxy class, allowing the retrieval or appending of new search requests.
     """
 
-    def __init__(self, backend_url):
+    def __init__(self, backend_url, http_client=None):
         """
         Initializes the search session for a given URL.
         :param backend_url: url of a search session to wrap.
+        :param http_client: HttpClient for the calls to the backend. If None, the client of the current process is
+        used.
         """
         self.backend_url = backend_url
+        self.http_client = http_client
+
+    def _get_http_client(self):
+        return self.http_client if self.http_client is not None else get_http_client()
 
     def append_search_requests(self, search_requests):
         """
@@ -34,7 +40,8 @@ class RemoteSearchSession():
         """
         url = "{}/search-request".format(self.backend_url)
 
-        response = requests.put(url, json={'search_requests': [request.serialize() for request in search_requests]})
+        response = self._get_http_client().put(url, content={'search_requests': [request.serialize() for request in
+                                                                                 search_requests]})
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
@@ -49,23 +56,33 @@ class RemoteSearchSession():
 
         url = "{}/search-request".format(self.backend_url)
 
-        response = requests.patch(url, json={'search_request': search_request.serialize()})
+        response = self._get_http_client().patch(url, content={'search_request': search_request.serialize()})
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
-    def pop_new_search_request(self):
+    def pop_new_search_request(self, lease_time=None):
         """
         Retrieves a search request from the list of search requests of the search session.
-        :return:
+        :param lease_time: seconds for the lease of the request to expire. If None, the session default is used.
+        :return: the search request, with its lease attached.
         """
 
         url = "{}/search-request".format(self.backend_url)
 
-        response = requests.get(url)
+        params = {}
+
+        if lease_time is not None:
+            params['lease_time'] = lease_time
+
+        response = self._get_http_client().get(url, params=params)
 
         if response.status_code == 200:
-            result = SearchRequest.deserialize(response.json())
+            serial = self._get_http_client().get_content(response)
+            result = SearchRequest.deserialize(serial)
+
+            if 'lease' in serial:
+                result.set_lease(serial['lease']['id'], serial['lease']['lease_time'])
 
         elif response.status_code == 404:
             result = None
@@ -75,6 +92,77 @@ class RemoteSearchSession():
 
         return result
 
+    def exchange_search_requests(self, finished_requests=None, failed_requests=None, max_requests=1,
+                                 lease_time=None):
+        """
+        Reports the search requests processed by a crawler and leases new ones in a single round trip.
+        :param finished_requests: search requests with their results associated, to register in the history.
+        :param failed_requests: search requests that could not be processed, to be reset.
+        :param max_requests: maximum number of new search requests to lease.
+        :param lease_time: seconds for the leases to expire. If None, the session default is used.
+        :return: [list of leased search requests, completion progress of the session]
+        """
+        url = "{}/exchange".format(self.backend_url)
+
+        content = {
+            'history': [search_request.serialize() for search_request in finished_requests or []],
+            'reset': [search_request.serialize() for search_request in failed_requests or []],
+            'max_requests': max_requests,
+        }
+
+        if lease_time is not None:
+            content['lease_time'] = lease_time
+
+        response = self._get_http_client().post(url, content=content)
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response!".format(url))
+
+        response = self._get_http_client().get_content(response)
+
+        leased_requests = []
+
+        for serial in response['result']:
+            search_request = SearchRequest.deserialize(serial)
+            search_request.set_lease(serial['lease']['id'], serial['lease']['lease_time'])
+            leased_requests.append(search_request)
+
+        return leased_requests, response['progress']
+
+    def renew_lease(self, lease_id, lease_time=None):
+        """
+        Extends the lease of a search request in progress.
+        :param lease_id: id of the lease to renew.
+        :param lease_time: seconds for the lease to expire, from now. If None, the session default is used.
+        :return: True if renewed. False if the lease doesn't exist anymore (it expired or was released).
+        """
+        url = "{}/lease/{}".format(self.backend_url, lease_id)
+
+        params = {}
+
+        if lease_time is not None:
+            params['lease_time'] = lease_time
+
+        # Renewing a lease again just extends it: safe to retry.
+        response = self._get_http_client().patch(url, params=params, retry=True)
+
+        if response.status_code not in [200, 404]:
+            raise Exception("Backend ({}) for session is returning a bad response!".format(url))
+
+        return response.status_code == 200
+
+    def release_lease(self, lease_id):
+        """
+        Releases the lease of a search request in progress, making it available again.
+        :param lease_id: id of the lease to release.
+        """
+        url = "{}/lease/{}".format(self.backend_url, lease_id)
+
+        response = self._get_http_client().delete(url)
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response!".format(url))
+
     def add_history_entry(self, search_request):
         """
         Registers an entry in the session history.
@@ -87,7 +175,7 @@ class RemoteSearchSession():
 
         url = "{}/history".format(self.backend_url)
 
-        response = requests.put(url, json={'search_request': search_request.serialize()})
+        response = self._get_http_client().put(url, content={'search_request': search_request.serialize()})
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
@@ -99,7 +187,7 @@ class RemoteSearchSession():
         """
         url = "{}/size".format(self.backend_url)
 
-        response = requests.get(url)
+        response = self._get_http_client().get(url)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
@@ -115,7 +203,7 @@ class RemoteSearchSession():
         """
         url = "{}/completion-progress".format(self.backend_url)
 
-        response = requests.get(url)
+        response = self._get_http_client().get(url)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response! ({})".format(url, response))
@@ -124,58 +212,98 @@ class RemoteSearchSession():
 
         return completed_percent
 
-    def save_session(self, filename, dump_in_progress_as_pending=True):
+    def wait_for_completion_progress(self, progress, timeout=PROGRESS_WAIT_TIME):
         """
-        Saves the current session in a file in JSON format.
-        :param dump_in_progress_as_pending:
-        :param filename: URI to the file.
-        :return: True if could be saved. False otherwise.
+        Waits for the completion progress of the wrapped search session to be different than the given one. The
+        backend holds the request until it changes (long-polling), so the progress is followed without polling it.
+        :param progress: completion progress already known by the caller.
+        :param timeout: maximum seconds to wait.
+        :return: the % of completion done, which is the given one if it didn't change before the timeout.
+        """
+        url = "{}/completion-progress".format(self.backend_url)
+        http_client = self._get_http_client()
+
+        response = http_client.get(url, params={'progress': progress, 'wait': timeout},
+                                   timeout=http_client.get_timeout(timeout))
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response! ({})".format(url, response))
+
+        return int(str(response.text))
+
+    def stream_serialize(self, dump_in_progress_as_pending=True):
+        """
+        Streams the content of the session in NDJSON format, as generated by SearchSession.stream_serialize().
+        :param dump_in_progress_as_pending: if set to True, the in-progress requests are dumped as pending requests.
+        :return: generator of lines (bytes, with the line terminator included).
         """
-        url = "{}/data".format(self.backend_url)
+        url = "{}/stream".format(self.backend_url)
 
-        response = requests.get(url, params={'dump_in_progress_as_pending': dump_in_progress_as_pending})
+        response = self._get_http_client().get(url, params={'dump_in_progress_as_pending': dump_in_progress_as_pending},
+                                stream=True)
 
         if response.status_code != 200:
+            response.close()
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
-        data = response.json()
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield line + b"\n"
+
+    def stream_deserialize(self, lines, load_in_progress_as_pending=True):
+        """
+        Replaces atomically the content of the session with the given NDJSON lines, which are uploaded in chunks.
+        :param lines: iterable of lines, like an open file.
+        :param load_in_progress_as_pending: if set to True, the in-progress requests are loaded as pending requests.
+        """
+        url = "{}/stream".format(self.backend_url)
 
-        if 'result' in data:
-            data = data['result']
+        response = self._get_http_client().put(url, params={'load_in_progress_as_pending': load_in_progress_as_pending},
+                                data=lines, headers={'Content-Type': "application/x-ndjson"})
+
+        if response.status_code != 200:
+            raise Exception("Backend ({}) for session is returning a bad response ({})!".format(
+                url, self._get_http_client().get_content(response)['message']))
+
+    def save_session(self, filename, dump_in_progress_as_pending=True):
+        """
+        Saves the current session in a file in NDJSON format. The content is streamed to a temporary file which
+        replaces the destination once complete, so a previous backup is never left half-written.
+        :param dump_in_progress_as_pending:
+        :param filename: URI to the file.
+        :return: True if could be saved. False otherwise.
+        """
+        temp_filename = "{}.tmp".format(filename)
 
         try:
-            assert ('search_requests' in data)
-            assert ('search_history' in data)
+            with open(temp_filename, 'wb') as outfile:
+                outfile.writelines(self.stream_serialize(dump_in_progress_as_pending))
 
-            with open(filename, 'w') as outfile:
-                json.dump(data, outfile)
+            os.replace(temp_filename, filename)
 
             result = True
             logging.info("Session file saved in {}".format(filename))
 
         except Exception as ex:
             result = False
-            logging.info("Could not save the file because of remote malformed response. Reason: {}".format(ex))
+            logging.info("Could not save the session. Reason: {}".format(ex))
+
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
 
         return result
 
     def load_session(self, filename, load_in_progress_as_pending=True):
         """
-        Loads the current session from a file.
+        Loads the current session from a file, replacing the content of the remote session. The file is streamed.
         :param load_in_progress_as_pending:
         :param filename: URI to the file.
         :return: True if could be loaded. False otherwise.
         """
-        url = "{}/data".format(self.backend_url)
-
         try:
-            with open(filename, 'r') as infile:
-                data = json.load(infile)
-
-            response = requests.put(url, params={'load_in_progress_as_pending': load_in_progress_as_pending}, json={"data":data})
-
-            if response.status_code != 200:
-                raise Exception("Backend ({}) for session is returning a bad response ({})!".format(url, response.json()['message']))
+            with open(filename, 'rb') as infile:
+                self.stream_deserialize(infile, load_in_progress_as_pending)
 
             result = True
             logging.info("Session loaded from file {}".format(filename))
@@ -192,29 +320,43 @@ class RemoteSearchSession():
         Retrieves the history from the session.
         :return: The history data
         """
+        search_requests, _ = self.get_history_since()
 
+        return {search_request.get_id(): search_request for search_request in search_requests}
+
+    def get_history_since(self, since=0, limit=None):
+        """
+        Retrieves the history entries added to the session after the given sequence number.
+        :param since: sequence number of the last entry already consumed (0 to start from the beginning).
+        :param limit: maximum number of entries to retrieve. None for no limit.
+        :return: [list of search requests, sequence number to continue from]
+        """
         url = "{}/history".format(self.backend_url)
 
-        response = requests.get(url)
+        params = {'since': since}
+
+        if limit is not None:
+            params['limit'] = limit
+
+        response = self._get_http_client().get(url, params=params)
 
         if response.status_code != 200:
             raise Exception("Backend ({}) for session is returning a bad response!".format(url))
 
-        history = response.json()
+        history = self._get_http_client().get_content(response)
 
-        result = []
+        search_requests = []
 
         if 'result' in history and history['result']:
-            history_search_requests = [SearchRequest.deserialize(serial) for serial in history['result']]
-
-            for search_request in history_search_requests:
-                result[search_request.__hash__()] = search_request
+            search_requests = [SearchRequest.deserialize(serial) for serial in history['result']]
 
-        return result
+        return search_requests, history.get('next', since + len(search_requests))
 
     def wait_for_finish(self):
         """
         Freezes the thread until the process is finished.
         """
-        while self.get_completion_progress() != 100:
-            time.sleep(1)
+        progress = self.get_completion_progress()
+
+        while progress != 100:
+            progress = self.wait_for_completion_progress(progress)
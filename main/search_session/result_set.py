@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from array import array
+
+__author__ = "Ivan de Paz Centeno"
+
+RESULT_KEYS = ['url', 'width', 'height', 'desc', 'searchwords', 'source']
+
+
+class ResultSet(object):
+    """
+    Compact container for the results retrieved by a search engine for a search request.
+
+    Instead of keeping a dict per result, the results are stored by columns:
+        - urls and descriptions are concatenated in a single string (the arena), indexed by an array of offsets.
+        - widths and heights are stored in integer arrays.
+        - searchwords and sources, which are repeated along the results, are stored once in a table of strings and
+          referenced by index.
+
+    It is immutable once built. The dicts of the results are only built on demand, when the set is iterated or
+    serialized, which is at the JSON boundary.
+
+    Values that don't fit the columns (a missing url, a size that is not a number, keys other than the RESULT_KEYS)
+    are kept as they came in a sparse table of extras, so the results are rebuilt without changes. Validating them is
+    up to the consumers.
+
+    Results that lack any of the RESULT_KEYS are discarded on build, since they can't be fetched anyway.
+    """
+
+    def __init__(self, results=None):
+        """
+        :param results: list of results in JSON format (dicts), as retrieved by the search engines.
+        """
+        self.texts = ""
+        self.offsets = array('L', [0])  # url of result i is texts[offsets[2i]:offsets[2i+1]], desc follows it.
+        self.widths = array('l')
+        self.heights = array('l')
+        self.searchwords = array('L')
+        self.sources = array('L')
+        self.strings = []
+        self.extras = {}  # result index: {key: value} of the values that are not stored in the columns
+
+        if results:
+            self._build(results)
+
+    def _build(self, results):
+        texts = []
+        strings_index = {}
+        position = 0
+
+        for result in results:
+            if not all(key in result for key in RESULT_KEYS):
+                continue
+
+            extras = {key: value for key, value in result.items() if key not in RESULT_KEYS}
+            url = self._to_text(result, 'url', extras)
+            desc = self._to_text(result, 'desc', extras)
+
+            texts.append(url)
+            texts.append(desc)
+            position += len(url)
+            self.offsets.append(position)
+            position += len(desc)
+            self.offsets.append(position)
+
+            self.widths.append(self._to_int(result, 'width', extras))
+            self.heights.append(self._to_int(result, 'height', extras))
+            self.searchwords.append(self._index_string(self._to_text(result, 'searchwords', extras), strings_index))
+            self.sources.append(self._index_string(self._to_text(result, 'source', extras), strings_index))
+
+            if extras:
+                self.extras[len(self.widths) - 1] = extras
+
+        self.texts = "".join(texts)
+
+    def _index_string(self, string, strings_index):
+        if string not in strings_index:
+            strings_index[string] = len(self.strings)
+            self.strings.append(string)
+
+        return strings_index[string]
+
+    @staticmethod
+    def _to_text(result, key, extras):
+        """
+        :return: the value of the key if it is a string. Otherwise, it is kept in the extras and "" is stored.
+        """
+        value = result[key]
+
+        if isinstance(value, str):
+            return value
+
+        extras[key] = value
+
+        return ""
+
+    @staticmethod
+    def _to_int(result, key, extras):
+        """
+        Sizes are retrieved as ints or numeric strings, depending on the search engine. Any other value is kept in the
+        extras and 0 is stored.
+        """
+        value = result[key]
+
+        try:
+            converted = int(value) if not isinstance(value, (bool, float)) else None
+        except (TypeError, ValueError):
+            converted = None
+
+        if converted is None or not -2 ** 31 <= converted < 2 ** 31:
+            extras[key] = value
+            converted = 0
+
+        return converted
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("Result index out of range")
+
+        result = {
+            'url': self.texts[self.offsets[2 * index]:self.offsets[2 * index + 1]],
+            'width': self.widths[index],
+            'height': self.heights[index],
+            'desc': self.texts[self.offsets[2 * index + 1]:self.offsets[2 * index + 2]],
+            'searchwords': self.strings[self.searchwords[index]],
+            'source': self.strings[self.sources[index]],
+        }
+
+        if index in self.extras:
+            result.update(self.extras[index])
+
+        return result
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def serialize(self):
+        """
+        :return: the list of results in JSON format.
+        """
+        return list(self)
+
+    @staticmethod
+    def deserialize(serial):
+        return ResultSet(serial)
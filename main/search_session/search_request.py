@@ -1,15 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hashlib
+import json
+import time
+
 from main.search_engine.google_images import GoogleImages
+from main.search_session.result_set import ResultSet
+from main.transport_core.httpcore import HttpCore
+from main.transport_core.replaycore import RecordingCore, ReplayCore
 from main.transport_core.webcore import WebCore
-from main.transport_core.transport_cores import TRANSPORT_CORES
-from main.search_engine.search_engine import SEARCH_ENGINES
+from main.transport_core.transport_cores import TRANSPORT_CORES, get_transport_core_id
+from main.search_engine.search_engine import SEARCH_ENGINES, get_search_engine_id
 
 __author__ = "Ivan de Paz Centeno"
 
 
 class SearchRequest(object):
-    def __init__(self, words, options=None, search_engine_proto=GoogleImages, transport_core_proto=WebCore):
+    def __init__(self, words, options=None, search_engine_proto=GoogleImages, transport_core_proto=WebCore,
+                 priority=0, group=None):
+        """
+        :param priority: requests with higher priority are served first by the session.
+        :param group: keyword group of the request. The session serves the groups of a search engine in round-robin.
+        If not specified, the words are the group.
+        """
         if not options:
             options = {}
 
@@ -17,7 +30,13 @@ class SearchRequest(object):
         self.options = options
         self.transport_core_proto = transport_core_proto
         self.search_engine_proto = search_engine_proto
-        self.result = []
+        self.priority = priority
+        self.group = group
+        self.result = ResultSet()
+        self.id = None
+        self.lease_id = None
+        self.lease_time = 0
+        self.lease_deadline = 0
 
     def get_search_engine_proto(self):
         return self.search_engine_proto
@@ -31,36 +50,101 @@ class SearchRequest(object):
     def get_options(self):
         return self.options
 
+    def get_priority(self):
+        return self.priority
+
+    def get_group(self):
+        if self.group is None:
+            return self.words
+
+        return self.group
+
+    def get_id(self):
+        """
+        Retrieves the identifier of the request. It is a digest of its content (words, options, search engine and
+        transport core), stable across processes and restarts, so it can be shared between the factory and the
+        crawlers. It is computed only once per request.
+        :return: 64 bits digest in hex format.
+        """
+        if self.id is None:
+            content = "\n".join([self.words, json.dumps(self.options, sort_keys=True, separators=(',', ':')),
+                                 str(self.search_engine_proto), str(self.transport_core_proto)])
+
+            self.id = hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+        return self.id
+
+    def set_lease(self, lease_id, lease_time):
+        """
+        Attaches the lease under which this request is being processed. The lease is not serialized with the request.
+        :param lease_id: id of the lease granted by the session.
+        :param lease_time: seconds for the lease to expire, from now.
+        """
+        self.lease_id = lease_id
+        self.lease_time = lease_time
+        self.lease_deadline = time.time() + lease_time
+
+    def get_lease_id(self):
+        return self.lease_id
+
+    def get_lease_time(self):
+        return self.lease_time
+
+    def get_lease_deadline(self):
+        return self.lease_deadline
+
     def __str__(self):
-        return "Words: \"{}\"; options: \"{}\" (search_engine: {}; transport core: {})".format(self.words,
-                                                                                               self.options,
-                                                                                               self.search_engine_proto,
-                                                                                               self.transport_core_proto)
+        return "[{}] Words: \"{}\"; options: \"{}\" (search_engine: {}; transport core: {})".format(
+            self.get_id(), self.words, self.options, self.search_engine_proto, self.transport_core_proto)
 
     def associate_result(self, result):
+        """
+        Associates the results retrieved for this request.
+        :param result: list of results in JSON format or ResultSet. It is stored as a ResultSet.
+        """
+        if not isinstance(result, ResultSet):
+            result = ResultSet(result)
+
         self.result = result
 
     def get_result(self):
         return self.result
 
     def __hash__(self):
-        return hash(self.__str__())
+        return hash(self.get_id())
 
     def serialize(self):
+        """
+        Serializes the search request. The search engine and the transport core are identified by their compact ids;
+        deserialize() also accepts the legacy ids (str of the class) of older versions.
+        """
         serial = {
+            'id': self.get_id(),
             'words': self.words,
             'options': self.options,
-            'transport_core': str(self.transport_core_proto),
-            'search_engine': str(self.search_engine_proto),
-            'associated_result': self.result
+            'transport_core': get_transport_core_id(self.transport_core_proto),
+            'search_engine': get_search_engine_id(self.search_engine_proto),
+            'priority': self.priority,
+            'group': self.group,
+            'associated_result': self.result.serialize()
         }
 
         return serial
 
     @staticmethod
     def deserialize(serial):
+        """
+        Builds a search request from its serialized form. The id is always computed from the content; if the serial
+        carries an id, it must match.
+        :raises ValueError: if the id of the serial doesn't match its content.
+        """
         search_request = SearchRequest(serial['words'], serial['options'], SEARCH_ENGINES[serial['search_engine']],
-                                       TRANSPORT_CORES[serial['transport_core']])
+                                       TRANSPORT_CORES[serial['transport_core']], serial.get('priority', 0),
+                                       serial.get('group'))
+
+        if 'id' in serial and serial['id'] != search_request.get_id():
+            raise ValueError("Id {} of the search request doesn't match its content ({}).".format(
+                serial['id'], search_request.get_id()))
 
         search_request.associate_result(serial['associated_result'])
 
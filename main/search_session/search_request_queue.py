@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, deque
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class SearchRequestQueue(object):
+    """
+    Scheduling queue for the pending search requests of a session.
+
+    Requests are served by priority (higher first). Inside a priority level they are served round-robin across
+    search engines, and inside a search engine round-robin across keyword groups; requests of the same group are
+    served in FIFO order. This way a fleet of crawlers spreads the load among all the engines instead of flooding one.
+
+    Enqueue and dequeue are O(1). Removals by id are lazy: the entry is dropped from the index and skipped when it
+    reaches the head of its group.
+
+    It behaves like the dict {id: request} that was used before, so it can be iterated, indexed and checked
+    for membership by the search request id.
+    """
+
+    def __init__(self):
+        self.requests = {}  # id: [request, token]
+        self.levels = {}  # priority: OrderedDict(engine: OrderedDict(group: deque([(id, token)])))
+        self.priorities = []  # sorted descending
+        self.token_count = 0
+
+    @staticmethod
+    def _get_schedule_key(search_request):
+        return search_request.get_priority(), search_request.get_search_engine_proto(), search_request.get_group()
+
+    def put(self, search_request):
+        """
+        Enqueues the search request. If a request with the same id is already queued, it is updated in place and
+        keeps its turn, unless its priority or group changed: then it is enqueued again at the tail of its new group.
+        :param search_request: search request to enqueue.
+        """
+        request_id = search_request.get_id()
+
+        if request_id in self.requests:
+            queued_request = self.requests[request_id][0]
+
+            if self._get_schedule_key(queued_request) == self._get_schedule_key(search_request):
+                self.requests[request_id][0] = search_request
+                return
+
+            # The previous entry is left behind as a tombstone, since its token won't match anymore.
+            del self.requests[request_id]
+
+        self.token_count += 1
+        token = self.token_count
+        self.requests[request_id] = [search_request, token]
+
+        priority = search_request.get_priority()
+
+        if priority not in self.levels:
+            self.levels[priority] = OrderedDict()
+            self.priorities.append(priority)
+            self.priorities.sort(reverse=True)
+
+        engines = self.levels[priority]
+        engine = search_request.get_search_engine_proto()
+
+        if engine not in engines:
+            engines[engine] = OrderedDict()
+
+        groups = engines[engine]
+        group = search_request.get_group()
+
+        if group not in groups:
+            groups[group] = deque()
+
+        groups[group].append((request_id, token))
+
+    def pop_next(self):
+        """
+        Dequeues the next search request to be processed, following the scheduling policy.
+        :return: the search request, or None if the queue is empty.
+        """
+        search_request = None
+
+        while search_request is None and self.priorities:
+            priority = self.priorities[0]
+            engines = self.levels[priority]
+
+            engine, groups = next(iter(engines.items()))
+            group, entries = next(iter(groups.items()))
+
+            request_id, token = entries.popleft()
+
+            if self._is_queued(request_id, token):
+                search_request = self.requests.pop(request_id)[0]
+
+            # Rotate the rings so the next pop goes for a different group and engine.
+            if entries:
+                groups.move_to_end(group)
+            else:
+                del groups[group]
+
+            if groups:
+                engines.move_to_end(engine)
+            else:
+                del engines[engine]
+
+            if not engines:
+                del self.levels[priority]
+                self.priorities.pop(0)
+
+        return search_request
+
+    def _is_queued(self, request_id, token):
+        return request_id in self.requests and self.requests[request_id][1] == token
+
+    def _prune_level(self, priority):
+        """
+        Drops the removed requests at the head of the groups of the priority level, until one group starts with a
+        queued request. Groups and engines left empty are dropped, as pop_next() does, without rotating the rings.
+        :return: True if the level still has a queued request.
+        """
+        engines = self.levels[priority]
+
+        while engines:
+            engine, groups = next(iter(engines.items()))
+
+            while groups:
+                group, entries = next(iter(groups.items()))
+
+                while entries and not self._is_queued(*entries[0]):
+                    entries.popleft()
+
+                if entries:
+                    return True
+
+                del groups[group]
+
+            del engines[engine]
+
+        return False
+
+    def get_next_priority(self):
+        """
+        :return: priority of the next search request to be served, or None if the queue is empty.
+        """
+        while self.priorities and not self._prune_level(self.priorities[0]):
+            del self.levels[self.priorities.pop(0)]
+
+        return self.priorities[0] if self.priorities else None
+
+    def pop(self, request_id, *default):
+        """
+        Removes the request identified by the given id from the queue.
+        :param request_id: id of the search request to remove.
+        :return: the removed search request.
+        """
+        if request_id not in self.requests and default:
+            return default[0]
+
+        return self.requests.pop(request_id)[0]
+
+    def clear(self):
+        self.requests = {}
+        self.levels = {}
+        self.priorities = []
+
+    def values(self):
+        return [entry[0] for entry in self.requests.values()]
+
+    def __getitem__(self, request_id):
+        return self.requests[request_id][0]
+
+    def __contains__(self, request_id):
+        return request_id in self.requests
+
+    def __iter__(self):
+        return iter(list(self.requests))
+
+    def __len__(self):
+        return len(self.requests)
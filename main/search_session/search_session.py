@@ -2,32 +2,352 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import math
 import time
+import uuid
+from threading import Condition
 
+from main.search_session.lease_timer_wheel import LeaseTimerWheel
 from main.search_session.search_request import SearchRequest
+from main.search_session.session_store.memory_session_store import MemorySessionStore
 from main.service.service import Service
 
 __author__ = "Ivan de Paz Centeno"
 
+DEFAULT_LEASE_TIME = 300  # seconds for a popped request to be requeued unless its lease is renewed
+MAX_LEASE_TIME = 86400  # seconds
+MAX_EXCHANGE_REQUESTS = 100  # requests leased at most in a single exchange
+LEASES_CHECK_INTERVAL = 1  # seconds
+PROGRESS_WAIT_TIME = 30  # seconds waited at most for the completion progress to change
+
+# Operation codes of the journal records
+JOURNAL_APPEND = "a"
+JOURNAL_POP = "p"
+JOURNAL_HISTORY = "h"
+JOURNAL_RESET_REQUEST = "r"
+JOURNAL_RESET = "R"
+JOURNAL_CLEAR = "C"
+
+# Streaming (NDJSON) format of the session: a header line followed by one line per search request.
+SESSION_STREAM_FORMAT = "oculus-session-ndjson"
+SESSION_STREAM_VERSION = 1
+SECTION_SEARCH_REQUESTS = "search_requests"
+SECTION_SEARCH_HISTORY = "search_history"
+SECTION_SEARCH_IN_PROGRESS = "search_in_progress"
+
 
 class SearchSession(Service):
     """
     This search session is a way to centralize all the crawlers. This way we don't need to know where is each crawler
     and we only need to know where is this session. All the crawled data is going to end up here.
+
+    Popped search requests are leased to the crawler: if the lease is not renewed before its deadline (because the
+    crawler died or hung), the request is requeued.
+
+    The search requests are kept in a SessionStore, in memory by default.
     """
 
-    def __init__(self, autostart=True):
+    def __init__(self, autostart=True, journal=None, lease_time=DEFAULT_LEASE_TIME, store=None):
+        """
+        :param journal: SessionJournal where every change of the session is persisted. If it contains data, the
+        session is recovered from it. Ignored if the store is persistent, since the store already survives a restart.
+        :param lease_time: default seconds for the leases of the popped requests to expire.
+        :param store: SessionStore for the search requests. If None, they are kept in memory. If the store already
+        contains requests, the session continues from them.
+        """
         Service.__init__(self)
 
+        self.progress_condition = Condition(self.lock)
         self.start_time = time.time()
-        self.search_requests = {}  # hash: request
-        self.search_history = {}
-        self.search_in_progress = {}
+        self.store = store if store is not None else MemorySessionStore()
         self.finish_time = 0
+        self.journal = None
+
+        self.lease_time = lease_time
+        self.leases = {}  # lease id: request id
+        self.request_leases = {}  # request id: lease id
+        self.lease_wheel = LeaseTimerWheel()
+
+        if journal and self.store.is_persistent():
+            logging.info("The session store is persistent. Journal {} ignored.".format(journal.path))
+            journal = None
+
+        if journal:
+            if journal.exists():
+                self._recover_from_journal(journal)
+
+            self.journal = journal
+
+        # Crawlers working on the recovered requests in progress have a fresh lease to report them.
+        with self.lock:
+            self._grant_leases_in_progress()
 
         if autostart:
             self.start()
 
+    def _commit(self):
+        """
+        Ends an operation that modified the session: commits the writes of the store and wakes up the threads
+        waiting for the completion progress to change. Must be invoked with the lock acquired.
+        """
+        self.store.flush()
+        self.progress_condition.notify_all()
+
+    def _journal(self, *record):
+        """
+        Writes a record in the journal, if any. Must be invoked with the lock acquired, so that the records keep the
+        same order as the changes they represent.
+        """
+        if self.journal:
+            self.journal.record(record)
+
+    def _recover_from_journal(self, journal):
+        """
+        Rebuilds the session from the last snapshot of the journal plus the records written after it.
+        :param journal: journal to recover from.
+        """
+        snapshot, records = journal.recover()
+
+        with self.lock:
+            if snapshot:
+                self._load_data(snapshot, True, restore_history_sequences=True)
+                self.start_time = snapshot.get('start_time', self.start_time)
+
+            for record in records:
+                self._apply_journal_record(record)
+
+            self._commit()
+
+        logging.info("Session recovered from journal {} ({} records replayed)".format(journal.path, len(records)))
+
+    def _apply_journal_record(self, record):
+        """
+        Applies the change represented by the journal record. Must be invoked with the lock acquired.
+        :param record: journal record.
+        """
+        operation = record[0]
+
+        if operation == JOURNAL_APPEND:
+            search_request = SearchRequest.deserialize(record[1])
+            search_id = search_request.get_id()
+
+            if not self.store.has_history(search_id) and not self.store.has_in_progress(search_id):
+                self.store.put_pending(search_request)
+
+        elif operation == JOURNAL_POP:
+            search_request = self.store.remove_pending(record[1])
+
+            if search_request:
+                self.store.put_in_progress(search_request)
+
+        elif operation == JOURNAL_HISTORY:
+            search_request = SearchRequest.deserialize(record[1])
+            self.store.put_history(search_request)
+            self.store.remove_in_progress(search_request.get_id())
+            self.store.remove_pending(search_request.get_id())
+            self._revoke_lease(search_request.get_id())
+
+        elif operation == JOURNAL_RESET_REQUEST:
+            self.store.remove_in_progress(record[1])
+            self._revoke_lease(record[1])
+
+        elif operation == JOURNAL_RESET:
+            self.start_time = record[1]
+            self.finish_time = 0
+            self.store.clear_history()
+
+        elif operation == JOURNAL_CLEAR:
+            self.store.clear()
+            self._clear_leases()
+
+    def _grant_lease(self, search_request, lease_time):
+        """
+        Leases the search request in progress. Must be invoked with the lock acquired.
+        """
+        lease_id = uuid.uuid4().hex
+        search_request.set_lease(lease_id, lease_time)
+
+        self.leases[lease_id] = search_request.get_id()
+        self.request_leases[search_request.get_id()] = lease_id
+        self.lease_wheel.add(lease_id, search_request.get_lease_deadline())
+
+    def _revoke_lease(self, search_id):
+        """
+        Removes the lease of the given search request, if any. Must be invoked with the lock acquired.
+        """
+        lease_id = self.request_leases.pop(search_id, None)
+
+        if lease_id:
+            del self.leases[lease_id]
+            self.lease_wheel.remove(lease_id)
+
+    def _grant_leases_in_progress(self):
+        """
+        Leases the search requests in progress that don't have a lease. Must be invoked with the lock acquired.
+        """
+        for search_request in self.store.get_all_in_progress():
+            if search_request.get_id() not in self.request_leases:
+                self._grant_lease(search_request, self.lease_time)
+
+    def _clear_leases(self):
+        self.leases = {}
+        self.request_leases = {}
+        self.lease_wheel = LeaseTimerWheel()
+
+    def _requeue_leased_request(self, lease_id):
+        """
+        Moves the search request of the given lease from the in-progress list back to the pending requests.
+        Must be invoked with the lock acquired.
+        """
+        search_id = self.leases[lease_id]
+        self._revoke_lease(search_id)
+
+        search_request = self.store.remove_in_progress(search_id)
+
+        if search_request:
+            self._journal(JOURNAL_RESET_REQUEST, search_id)
+
+            if not self.store.has_history(search_id):
+                self.store.put_pending(search_request)
+                self._journal(JOURNAL_APPEND, search_request.serialize())
+
+    def _expire_leases(self):
+        """
+        Requeues the search requests whose leases expired.
+        """
+        with self.lock:
+            expired_leases = self.lease_wheel.expire()
+
+            for lease_id in expired_leases:
+                if lease_id in self.leases:
+                    self._requeue_leased_request(lease_id)
+
+            self._commit()
+
+        if expired_leases:
+            logging.info("{} leases expired. Their search requests were requeued.".format(len(expired_leases)))
+
+    @staticmethod
+    def is_valid_lease_time(lease_time):
+        """
+        :return: True if the lease time is a finite number of seconds in (0, MAX_LEASE_TIME].
+        """
+        return isinstance(lease_time, (int, float)) and math.isfinite(lease_time) and 0 < lease_time <= MAX_LEASE_TIME
+
+    def _get_lease_time(self, lease_time):
+        """
+        :return: the given lease time, or the session default if None.
+        :raises ValueError: if the lease time is not valid.
+        """
+        if lease_time is None:
+            return self.lease_time
+
+        if not self.is_valid_lease_time(lease_time):
+            raise ValueError("Lease time must be a number of seconds greater than 0 and up to {}.".format(
+                MAX_LEASE_TIME))
+
+        return lease_time
+
+    def renew_lease(self, lease_id, lease_time=None):
+        """
+        Extends the lease of a search request in progress.
+        :param lease_id: id of the lease to renew.
+        :param lease_time: seconds for the lease to expire, from now. If None, the session default is used.
+        :return: True if renewed. False if the lease doesn't exist anymore (it expired or was released).
+        :raises ValueError: if the lease time is not valid.
+        """
+        lease_time = self._get_lease_time(lease_time)
+
+        with self.lock:
+            renewed = lease_id in self.leases
+
+            if renewed:
+                self.lease_wheel.add(lease_id, time.time() + lease_time)
+
+        return renewed
+
+    def release_lease(self, lease_id):
+        """
+        Releases the lease of a search request in progress, which becomes available again for other crawlers.
+        :param lease_id: id of the lease to release.
+        :return: True if released. False if the lease doesn't exist anymore.
+        """
+        with self.lock:
+            released = lease_id in self.leases
+
+            if released:
+                self._requeue_leased_request(lease_id)
+                self._commit()
+
+        return released
+
+    def _compact_journal(self):
+        """
+        Writes a snapshot of the session in the journal, so that the records already applied can be discarded.
+        Only the capture of the references is done under the lock; the serialization is done outside.
+        """
+        with self.lock:
+            snapshot = self._capture_snapshot()
+
+        self._write_snapshot(*snapshot)
+
+    def _capture_snapshot(self, replaced=False):
+        """
+        Captures the references of the session content and starts a new journal file. Must be invoked with the lock
+        acquired.
+        :param replaced: True if the whole content was replaced, so the new journal file can't be replayed over the
+        previous snapshot.
+        :return: the arguments for _write_snapshot().
+        """
+        return (self.store.get_pending(), self.store.get_history_with_sequences(), self.store.get_all_in_progress(),
+                self.store.get_last_history_sequence(), self.start_time, self.journal.rotate(barrier=replaced))
+
+    def _write_snapshot(self, search_requests, search_history, search_in_progress, last_history_sequence, start_time,
+                        generation):
+        """
+        Writes the snapshot of the session. The sequence numbers of the history entries are kept, so that the cursors
+        of the change feed held by the consumers are still valid after a recovery.
+        :param search_history: iterable of [sequence number, search request] of the history.
+        """
+        history = []
+        history_sequences = []
+
+        for sequence, search_request in search_history:
+            history.append(search_request.serialize())
+            history_sequences.append(sequence)
+
+        data = {'search_requests': [search_request.serialize() for search_request in search_requests],
+                'search_history': history,
+                'history_sequences': history_sequences,
+                'last_history_sequence': last_history_sequence,
+                'search_in_progress': [search_request.serialize() for search_request in search_in_progress],
+                'start_time': start_time}
+
+        try:
+            self.journal.write_snapshot(data, generation)
+        except Exception as ex:
+            logging.info("Could not write the session snapshot: {}".format(ex))
+
+    def __internal_thread__(self):
+        Service.__internal_thread__(self)
+
+        while not self.__get_stop_flag__():
+            self._expire_leases()
+
+            if self.journal and self.journal.needs_compaction():
+                self._compact_journal()
+
+            time.sleep(LEASES_CHECK_INTERVAL)
+
+    def stop(self, wait_for_finish=True):
+        Service.stop(self, wait_for_finish)
+
+        with self.lock:
+            self.store.flush()
+
+            if self.journal:
+                self.journal.close()
+
     def append_search_requests(self, search_requests):
         """
         Adds a batch of search requests to the session.
@@ -39,21 +359,37 @@ class SearchSession(Service):
 
         for search in search_requests:
             with self.lock:
-                if search.__hash__() not in self.search_history and search.__hash__() not in self.search_in_progress:
-                    self.search_requests[search.__hash__()] = search
+                search_id = search.get_id()
+
+                if not self.store.has_history(search_id) and not self.store.has_in_progress(search_id):
+                    self.store.put_pending(search)
+                    self._journal(JOURNAL_APPEND, search.serialize())
+
+        # The whole batch is committed at once.
+        with self.lock:
+            self._commit()
 
-    def pop_new_search_request(self):
+    def pop_new_search_request(self, lease_time=None):
         """
         When a search request is poped out from the session history, it is stored as a search request in progress.
         This will help us to track the search request progress status in the future.
-        :return:
+
+        Requests are handed out by priority and in round-robin across search engines and keyword groups.
+        :param lease_time: seconds for the lease of the request to expire. If None, the session default is used.
+        :return: the search request, with its lease attached. None if there are no requests available.
+        :raises ValueError: if the lease time is not valid.
         """
-        if len(self.search_requests) > 0:
-            with self.lock:
-                search_request = self.search_requests.popitem()[1]
-                self.search_in_progress[search_request.__hash__()] = search_request
-        else:
-            search_request = None
+        lease_time = self._get_lease_time(lease_time)
+
+        with self.lock:
+            search_request = self.store.pop_next_pending()
+
+            if search_request:
+                # Leased before it is stored as in progress, so it can't stay in progress without a lease.
+                self._grant_lease(search_request, lease_time)
+                self.store.put_in_progress(search_request)
+                self._journal(JOURNAL_POP, search_request.get_id())
+                self._commit()
 
         return search_request
 
@@ -67,12 +403,56 @@ class SearchSession(Service):
         :return:
         """
 
+        search_id = search_request.get_id()
+
         with self.lock:
 
-            self.search_history[search_request.__hash__()] = search_request
+            self.store.put_history(search_request)
+            self.store.remove_in_progress(search_id)
+
+            # It may have been requeued if its lease expired before the crawler reported it.
+            self.store.remove_pending(search_id)
+            self._revoke_lease(search_id)
 
-            if search_request.__hash__() in self.search_in_progress:
-                self.search_in_progress.pop(search_request.__hash__())
+            self._journal(JOURNAL_HISTORY, search_request.serialize())
+            self._commit()
+
+    def exchange_search_requests(self, finished_requests=None, failed_requests=None, max_requests=1,
+                                 lease_time=None):
+        """
+        Reports the search requests processed by a crawler and leases new ones in a single call.
+        :param finished_requests: search requests with their results associated, to register in the history.
+        :param failed_requests: search requests that could not be processed, to be reset.
+        :param max_requests: maximum number of new search requests to lease. Capped to MAX_EXCHANGE_REQUESTS, so that
+        a single crawler can't take the whole queue.
+        :param lease_time: seconds for the leases to expire. If None, the session default is used.
+        :return: [list of leased search requests, completion progress of the session]
+        :raises ValueError: if the lease time is not valid or max_requests is negative.
+        """
+        lease_time = self._get_lease_time(lease_time)
+
+        if max_requests < 0:
+            raise ValueError("The number of requests to lease can't be negative.")
+
+        max_requests = min(max_requests, MAX_EXCHANGE_REQUESTS)
+
+        for search_request in finished_requests or []:
+            self.add_history_entry(search_request)
+
+        for search_request in failed_requests or []:
+            self.reset_search_request(search_request)
+
+        leased_requests = []
+
+        while len(leased_requests) < max_requests:
+            search_request = self.pop_new_search_request(lease_time)
+
+            if search_request is None:
+                break
+
+            leased_requests.append(search_request)
+
+        return leased_requests, self.get_completion_progress()
 
     def size(self):
         """
@@ -82,10 +462,19 @@ class SearchSession(Service):
 
         with self.lock:
 
-            length = len(self.search_requests)
+            length = self.store.count_pending()
 
         return length
 
+    def get_next_priority(self):
+        """
+        :return: priority of the next search request to be handed out, or None if there are no pending requests.
+        """
+        with self.lock:
+            result = self.store.get_next_pending_priority()
+
+        return result
+
     def get_start_time(self):
         """
         Returns the time at which the session was started.
@@ -98,25 +487,71 @@ class SearchSession(Service):
         """
 
         with self.lock:
+            result = self._get_completion_progress()
 
-            if len(self.search_requests) + len(self.search_history) == 0:
-                result = 0
-            else:
-                result = int(len(self.search_history) / (
-                            len(self.search_requests) + len(self.search_in_progress) + len(self.search_history)) * 100)
+        return result
+
+    def _get_completion_progress(self):
+        """
+        Must be invoked with the lock acquired.
+        :return: the % of completion done.
+        """
+        pending_count = self.store.count_pending()
+        history_count = self.store.count_history()
+
+        if pending_count + history_count == 0:
+            result = 0
+        else:
+            result = int(history_count / (pending_count + self.store.count_in_progress() + history_count) * 100)
+
+        return result
+
+    def wait_for_completion_progress(self, progress, timeout=PROGRESS_WAIT_TIME):
+        """
+        Waits for the completion progress to be different than the given one, so that the progress can be followed
+        without polling it.
+        :param progress: completion progress already known by the caller.
+        :param timeout: maximum seconds to wait.
+        :return: the % of completion done, which is the given one if it didn't change before the timeout.
+        """
+        with self.progress_condition:
+            self.progress_condition.wait_for(lambda: self._get_completion_progress() != progress, timeout)
+            result = self._get_completion_progress()
 
         return result
 
     def get_history(self):
         """
 
-        :return: the search history dictionary. The search requests are indexed by their hash.
+        :return: the search history dictionary. The search requests are indexed by their id.
         """
         with self.lock:
-            history = dict (self.search_history)
+            search_history = self.store.get_history()
+
+        history = {search_request.get_id(): search_request for search_request in search_history}
 
         return history
 
+    def get_history_since(self, since=0, limit=None):
+        """
+        Change feed of the history. Retrieves the history entries added after the given sequence number, in the
+        order they were added. The cost is proportional to the number of entries retrieved.
+
+        Entries that were removed from the history afterwards (by a reset) are skipped. An entry added again to the
+        history is retrieved again.
+        :param since: sequence number of the last entry already consumed (0 to start from the beginning).
+        :param limit: maximum number of entries to retrieve. None for no limit.
+        :return: [list of search requests, sequence number to continue from]
+        :raises ValueError: if since or limit are negative.
+        """
+        if since < 0 or (limit is not None and limit < 0):
+            raise ValueError("The sequence number and the limit of the history can't be negative.")
+
+        with self.lock:
+            result = self.store.get_history_since(since, limit)
+
+        return result
+
     def mark_as_finished(self):
         """
         Marks teh current session as finished.
@@ -144,8 +579,10 @@ class SearchSession(Service):
         """
         Freezes the thread until the process is finished.
         """
-        while self.get_completion_progress() != 100:
-            time.sleep(1)
+        progress = self.get_completion_progress()
+
+        while progress != 100:
+            progress = self.wait_for_completion_progress(progress)
 
     def reset(self):
         """
@@ -155,10 +592,12 @@ class SearchSession(Service):
         :return:
         """
         with self.lock:
-            new_request_list = list(self.search_history.values())  # + list(self.search_in_progress.values())
+            new_request_list = self.store.get_history()
             self.start_time = time.time()
             self.finish_time = 0
-            self.search_history = {}
+            self.store.clear_history()
+            self._journal(JOURNAL_RESET, self.start_time)
+            self._commit()
 
         self.append_search_requests(new_request_list)
 
@@ -170,12 +609,15 @@ class SearchSession(Service):
         :return:
         """
         append = False
+        search_id = search_request.get_id()
 
         with self.lock:
-            if search_request.__hash__() in self.search_in_progress:
-                self.search_in_progress.pop(search_request.__hash__())
+            if self.store.remove_in_progress(search_id):
+                self._revoke_lease(search_id)
+                self._journal(JOURNAL_RESET_REQUEST, search_id)
+                self._commit()
 
-            if search_request.__hash__() not in self.search_requests:
+            if not self.store.has_pending(search_id):
                 append = True
 
         if append:
@@ -183,16 +625,14 @@ class SearchSession(Service):
 
     def save_session(self, filename, dump_in_progress_as_pending=True):
         """
-        Saves the current session in a file in JSON format.
+        Saves the current session in a file in NDJSON format (see stream_serialize()).
         :param dump_in_progress_as_pending:
         :param filename: URI to the file.
         :return: True if could be saved. False otherwise.
         """
-        serial = self.serialize(dump_in_progress_as_pending)
-
         try:
             with open(filename, 'w') as outfile:
-                json.dump(serial, outfile, indent=4, sort_keys=True)
+                outfile.writelines(self.stream_serialize(dump_in_progress_as_pending))
 
             result = True
             logging.info("Session file saved in {}".format(filename))
@@ -204,16 +644,15 @@ class SearchSession(Service):
 
     def load_session(self, filename, load_in_progress_as_pending=True):
         """
-        Loads the current session from a file.
+        Loads the current session from a file, either in NDJSON format or in the JSON format of the older versions.
         :param load_in_progress_as_pending:
         :param filename: URI to the file.
         :return: True if could be loaded. False otherwise.
         """
         try:
             with open(filename, 'r') as infile:
-                data = json.load(infile)
+                self.stream_deserialize(infile, load_in_progress_as_pending)
 
-            self.deserialize(data, load_in_progress_as_pending)
             result = True
             logging.info("Session loaded from file {}".format(filename))
         except:
@@ -229,24 +668,143 @@ class SearchSession(Service):
         search requests
         :return: the serialized version of this session.
         """
+        # Only the collections are retrieved under the lock (see SessionStore). The search requests are not modified
+        # once they are in the session, so they can be serialized outside of it without blocking the crawlers.
         with self.lock:
+            search_requests = self.store.get_pending()
+            search_history = self.store.get_history()
+            search_in_progress = self.store.get_all_in_progress()
 
-            data = {'search_requests': [self.search_requests[search_request_hash].serialize() for search_request_hash in
-                                        self.search_requests],
-                    'search_history': [self.search_history[search_request_hash].serialize() for search_request_hash in
-                                       self.search_history]}
+        data = {'search_requests': [search_request.serialize() for search_request in search_requests],
+                'search_history': [search_request.serialize() for search_request in search_history]}
 
-            if dump_in_progress_as_pending:
-                data['search_requests'] += [self.search_in_progress[search_request_hash].serialize() for search_request_hash
-                                            in self.search_in_progress]
-                logging.info("Search-request in progress dumped as new search_request: {}".format(data))
-            else:
-                data['search_in_progress'] = [self.search_in_progress[search_request_hash].serialize() for
-                                              search_request_hash in self.search_in_progress]
-                logging.info("Search-request in progress dumped: {}".format(data))
+        in_progress = [search_request.serialize() for search_request in search_in_progress]
+
+        if dump_in_progress_as_pending:
+            data['search_requests'] += in_progress
+            logging.info("{} search-requests in progress dumped as new search_request".format(len(in_progress)))
+        else:
+            data['search_in_progress'] = in_progress
+            logging.info("{} search-requests in progress dumped".format(len(in_progress)))
 
         return data
 
+    def stream_serialize(self, dump_in_progress_as_pending=True):
+        """
+        Serializes the current search session in NDJSON format, one search request at a time, so that the whole
+        document is never built in memory.
+
+        The first line is a header {'format', 'version', 'start_time'}. Each following line is a search request:
+        {'section': 'search_requests' | 'search_history' | 'search_in_progress', 'search_request': serialized request}
+        :param dump_in_progress_as_pending: if set to True, the in-progress requests are dumped as pending requests.
+        :return: generator of lines (with the line terminator included).
+        """
+        with self.lock:
+            search_requests = self.store.get_pending()
+            search_history = self.store.get_history()
+            search_in_progress = self.store.get_all_in_progress()
+            start_time = self.start_time
+
+        in_progress_section = SECTION_SEARCH_REQUESTS if dump_in_progress_as_pending else SECTION_SEARCH_IN_PROGRESS
+
+        yield self._to_line({'format': SESSION_STREAM_FORMAT, 'version': SESSION_STREAM_VERSION,
+                             'start_time': start_time})
+
+        for section, section_requests in [(SECTION_SEARCH_REQUESTS, search_requests),
+                                          (SECTION_SEARCH_HISTORY, search_history),
+                                          (in_progress_section, search_in_progress)]:
+            for search_request in section_requests:
+                yield self._to_line({'section': section, 'search_request': search_request.serialize()})
+
+    @staticmethod
+    def _to_line(serial):
+        return json.dumps(serial, separators=(',', ':')) + "\n"
+
+    def stream_deserialize(self, lines, load_in_progress_as_pending=True):
+        """
+        Replaces the content of the session with the search requests read from the NDJSON lines generated by
+        stream_serialize(). The lines are parsed one by one, and the content is swapped atomically at the end: the
+        crawlers keep working with the previous content meanwhile, and there is no need to drain the session before.
+
+        For backwards compatibility, a session in the JSON format of serialize() is also accepted (in a single line or
+        indented).
+        :param lines: iterable of lines (str or bytes), like an open file.
+        :param load_in_progress_as_pending: if set to True, the in-progress requests are loaded as pending requests.
+        Otherwise they are loaded as in progress, with a new lease.
+        :raises ValueError: if the lines are malformed.
+        """
+        lines = iter(lines)
+        first_line = next(lines, "{}")
+
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            # Sessions saved by older versions are a single JSON document, which may be indented in several lines.
+            header = json.loads(first_line + first_line[:0].join(lines))
+
+        if 'format' not in header and 'search_requests' in header:
+            self.deserialize(header, load_in_progress_as_pending)
+            return
+
+        if header.get('format') != SESSION_STREAM_FORMAT:
+            raise ValueError("Unknown format of the session stream.")
+
+        staging_store = self.store.create_staging()
+
+        try:
+            self._fill_staging_store(staging_store, lines, load_in_progress_as_pending)
+        except Exception:
+            staging_store.remove()
+            raise
+
+        snapshot = None
+
+        with self.lock:
+            self.store.replace_with(staging_store)
+            self._clear_leases()
+            self._grant_leases_in_progress()
+            self._commit()
+            counts = [self.store.count_pending(), self.store.count_history(), self.store.count_in_progress()]
+
+            # The new content is persisted as a snapshot instead of journaling it record by record under the lock.
+            # The journal is rotated with a barrier: until the snapshot is written, a crash recovers the previous
+            # content, and the records journaled for the new content meanwhile are discarded.
+            if self.journal:
+                snapshot = self._capture_snapshot(replaced=True)
+
+        if snapshot:
+            self._write_snapshot(*snapshot)
+
+        logging.info("Session content replaced: {} pending, {} in history, {} in progress".format(*counts))
+
+    @staticmethod
+    def _fill_staging_store(staging_store, lines, load_in_progress_as_pending):
+        """
+        Puts the search requests read from the NDJSON lines in the staging store.
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                record = json.loads(line)
+                section = record['section']
+                search_request = SearchRequest.deserialize(record['search_request'])
+            except (KeyError, TypeError) as ex:
+                raise ValueError("Malformed line in the session stream: {}".format(ex))
+
+            if section == SECTION_SEARCH_IN_PROGRESS and load_in_progress_as_pending:
+                section = SECTION_SEARCH_REQUESTS
+
+            if section == SECTION_SEARCH_REQUESTS:
+                staging_store.put_pending(search_request)
+            elif section == SECTION_SEARCH_HISTORY:
+                staging_store.put_history(search_request)
+            elif section == SECTION_SEARCH_IN_PROGRESS:
+                staging_store.put_in_progress(search_request)
+            else:
+                raise ValueError("Unknown section in the session stream: {}".format(section))
+
     def deserialize(self, data, dump_in_progress_as_pending=True):
         """
         Builds the search requests for this session from the given JSON data.
@@ -256,27 +814,47 @@ class SearchSession(Service):
         :return:
         """
         with self.lock:
+            self._load_data(data, dump_in_progress_as_pending)
+            self._commit()
+
+            if self.journal:
+                self.journal.request_compaction()
 
-            assert ('search_requests' in data)
-            assert ('search_history' in data)
+    def _load_data(self, data, dump_in_progress_as_pending, restore_history_sequences=False):
+        """
+        Replaces the content of the session with the given JSON data. Must be invoked with the lock acquired.
+        :param restore_history_sequences: if True, the history entries keep the sequence numbers stored in the data
+        (a journal snapshot). Otherwise they are appended to the change feed.
+        """
+        history_sequences = data.get('history_sequences') if restore_history_sequences else None
 
-            self.search_requests = {}
-            self.search_history = {}
-            self.search_in_progress = {}
+        assert ('search_requests' in data)
+        assert ('search_history' in data)
 
-            for search_request_json in data['search_requests']:
-                search_request = SearchRequest.deserialize(search_request_json)
-                self.search_requests[search_request.__hash__()] = search_request
+        self.store.clear()
+        self._clear_leases()
+        self._journal(JOURNAL_CLEAR)
 
-            for search_request_json in data['search_history']:
-                search_request = SearchRequest.deserialize(search_request_json)
-                self.search_history[search_request.__hash__()] = search_request
+        for search_request_json in data['search_requests']:
+            search_request = SearchRequest.deserialize(search_request_json)
+            self.store.put_pending(search_request)
+            self._journal(JOURNAL_APPEND, search_request_json)
+
+        for index, search_request_json in enumerate(data['search_history']):
+            search_request = SearchRequest.deserialize(search_request_json)
+            self.store.put_history(search_request, history_sequences[index] if history_sequences else None)
+            self._journal(JOURNAL_HISTORY, search_request_json)
 
-            if 'search_in_progress' in data and dump_in_progress_as_pending:
-                for search_request_json in data['search_in_progress']:
-                    search_request = SearchRequest.deserialize(search_request_json)
-                    self.search_in_progress[search_request.__hash__()] = search_request
+        if restore_history_sequences and 'last_history_sequence' in data:
+            self.store.skip_history_sequence(data['last_history_sequence'])
 
+        if 'search_in_progress' in data and dump_in_progress_as_pending:
+            for search_request_json in data['search_in_progress']:
+                search_request = SearchRequest.deserialize(search_request_json)
+                self.store.put_in_progress(search_request)
+                self._grant_lease(search_request, self.lease_time)
+                self._journal(JOURNAL_APPEND, search_request_json)
+                self._journal(JOURNAL_POP, search_request.get_id())
 
     def __del__(self):
         self.stop()
\ No newline at end of file
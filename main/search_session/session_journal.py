@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import glob
+import json
+import logging
+import os
+import tempfile
+from threading import Lock
+
+__author__ = "Ivan de Paz Centeno"
+
+JOURNAL_EXTENSION = ".journal"
+SNAPSHOT_EXTENSION = ".snapshot"
+DEFAULT_COMPACT_EVERY = 10000  # records written before a new snapshot is taken
+BARRIER_RECORD = ["barrier"]  # first record of a journal file that can only be replayed over its own snapshot
+
+
+class SessionJournal(object):
+    """
+    Append-only journal for a search session.
+
+    Every change of the session is appended as a compact JSON record (one per line) to the current journal file.
+    From time to time the session state is compacted into a snapshot, and the journal files already covered by it are
+    discarded. After a crash, the session is rebuilt from the last snapshot plus the journal tail.
+
+    Files are stored as:
+        PATH.snapshot        -> {'generation': N, 'session': serialized session}
+        PATH.journal.N       -> records written after the snapshot of generation N was taken.
+
+    When the whole content of the session is replaced, the journal is rotated with a barrier: the records after it
+    only make sense over the snapshot of the new content. If there was a crash before that snapshot was written,
+    the journal is recovered up to the barrier, which is the previous content.
+    """
+
+    def __init__(self, path, compact_every=DEFAULT_COMPACT_EVERY, sync=False):
+        """
+        :param path: base path (without extension) for the journal files.
+        :param compact_every: number of records after which a compaction is suggested.
+        :param sync: if True, every record is fsync'ed to disk. Otherwise it is only flushed to the OS, which
+        survives a crash of the factory process but not of the host.
+        """
+        self.path = path
+        self.compact_every = compact_every
+        self.sync = sync
+        self.generation = 0
+        self.records_count = 0
+        self.compaction_requested = False
+        self.file = None
+        self.closed = False
+        self.snapshot_lock = Lock()
+        self.snapshot_generation = 0  # generation of the last snapshot written
+
+    def _get_journal_filename(self, generation):
+        return "{}{}.{}".format(self.path, JOURNAL_EXTENSION, generation)
+
+    def _get_snapshot_filename(self):
+        return "{}{}".format(self.path, SNAPSHOT_EXTENSION)
+
+    def _get_journal_generations(self):
+        generations = []
+
+        for filename in glob.glob("{}{}.*".format(glob.escape(self.path), JOURNAL_EXTENSION)):
+            try:
+                generations.append(int(filename.rsplit(".", 1)[1]))
+            except ValueError:
+                pass
+
+        return sorted(generations)
+
+    def exists(self):
+        """
+        :return: True if there is anything persisted for this journal.
+        """
+        return os.path.exists(self._get_snapshot_filename()) or len(self._get_journal_generations()) > 0
+
+    def recover(self):
+        """
+        Reads the persisted state of the session.
+        A truncated record at the end of a journal file (crash while writing) is discarded.
+        :return: [snapshot, records] where snapshot is the serialized session (or None if there is no snapshot) and
+        records is the list of journal records written after it, in order.
+        """
+        snapshot = None
+        snapshot_generation = 0
+
+        if os.path.exists(self._get_snapshot_filename()):
+            with open(self._get_snapshot_filename(), 'r') as infile:
+                content = json.load(infile)
+
+            snapshot = content['session']
+            snapshot_generation = content['generation']
+
+        records = []
+        generations = self._get_journal_generations()
+        barrier_reached = False
+
+        for generation in generations:
+            filename = self._get_journal_filename(generation)
+
+            if generation < snapshot_generation or barrier_reached:
+                os.remove(filename)
+                continue
+
+            with open(filename, 'r') as infile:
+                for index, line in enumerate(infile):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.info("Discarded truncated record in journal {}".format(filename))
+                        break
+
+                    if record == BARRIER_RECORD:
+                        # The content was replaced, but its snapshot was not written: the journal is recovered up
+                        # to the replacement.
+                        barrier_reached = index == 0 and generation > snapshot_generation
+
+                        if barrier_reached:
+                            logging.info("Discarded the journal after an unfinished replacement of the session")
+                            break
+
+                        continue
+
+                    records.append(record)
+
+            if barrier_reached:
+                os.remove(filename)
+
+        # Never append to a recovered file: its last line may be truncated.
+        self.generation = max(generations + [snapshot_generation]) + 1
+        self.records_count = len(records)
+        self.compaction_requested = len(records) > 0
+        self.snapshot_generation = snapshot_generation
+
+        return snapshot, records
+
+    def open(self):
+        self.file = open(self._get_journal_filename(self.generation), 'a')
+        self.closed = False
+
+    def record(self, record):
+        """
+        Appends a record to the journal.
+        :param record: JSON-ificable list. The first element is the operation code.
+        """
+        if self.closed:
+            return
+
+        if self.file is None:
+            self.open()
+
+        self.file.write(json.dumps(record, separators=(',', ':')))
+        self.file.write("\n")
+        self.file.flush()
+
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+        self.records_count += 1
+
+    def request_compaction(self):
+        self.compaction_requested = True
+
+    def needs_compaction(self):
+        return self.compaction_requested or self.records_count >= self.compact_every
+
+    def rotate(self, barrier=False):
+        """
+        Starts a new journal file. Must be invoked atomically with the capture of the session state that is going to
+        be written as snapshot.
+        :param barrier: True if the session content was replaced, so the new file can't be replayed over the previous
+        snapshot.
+        :return: the generation that the snapshot must be written with.
+        """
+        if self.file:
+            self.file.close()
+
+        self.generation += 1
+        self.records_count = 0
+        self.compaction_requested = False
+        self.open()
+
+        if barrier:
+            self.record(BARRIER_RECORD)
+            self.records_count = 0
+
+        return self.generation
+
+    def write_snapshot(self, session_data, generation):
+        """
+        Atomically replaces the snapshot, and discards the journal files that are covered by it. Snapshots may be
+        written concurrently (a compaction and a replacement of the content): they are written one at a time, and a
+        snapshot older than the last one written is skipped.
+        :param session_data: serialized session.
+        :param generation: generation returned by rotate() when the session state was captured.
+        :return: True if written, False if skipped.
+        """
+        snapshot_filename = self._get_snapshot_filename()
+
+        with self.snapshot_lock:
+            if generation <= self.snapshot_generation:
+                logging.info("Session snapshot of generation {} skipped: generation {} is already written".format(
+                    generation, self.snapshot_generation))
+                return False
+
+            file_descriptor, temp_filename = tempfile.mkstemp(prefix=os.path.basename(snapshot_filename) + ".",
+                                                              suffix=".tmp",
+                                                              dir=os.path.dirname(snapshot_filename) or ".")
+
+            try:
+                with os.fdopen(file_descriptor, 'w') as outfile:
+                    json.dump({'generation': generation, 'session': session_data}, outfile, separators=(',', ':'))
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+
+                os.replace(temp_filename, snapshot_filename)
+            except Exception:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise
+
+            self.snapshot_generation = generation
+
+            for old_generation in self._get_journal_generations():
+                if old_generation < generation:
+                    os.remove(self._get_journal_filename(old_generation))
+
+        logging.info("Session snapshot written in {} (generation {})".format(snapshot_filename, generation))
+
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+        self.closed = True
+
+    def remove(self):
+        """
+        Closes the journal and removes all its files from disk.
+        """
+        self.close()
+
+        filenames = [self._get_journal_filename(generation) for generation in self._get_journal_generations()]
+        filenames.append(self._get_snapshot_filename())
+
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from main.search_session.search_request_queue import SearchRequestQueue
+from main.search_session.session_store.session_store import SessionStore
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Session store that keeps all the search requests in memory. It is the default store; combine it with a
+    SessionJournal to survive restarts.
+    """
+
+    def __init__(self):
+        self.search_requests = SearchRequestQueue()
+        self.search_in_progress = {}  # id: request
+        self.search_history = {}  # id: request
+        self.history_feed = []  # ids of the history entries in the order they were added. Entry i has sequence i+1.
+        self.history_sequences = {}  # id: sequence of its latest entry in the feed
+
+    def put_pending(self, search_request):
+        self.search_requests.put(search_request)
+
+    def pop_next_pending(self):
+        return self.search_requests.pop_next()
+
+    def get_next_pending_priority(self):
+        return self.search_requests.get_next_priority()
+
+    def remove_pending(self, search_id):
+        return self.search_requests.pop(search_id, None)
+
+    def has_pending(self, search_id):
+        return search_id in self.search_requests
+
+    def count_pending(self):
+        return len(self.search_requests)
+
+    def get_pending(self):
+        return self.search_requests.values()
+
+    def put_in_progress(self, search_request):
+        self.search_in_progress[search_request.get_id()] = search_request
+
+    def remove_in_progress(self, search_id):
+        return self.search_in_progress.pop(search_id, None)
+
+    def get_in_progress(self, search_id):
+        return self.search_in_progress.get(search_id, None)
+
+    def has_in_progress(self, search_id):
+        return search_id in self.search_in_progress
+
+    def count_in_progress(self):
+        return len(self.search_in_progress)
+
+    def get_all_in_progress(self):
+        return list(self.search_in_progress.values())
+
+    def put_history(self, search_request, sequence=None):
+        search_id = search_request.get_id()
+
+        if sequence is not None:
+            self.skip_history_sequence(sequence - 1)
+
+        # Removed first, so the history keeps the order of the feed.
+        self.search_history.pop(search_id, None)
+        self.search_history[search_id] = search_request
+        self.history_feed.append(search_id)
+        self.history_sequences[search_id] = len(self.history_feed)
+
+    def get_last_history_sequence(self):
+        return len(self.history_feed)
+
+    def skip_history_sequence(self, sequence):
+        if sequence > len(self.history_feed):
+            self.history_feed.extend([None] * (sequence - len(self.history_feed)))
+
+    def get_history_with_sequences(self):
+        return [[self.history_sequences[search_id], search_request] for search_id, search_request in
+                self.search_history.items()]
+
+    def has_history(self, search_id):
+        return search_id in self.search_history
+
+    def count_history(self):
+        return len(self.search_history)
+
+    def get_history(self):
+        return list(self.search_history.values())
+
+    def get_history_since(self, since=0, limit=None):
+        if limit is None:
+            feed_ids = self.history_feed[since:]
+        else:
+            feed_ids = self.history_feed[since:since + limit]
+
+        # Only the latest entry of a request is retrieved; older entries of the same request are skipped.
+        search_requests = [self.search_history[search_id] for sequence, search_id in enumerate(feed_ids, since + 1)
+                           if search_id in self.search_history and self.history_sequences[search_id] == sequence]
+
+        return search_requests, since + len(feed_ids)
+
+    def clear_history(self):
+        self.search_history = {}
+        self.history_sequences = {}
+
+    def clear(self):
+        self.search_requests = SearchRequestQueue()
+        self.search_in_progress = {}
+        self.clear_history()
+
+    def create_staging(self):
+        return MemorySessionStore()
+
+    def replace_with(self, staging_store):
+        self.search_requests = staging_store.search_requests
+        self.search_in_progress = staging_store.search_in_progress
+        self.search_history = staging_store.search_history
+
+        offset = len(self.history_feed)
+        self.history_feed.extend(staging_store.history_feed)
+        self.history_sequences = {search_id: sequence + offset for search_id, sequence in
+                                  staging_store.history_sequences.items()}
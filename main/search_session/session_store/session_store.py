@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class SessionStore(object):
+    """
+    Storage of the search requests of a search session.
+
+    A session keeps its search requests in three collections:
+        - pending: requests waiting to be processed, handed out following the scheduling policy of
+          SearchRequestQueue (by priority, and round-robin across search engines and keyword groups).
+        - in progress: requests popped by a crawler and not reported yet.
+        - history: requests already processed, with their results. The history also works as a change feed: every
+          entry gets a sequence number, and the entries added after a given sequence number can be retrieved.
+
+    The search requests are identified by their id (SearchRequest.get_id()).
+
+    The store is not thread-safe: the session invokes it with its lock acquired. The collections retrieved with
+    get_pending(), get_all_in_progress(), get_history() and get_history_with_sequences() are the exception: they
+    reflect the content at the moment of the call, and can be consumed once afterwards without the lock.
+    """
+
+    def is_persistent(self):
+        """
+        :return: True if the store survives a restart of the process by itself (so it doesn't need to be journaled).
+        """
+        return False
+
+    def put_pending(self, search_request):
+        """
+        Enqueues the search request as pending. If a request with the same id is already pending, it is updated in
+        place and keeps its turn.
+        This is a virtual method and must be overriden.
+        """
+        raise NotImplementedError()
+
+    def pop_next_pending(self):
+        """
+        Dequeues the next pending search request, following the scheduling policy.
+        This is a virtual method and must be overriden.
+        :return: the search request, or None if there are no pending requests.
+        """
+        raise NotImplementedError()
+
+    def get_next_pending_priority(self):
+        """
+        This is a virtual method and must be overriden.
+        :return: priority of the next pending search request to be popped, or None if there are no pending requests.
+        """
+        raise NotImplementedError()
+
+    def remove_pending(self, search_id):
+        """
+        This is a virtual method and must be overriden.
+        :return: the removed pending search request, or None if it was not pending.
+        """
+        raise NotImplementedError()
+
+    def has_pending(self, search_id):
+        raise NotImplementedError()
+
+    def count_pending(self):
+        raise NotImplementedError()
+
+    def get_pending(self):
+        """
+        :return: iterable of pending search requests.
+        """
+        raise NotImplementedError()
+
+    def put_in_progress(self, search_request):
+        raise NotImplementedError()
+
+    def remove_in_progress(self, search_id):
+        """
+        This is a virtual method and must be overriden.
+        :return: the removed search request in progress, or None if it was not in progress.
+        """
+        raise NotImplementedError()
+
+    def get_in_progress(self, search_id):
+        """
+        :return: the search request in progress with the given id, or None.
+        """
+        raise NotImplementedError()
+
+    def has_in_progress(self, search_id):
+        raise NotImplementedError()
+
+    def count_in_progress(self):
+        raise NotImplementedError()
+
+    def get_all_in_progress(self):
+        """
+        :return: iterable of search requests in progress.
+        """
+        raise NotImplementedError()
+
+    def put_history(self, search_request, sequence=None):
+        """
+        Adds the search request to the history, replacing any previous entry with the same id, and appends it to the
+        change feed.
+        This is a virtual method and must be overriden.
+        :param sequence: sequence number for the entry, to restore a persisted feed. It is ignored unless it is
+        greater than the last sequence number. If None, the next sequence number is used.
+        """
+        raise NotImplementedError()
+
+    def get_last_history_sequence(self):
+        """
+        :return: sequence number of the last entry added to the change feed (0 if none).
+        """
+        raise NotImplementedError()
+
+    def skip_history_sequence(self, sequence):
+        """
+        Advances the change feed so that the next entry gets a sequence number greater than the given one. Used to
+        restore a persisted feed whose last entries were removed from the history.
+        """
+        raise NotImplementedError()
+
+    def get_history_with_sequences(self):
+        """
+        :return: iterable of [sequence number, search request] of the history, in the order of the change feed.
+        """
+        raise NotImplementedError()
+
+    def has_history(self, search_id):
+        raise NotImplementedError()
+
+    def count_history(self):
+        raise NotImplementedError()
+
+    def get_history(self):
+        """
+        :return: iterable of search requests in the history.
+        """
+        raise NotImplementedError()
+
+    def get_history_since(self, since=0, limit=None):
+        """
+        Retrieves the history entries added after the given sequence number, in the order they were added. Entries
+        removed from the history afterwards are skipped.
+        This is a virtual method and must be overriden.
+        :param since: sequence number of the last entry already consumed (0 to start from the beginning).
+        :param limit: maximum number of entries to retrieve. None for no limit.
+        :return: [list of search requests, sequence number to continue from]
+        """
+        raise NotImplementedError()
+
+    def clear_history(self):
+        """
+        Removes all the entries of the history. Sequence numbers are not reused, so the cursors of the change feed
+        keep being valid.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        """
+        Removes all the search requests of the store.
+        """
+        raise NotImplementedError()
+
+    def create_staging(self):
+        """
+        Creates an empty store of the same kind, to be filled and then swapped in with replace_with(). This way the
+        content of a store can be replaced without holding the lock of the session while it is built.
+        This is a virtual method and must be overriden.
+        """
+        raise NotImplementedError()
+
+    def replace_with(self, staging_store):
+        """
+        Replaces the content of this store with the content of the given staging store, which is consumed.
+        This is a virtual method and must be overriden.
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """
+        Commits the writes done so far, if the store groups them. The session invokes it at the end of every operation
+        that modifies the store.
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def remove(self):
+        """
+        Closes the store and removes its persisted content, if any.
+        """
+        self.close()
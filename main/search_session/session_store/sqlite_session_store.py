@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+
+from main.search_session.search_request import SearchRequest
+from main.search_session.session_store.session_store import SessionStore
+
+__author__ = "Ivan de Paz Centeno"
+
+DEFAULT_BATCH_SIZE = 1000  # writes grouped in a single transaction
+STAGING_EXTENSION = ".staging"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, "
+    "priority INTEGER NOT NULL, engine TEXT NOT NULL, grp TEXT NOT NULL, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pending_schedule ON pending (priority, engine, grp, seq)",
+    "CREATE TABLE IF NOT EXISTS in_progress (id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS history (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, "
+    "data TEXT NOT NULL)",
+]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by an SQLite database in WAL mode, so that the memory used by a session doesn't depend on
+    its size and its content survives a restart of the factory.
+
+    The search requests are stored serialized in three tables (pending, in_progress and history). The sequence
+    number of a history entry is its row key, which is never reused.
+
+    Only the scheduling state is kept in memory: the number of pending requests of each (priority, search engine,
+    group), in the same rotating order as SearchRequestQueue. Popping a request is then an indexed lookup of the
+    oldest pending request of the group whose turn it is.
+
+    The writes of a session operation are grouped in a single transaction, which is committed when the session
+    invokes flush() at the end of the operation (or before, when it reaches batch_size writes). Once an operation
+    returns, its writes survive a crash of the process. With synchronous=NORMAL, a crash of the host may still lose
+    the last committed operations, but never corrupts the database.
+
+    The collections are retrieved as generators over a separate connection, so they read a consistent snapshot of
+    the database (WAL readers are isolated from the writes done afterwards) and are deserialized as they are
+    consumed, without the lock of the session.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param path: filename of the database. It is created if it doesn't exist.
+        :param batch_size: maximum number of writes in a single transaction.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.writes_count = 0
+        self.levels = {}  # priority: OrderedDict(engine: OrderedDict(group: count of pending requests))
+        self.priorities = []  # sorted descending
+        self.pending_count = 0
+        self.in_progress_count = 0
+        self.history_count = 0
+
+        # The store is only accessed with the lock of the session acquired, from different threads.
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+
+        self._load_state()
+
+    def _load_state(self):
+        self.levels = {}
+        self.priorities = []
+        self.pending_count = 0
+
+        for priority, engine, group, count in self.connection.execute(
+                "SELECT priority, engine, grp, COUNT(*) FROM pending GROUP BY priority, engine, grp ORDER BY MIN(seq)"):
+            self._add_to_schedule(priority, engine, group, count)
+
+        self.in_progress_count = self.connection.execute("SELECT COUNT(*) FROM in_progress").fetchone()[0]
+        self.history_count = self.connection.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def _write(self, statement, parameters=()):
+        """
+        Executes a write statement inside the current batch.
+        """
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN")
+
+        cursor = self.connection.execute(statement, parameters)
+        self.writes_count += 1
+
+        if self.writes_count >= self.batch_size:
+            self.flush()
+
+        return cursor
+
+    @staticmethod
+    def _serialize(search_request):
+        return json.dumps(search_request.serialize(), separators=(',', ':'))
+
+    @staticmethod
+    def _deserialize(data):
+        return SearchRequest.deserialize(json.loads(data))
+
+    @staticmethod
+    def _get_schedule_key(search_request):
+        return search_request.get_priority(), str(search_request.get_search_engine_proto()), \
+               str(search_request.get_group())
+
+    def _add_to_schedule(self, priority, engine, group, count=1):
+        if priority not in self.levels:
+            self.levels[priority] = OrderedDict()
+            self.priorities.append(priority)
+            self.priorities.sort(reverse=True)
+
+        engines = self.levels[priority]
+
+        if engine not in engines:
+            engines[engine] = OrderedDict()
+
+        groups = engines[engine]
+        groups[group] = groups.get(group, 0) + count
+        self.pending_count += count
+
+    def _remove_from_schedule(self, priority, engine, group, count=1):
+        engines = self.levels[priority]
+        groups = engines[engine]
+        groups[group] -= count
+        self.pending_count -= count
+
+        if groups[group] <= 0:
+            del groups[group]
+
+        if not groups:
+            del engines[engine]
+
+        if not engines:
+            del self.levels[priority]
+            self.priorities.remove(priority)
+
+    def is_persistent(self):
+        return True
+
+    def put_pending(self, search_request):
+        search_id = search_request.get_id()
+        data = self._serialize(search_request)
+        priority, engine, group = self._get_schedule_key(search_request)
+
+        # Same behaviour as SearchRequestQueue: updated in place unless its priority or group changed.
+        if self._write("UPDATE pending SET data = ? WHERE id = ? AND priority = ? AND engine = ? AND grp = ?",
+                       (data, search_id, priority, engine, group)).rowcount > 0:
+            return
+
+        self.remove_pending(search_id)
+        self._write("INSERT INTO pending (id, priority, engine, grp, data) VALUES (?, ?, ?, ?, ?)",
+                    (search_id, priority, engine, group, data))
+        self._add_to_schedule(priority, engine, group)
+
+    def pop_next_pending(self):
+        search_request = None
+
+        while search_request is None and self.priorities:
+            priority = self.priorities[0]
+            engines = self.levels[priority]
+
+            engine, groups = next(iter(engines.items()))
+            group = next(iter(groups))
+
+            row = self.connection.execute(
+                "SELECT seq, data FROM pending WHERE priority = ? AND engine = ? AND grp = ? ORDER BY seq LIMIT 1",
+                (priority, engine, group)).fetchone()
+
+            if row is None:
+                logging.info("Pending requests of group {} not found in the store. Skipped.".format(group))
+                self._remove_from_schedule(priority, engine, group, groups[group])
+                continue
+
+            self._write("DELETE FROM pending WHERE seq = ?", (row[0],))
+            self._remove_from_schedule(priority, engine, group)
+            search_request = self._deserialize(row[1])
+
+            # Rotate the rings so the next pop goes for a different group and engine.
+            if group in groups:
+                groups.move_to_end(group)
+
+            if engine in engines:
+                engines.move_to_end(engine)
+
+        return search_request
+
+    def get_next_pending_priority(self):
+        return self.priorities[0] if self.priorities else None
+
+    def remove_pending(self, search_id):
+        row = self.connection.execute("SELECT priority, engine, grp, data FROM pending WHERE id = ?",
+                                      (search_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        self._write("DELETE FROM pending WHERE id = ?", (search_id,))
+        self._remove_from_schedule(row[0], row[1], row[2])
+
+        return self._deserialize(row[3])
+
+    def _iterate_snapshot(self, query):
+        """
+        Retrieves the search requests of the query from a snapshot of the committed content.
+        :param query: SELECT statement whose last column is the serialized search request.
+        :return: generator of the rows, with the serialized search request replaced by the search request.
+        """
+        self.flush()
+
+        # The statement is started here, so the snapshot is the content at the moment of the call and not when the
+        # generator is consumed.
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        cursor = connection.execute(query)
+
+        return self._deserialize_rows(connection, cursor)
+
+    @classmethod
+    def _deserialize_rows(cls, connection, cursor):
+        try:
+            for row in cursor:
+                yield row[:-1] + (cls._deserialize(row[-1]),)
+        finally:
+            connection.close()
+
+    def has_pending(self, search_id):
+        return self.connection.execute("SELECT 1 FROM pending WHERE id = ?", (search_id,)).fetchone() is not None
+
+    def count_pending(self):
+        return self.pending_count
+
+    def get_pending(self):
+        return (row[0] for row in self._iterate_snapshot("SELECT data FROM pending ORDER BY seq"))
+
+    def put_in_progress(self, search_request):
+        if not self.has_in_progress(search_request.get_id()):
+            self.in_progress_count += 1
+
+        self._write("INSERT OR REPLACE INTO in_progress (id, data) VALUES (?, ?)",
+                    (search_request.get_id(), self._serialize(search_request)))
+
+    def remove_in_progress(self, search_id):
+        search_request = self.get_in_progress(search_id)
+
+        if search_request is not None:
+            self._write("DELETE FROM in_progress WHERE id = ?", (search_id,))
+            self.in_progress_count -= 1
+
+        return search_request
+
+    def get_in_progress(self, search_id):
+        row = self.connection.execute("SELECT data FROM in_progress WHERE id = ?", (search_id,)).fetchone()
+
+        return None if row is None else self._deserialize(row[0])
+
+    def has_in_progress(self, search_id):
+        return self.connection.execute("SELECT 1 FROM in_progress WHERE id = ?", (search_id,)).fetchone() is not None
+
+    def count_in_progress(self):
+        return self.in_progress_count
+
+    def get_all_in_progress(self):
+        return (row[0] for row in self._iterate_snapshot("SELECT data FROM in_progress"))
+
+    def put_history(self, search_request, sequence=None):
+        search_id = search_request.get_id()
+
+        # Removed and inserted again, so the entry gets a new sequence number and is retrieved again by the feed.
+        if self._write("DELETE FROM history WHERE id = ?", (search_id,)).rowcount == 0:
+            self.history_count += 1
+
+        if sequence is not None and sequence > self.get_last_history_sequence():
+            self._write("INSERT INTO history (seq, id, data) VALUES (?, ?, ?)",
+                        (sequence, search_id, self._serialize(search_request)))
+        else:
+            self._write("INSERT INTO history (id, data) VALUES (?, ?)", (search_id, self._serialize(search_request)))
+
+    def get_last_history_sequence(self):
+        row = self.connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'history'").fetchone()
+
+        return 0 if row is None else row[0]
+
+    def skip_history_sequence(self, sequence):
+        if sequence <= self.get_last_history_sequence():
+            return
+
+        if self._write("UPDATE sqlite_sequence SET seq = ? WHERE name = 'history'", (sequence,)).rowcount == 0:
+            self._write("INSERT INTO sqlite_sequence (name, seq) VALUES ('history', ?)", (sequence,))
+
+    def get_history_with_sequences(self):
+        return ([row[0], row[1]] for row in self._iterate_snapshot("SELECT seq, data FROM history ORDER BY seq"))
+
+    def has_history(self, search_id):
+        return self.connection.execute("SELECT 1 FROM history WHERE id = ?", (search_id,)).fetchone() is not None
+
+    def count_history(self):
+        return self.history_count
+
+    def get_history(self):
+        return (row[0] for row in self._iterate_snapshot("SELECT data FROM history ORDER BY seq"))
+
+    def get_history_since(self, since=0, limit=None):
+        rows = self.connection.execute("SELECT seq, data FROM history WHERE seq > ? ORDER BY seq LIMIT ?",
+                                       (since, -1 if limit is None else limit)).fetchall()
+
+        next_sequence = rows[-1][0] if rows else since
+
+        return [self._deserialize(row[1]) for row in rows], next_sequence
+
+    def clear_history(self):
+        self._write("DELETE FROM history")
+        self.history_count = 0
+
+    def clear(self):
+        self._write("DELETE FROM pending")
+        self._write("DELETE FROM in_progress")
+        self.clear_history()
+        self._load_state()
+
+    def create_staging(self):
+        staging_path = "{}{}".format(self.path, STAGING_EXTENSION)
+        self._remove_files(staging_path)
+
+        return SQLiteSessionStore(staging_path, self.batch_size)
+
+    def replace_with(self, staging_store):
+        """
+        Copies the content of the staging store inside this one, in a single transaction. The history entries get new
+        sequence numbers after the existing ones, so the cursors of the change feed keep being valid.
+        """
+        staging_store.close()
+        self.flush()
+
+        self.connection.execute("ATTACH DATABASE ? AS staging", (staging_store.path,))
+
+        try:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM pending")
+            self.connection.execute("DELETE FROM in_progress")
+            self.connection.execute("DELETE FROM history")
+            self.connection.execute("INSERT INTO pending (id, priority, engine, grp, data) "
+                                    "SELECT id, priority, engine, grp, data FROM staging.pending ORDER BY seq")
+            self.connection.execute("INSERT INTO in_progress (id, data) SELECT id, data FROM staging.in_progress")
+            self.connection.execute("INSERT INTO history (id, data) SELECT id, data FROM staging.history ORDER BY seq")
+            self.connection.execute("COMMIT")
+
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        finally:
+            self.connection.execute("DETACH DATABASE staging")
+            staging_store.remove()
+
+        self._load_state()
+
+    def flush(self):
+        if self.connection is not None and self.connection.in_transaction:
+            self.connection.execute("COMMIT")
+
+        self.writes_count = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def _remove_files(path):
+        for filename in [path, "{}-wal".format(path), "{}-shm".format(path)]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def remove(self):
+        self.close()
+        self._remove_files(self.path)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__author__ = "Ivan de Paz Centeno"
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+
+
+class JsonCodec(object):
+
+    @staticmethod
+    def encode(content):
+        return json.dumps(content, separators=(',', ':')).encode()
+
+    @staticmethod
+    def decode(data):
+        if isinstance(data, bytes):
+            data = data.decode()
+
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+
+    @staticmethod
+    def encode(content):
+        return msgpack.packb(content, use_bin_type=True)
+
+    @staticmethod
+    def decode(data):
+        return msgpack.unpackb(data, raw=False)
+
+
+# Codecs of the bodies of the REST endpoints, by content type. msgpack is only available if the msgpack package is
+# installed.
+CONTENT_CODECS = {CONTENT_TYPE_JSON: JsonCodec}
+
+if msgpack is not None:
+    CONTENT_CODECS[CONTENT_TYPE_MSGPACK] = MsgpackCodec
+
+# Content types accepted, by preference: the binary form is smaller and faster to encode and decode.
+SUPPORTED_CONTENT_TYPES = [content_type for content_type in [CONTENT_TYPE_MSGPACK, CONTENT_TYPE_JSON] if
+                           content_type in CONTENT_CODECS]
+
+
+def get_content_type(header):
+    """
+    :param header: value of a Content-Type header, like "application/json; charset=utf-8".
+    :return: the content type without parameters, in lower case.
+    """
+    return (header or "").split(";")[0].strip().lower()
+
+
+def parse_accept_header(header):
+    """
+    Parses the value of an Accept or Accept-Encoding header.
+    :param header: value like "application/msgpack, application/json;q=0.5".
+    :return: dictionary with the quality of each item, in lower case.
+    """
+    accepted = {}
+
+    for item in (header or "").split(","):
+        parts = item.strip().split(";")
+        quality = 1.0
+
+        for parameter in parts[1:]:
+            name, _, value = parameter.strip().partition("=")
+
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+
+        if parts[0].strip():
+            accepted[parts[0].strip().lower()] = quality
+
+    return accepted
+
+
+def choose_content_type(accept):
+    """
+    Picks the preferred content type among the ones accepted. JSON is the default, so clients that don't ask for
+    the binary form explicitly keep receiving JSON.
+    :param accept: value of an Accept header.
+    :return: the content type.
+    """
+    accepted = parse_accept_header(accept)
+    candidates = [content_type for content_type in SUPPORTED_CONTENT_TYPES if accepted.get(content_type, 0) > 0]
+
+    return candidates[0] if candidates else CONTENT_TYPE_JSON
+
+
+def encode(content, content_type=CONTENT_TYPE_JSON):
+    return CONTENT_CODECS[content_type].encode(content)
+
+
+def decode(data, content_type=CONTENT_TYPE_JSON):
+    """
+    :raises ValueError: if the content type is not supported or the data is malformed.
+    """
+    content_type = get_content_type(content_type) or CONTENT_TYPE_JSON
+
+    if content_type not in CONTENT_CODECS:
+        raise ValueError("Content type {} is not supported.".format(content_type))
+
+    try:
+        content = CONTENT_CODECS[content_type].decode(data)
+    except ValueError:
+        raise
+    except Exception as ex:
+        raise ValueError("Malformed {} content: {}".format(content_type, ex))
+
+    return content
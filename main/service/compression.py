@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import zlib
+
+from main.service.codec import parse_accept_header
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__author__ = "Ivan de Paz Centeno"
+
+ENCODING_GZIP = "gzip"
+ENCODING_ZSTD = "zstd"
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+MIN_COMPRESS_SIZE = 1024  # bytes. Smaller bodies are sent as they are, since the gain doesn't pay the CPU.
+CHUNK_SIZE = 65536
+MAX_DECOMPRESSED_SIZE = 512 * 1024 * 1024  # bytes of a decompressed request body, to stop decompression bombs
+ZSTD_STEP = 256  # bytes of zstd input decompressed at once: every 4 bytes may expand into a block of 128 KB.
+
+# Content types worth compressing.
+COMPRESSIBLE_CONTENT_TYPES = ["application/json", "application/x-ndjson", "application/msgpack", "text/"]
+
+
+class ContentTooLarge(Exception):
+    """
+    Raised when a compressed content expands beyond the size allowed.
+    """
+    pass
+
+
+class GzipCodec(object):
+
+    @staticmethod
+    def compressor():
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    @staticmethod
+    def decompressor():
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    @staticmethod
+    def decompress(decompressor, data, max_length):
+        """
+        :return: the decompressed content, up to max_length bytes (roughly), and the input not consumed yet.
+        """
+        return decompressor.decompress(data, max_length), decompressor.unconsumed_tail
+
+
+class ZstdCodec(object):
+
+    @staticmethod
+    def compressor():
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    @staticmethod
+    def decompressor():
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    @staticmethod
+    def decompress(decompressor, data, max_length):
+        # The decompressor can't bound its output, so the input is fed in small steps.
+        chunks = []
+        length = 0
+        position = 0
+
+        while position < len(data) and length < max_length:
+            chunk = decompressor.decompress(data[position:position + ZSTD_STEP])
+            chunks.append(chunk)
+            length += len(chunk)
+            position += ZSTD_STEP
+
+        return b"".join(chunks), data[position:]
+
+
+# Encodings supported, by preference. zstd is only available if the zstandard package is installed.
+CODECS = {ENCODING_GZIP: GzipCodec}
+
+if zstandard is not None:
+    CODECS[ENCODING_ZSTD] = ZstdCodec
+
+SUPPORTED_ENCODINGS = [encoding for encoding in [ENCODING_ZSTD, ENCODING_GZIP] if encoding in CODECS]
+
+
+def choose_encoding(accept_encoding):
+    """
+    Picks the preferred encoding among the ones accepted.
+    :param accept_encoding: value of an Accept-Encoding header, like "gzip, deflate;q=0.5, zstd;q=0".
+    :return: the encoding, or None if none of the supported ones is accepted.
+    """
+    accepted = parse_accept_header(accept_encoding)
+    candidates = [encoding for encoding in SUPPORTED_ENCODINGS if accepted.get(encoding, accepted.get("*", 0)) > 0]
+
+    return candidates[0] if candidates else None
+
+
+def is_compressible(content_type):
+    content_type = (content_type or "").lower()
+
+    return any(content_type.startswith(compressible) for compressible in COMPRESSIBLE_CONTENT_TYPES)
+
+
+def compress(data, encoding):
+    compressor = CODECS[encoding].compressor()
+
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, encoding):
+    decompressor = CODECS[encoding].decompressor()
+
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses a stream of chunks (bytes or str) on the fly.
+    :return: generator of compressed chunks.
+    """
+    compressor = CODECS[encoding].compressor()
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        compressed = compressor.compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Readable file-like object that decompresses on the fly the content of another one. Wrap it with
+    io.BufferedReader to read it line by line.
+    """
+
+    def __init__(self, stream, encoding, length=None, max_size=None):
+        """
+        :param stream: readable file-like object with compressed content.
+        :param encoding: encoding of the content.
+        :param length: size of the compressed content, if the stream goes beyond it (like a socket). None to read
+        until the end of the stream.
+        :param max_size: maximum size of the decompressed content. None for no limit.
+        """
+        io.RawIOBase.__init__(self)
+        self.stream = stream
+        self.remaining = length
+        self.max_size = max_size
+        self.codec = CODECS[encoding]
+        self.decompressor = self.codec.decompressor()
+        self.pending = b""  # compressed input not decompressed yet
+        self.buffer = b""
+        self.size = 0
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def _read_compressed(self):
+        if self.remaining is None:
+            return self.stream.read(CHUNK_SIZE)
+
+        chunk = self.stream.read(min(CHUNK_SIZE, self.remaining)) if self.remaining > 0 else b""
+        self.remaining -= len(chunk)
+
+        return chunk
+
+    def readinto(self, target):
+        """
+        :raises ContentTooLarge: if the decompressed content goes beyond the maximum size.
+        """
+        while not self.buffer and not self.finished:
+            if not self.pending:
+                self.pending = self._read_compressed()
+
+            if self.pending:
+                # The output of every step is bounded, so a small body can't expand at once into a huge one.
+                self.buffer, self.pending = self.codec.decompress(self.decompressor, self.pending, CHUNK_SIZE)
+            else:
+                self.buffer = self.decompressor.flush()
+                self.finished = True
+
+            self.size += len(self.buffer)
+
+            if self.max_size is not None and self.size > self.max_size:
+                raise ContentTooLarge("The decompressed content is larger than {} bytes.".format(self.max_size))
+
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+
+        return size
+
+
+def decompress_stream(stream, encoding, length=None, max_size=None):
+    """
+    :param stream: readable file-like object with compressed content.
+    :param length: size of the compressed content, or None to read until the end of the stream.
+    :param max_size: maximum size of the decompressed content, or None for no limit.
+    :return: buffered file-like object with the decompressed content. Reading it raises ContentTooLarge if it goes
+    beyond the maximum size.
+    """
+    return io.BufferedReader(DecompressingReader(stream, encoding, length, max_size), CHUNK_SIZE)
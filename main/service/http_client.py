@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import os
+import random
+import time
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from main.service.codec import CONTENT_TYPE_JSON, CONTENT_CODECS, SUPPORTED_CONTENT_TYPES, get_content_type, \
+    encode, decode
+from main.service.compression import MIN_COMPRESS_SIZE, choose_encoding, compress, compress_stream
+
+__author__ = "Ivan de Paz Centeno"
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # seconds before the first retry, doubled on each one
+MAX_BACKOFF = 10
+DEFAULT_POOL_SIZE = 20  # keep-alive connections per host
+
+# Methods retried by default: they don't change anything on the backend. Calls of other methods are retried only if
+# the caller knows they can be sent again safely (retry=True).
+SAFE_METHODS = ["GET", "HEAD", "OPTIONS"]
+
+# Responses of a backend that is temporarily unavailable, worth retrying.
+RETRY_STATUS_CODES = [502, 503, 504]
+
+# Accept header of the requests: the binary form is preferred, if available.
+ACCEPT_HEADER = ", ".join(content_type if index == 0 else "{};q=0.9".format(content_type)
+                          for index, content_type in enumerate(SUPPORTED_CONTENT_TYPES))
+
+
+class LatencyStats(object):
+    """
+    Latency statistics of the calls of a kind.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_time = 0
+        self.max_time = 0
+
+    def add(self, elapsed, retries, failed):
+        self.count += 1
+        self.retries += retries
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+        if failed:
+            self.errors += 1
+
+    def serialize(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'mean_time': self.total_time / self.count if self.count else 0,
+            'max_time': self.max_time,
+        }
+
+
+class HttpClient(object):
+    """
+    HTTP client shared by the proxies of the remote services (RemoteSearchSession, RemoteDatasetFactory).
+
+    Connections are kept alive and pooled per host, every call has a connect and a read timeout, and the calls of
+    safe methods (or those the caller marks as retriable) are retried with a jittered exponential backoff when the
+    backend can't be reached or is temporarily unavailable. The latency of the calls is accounted per method.
+
+    Responses are decompressed by requests, which announces the encodings it accepts. Request bodies (JSON or
+    streamed) are compressed once a backend advertised in the Accept-Encoding header of a response the encodings it
+    accepts for them (RFC 7694).
+
+    Contents are negotiated as well: the requests accept msgpack (if available) or JSON, get_content() decodes the
+    response in whichever format it came, and the bodies given as content= are encoded in msgpack once the backend
+    answered in msgpack, or in JSON otherwise.
+
+    The client is thread-safe, but it must not be shared across processes: use get_http_client(), which keeps one
+    client per process.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+        """
+        :param connect_timeout: seconds to wait for the connection to the backend.
+        :param read_timeout: seconds to wait for the backend to send data.
+        :param retries: maximum number of retries of a retriable call.
+        :param backoff: seconds to wait before the first retry. It is doubled on each retry.
+        :param pool_size: maximum number of keep-alive connections per host.
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {}  # method: LatencyStats
+        self.stats_lock = Lock()
+        self.request_encodings = {}  # host: encoding accepted by the backend for the request bodies
+        self.content_types = {}  # host: content type understood by the backend
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get_backoff(self, retry):
+        """
+        :return: seconds to wait before the given retry (starting at 0). The jitter keeps the crawlers that failed at
+        the same time from retrying all together.
+        """
+        return min(self.backoff * 2 ** retry, MAX_BACKOFF) * random.uniform(0.5, 1.5)
+
+    def _account(self, method, elapsed, retries, failed):
+        with self.stats_lock:
+            if method not in self.stats:
+                self.stats[method] = LatencyStats()
+
+            self.stats[method].add(elapsed, retries, failed)
+
+    def _compress_body(self, host, kwargs):
+        """
+        Compresses the body of the request in kwargs, if the backend accepts it.
+        :return: the encoding used, or None if the body was not compressed.
+        """
+        encoding = self.request_encodings.get(host, None)
+
+        if encoding is None:
+            return None
+
+        data = kwargs.get('data', None)
+
+        if isinstance(data, bytes):
+            if len(data) < MIN_COMPRESS_SIZE:
+                return None
+
+            kwargs['data'] = compress(data, encoding)
+
+        elif data is not None and not isinstance(data, (str, dict)):
+            kwargs['data'] = compress_stream(data, encoding)
+
+        else:
+            return None
+
+        headers = dict(kwargs.get('headers', None) or {})
+        headers['Content-Encoding'] = encoding
+        kwargs['headers'] = headers
+
+        return encoding
+
+    def _learn_request_encoding(self, host, response):
+        """
+        Keeps the encoding for the request bodies advertised by the backend in the response.
+        """
+        accept_encoding = response.headers.get('Accept-Encoding', None)
+
+        if accept_encoding is not None:
+            self.request_encodings[host] = choose_encoding(accept_encoding)
+
+    def _learn_content_type(self, host, response):
+        """
+        Keeps the content type of the response, if it is one of the supported, to encode the next request bodies.
+        """
+        content_type = get_content_type(response.headers.get('Content-Type', None))
+
+        if content_type in CONTENT_CODECS:
+            self.content_types[host] = content_type
+
+    def _encode_content(self, host, kwargs):
+        """
+        Encodes the content (or the json) in kwargs, if any, as the body of the request, and sets the headers of the
+        negotiation.
+        """
+        headers = dict(kwargs.get('headers', None) or {})
+        headers.setdefault('Accept', ACCEPT_HEADER)
+        content = kwargs.pop('content', None)
+        content_type = self.content_types.get(host, CONTENT_TYPE_JSON)
+
+        if content is None and kwargs.get('json', None) is not None:
+            content = kwargs.pop('json')
+            content_type = CONTENT_TYPE_JSON
+
+        if content is not None:
+            kwargs['data'] = encode(content, content_type)
+            headers['Content-Type'] = content_type
+
+        kwargs['headers'] = headers
+
+    def get_content(self, response):
+        """
+        Decodes the body of a response, in JSON or msgpack depending on its Content-Type.
+        :raises ValueError: if the body could not be decoded.
+        """
+        return decode(response.content, response.headers.get('Content-Type', None))
+
+    def request(self, method, url, retry=None, **kwargs):
+        """
+        Sends a request to the backend.
+        :param method: HTTP method.
+        :param url: URL of the request.
+        :param retry: True to retry the request if it fails, for calls that can be sent again safely. If None, only
+        the requests of safe methods (GET, HEAD, OPTIONS) are retried. Requests with a streamed body are never
+        retried, since the body can't be sent again.
+        :param kwargs: arguments for requests.Session.request(). The timeouts of the client are used unless a
+        timeout is given. A content argument can be given instead of json, to be sent in the format negotiated with
+        the backend.
+        :return: the response.
+        :raises requests.RequestException: if the backend couldn't be reached after the retries.
+        """
+        method = method.upper()
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+
+        if retry is None:
+            retry = method in SAFE_METHODS
+
+        retry = retry and not hasattr(kwargs.get('data'), '__next__')
+
+        self._encode_content(host, kwargs)
+        uncompressed_kwargs = dict(kwargs)
+        encoding = self._compress_body(host, kwargs)
+
+        max_retries = self.retries if retry else 0
+        retries = 0
+        start_time = time.time()
+
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+                self._learn_request_encoding(host, response)
+                self._learn_content_type(host, response)
+
+                if response.status_code == 415 and encoding and not hasattr(uncompressed_kwargs.get('data'),
+                                                                            '__next__'):
+                    # The backend doesn't accept the compressed body anymore. Sent again as it is.
+                    response.close()
+                    kwargs = uncompressed_kwargs
+                    encoding = None
+                    continue
+
+                if response.status_code not in RETRY_STATUS_CODES or retries >= max_retries:
+                    break
+
+                response.close()
+                logging.info("Backend ({}) unavailable ({}). Retrying.".format(url, response.status_code))
+
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if retries >= max_retries:
+                    self._account(method, time.time() - start_time, retries, True)
+                    raise
+
+                logging.info("Backend ({}) unreachable ({}). Retrying.".format(url, ex))
+
+            time.sleep(self._get_backoff(retries))
+            retries += 1
+
+        self._account(method, time.time() - start_time, retries, response.status_code >= 500)
+
+        return response
+
+    def get_timeout(self, wait_time=0):
+        """
+        :param wait_time: seconds the backend may hold the request before answering (long-polling).
+        :return: connect and read timeouts for a request.
+        """
+        return self.timeout[0], self.timeout[1] + wait_time
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def get_stats(self):
+        """
+        :return: dictionary with the latency stats of the calls, indexed by method.
+        """
+        with self.stats_lock:
+            result = {method: stats.serialize() for method, stats in self.stats.items()}
+
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+http_clients = {}  # process id: HttpClient
+http_clients_lock = Lock()
+
+
+def get_http_client():
+    """
+    Retrieves the HTTP client of the current process. Pooled connections can't be shared with the processes forked
+    afterwards, so each process gets its own client.
+    :return: the HttpClient.
+    """
+    pid = os.getpid()
+
+    with http_clients_lock:
+        if pid not in http_clients:
+            http_clients[pid] = HttpClient()
+
+        client = http_clients[pid]
+
+    return client
@@ -1,22 +1,51 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from multiprocessing import Manager
-from multiprocessing.pool import Pool
-from queue import Empty
-from threading import Lock
-from time import sleep
+from collections import deque
+from multiprocessing import Process, SimpleQueue
+from multiprocessing.connection import wait
+from threading import Condition, Event, Lock, Thread
+from time import sleep, time
 
 import logging
 
 from main.service.global_status import global_status
+from main.service.transport_core_pool import TransportCorePool
 
 __author__ = "Ivan de Paz Centeno"
 
-search_engine = None
+DURATION_SMOOTHING = 0.2  # weight of the last request in the mean duration of the requests
+AFFINITY_WINDOW = 16  # queued requests looked up for one of the engine a free worker is warmed up for
+MAX_SKIPS = 4  # times a queued request can be overtaken by later ones, before it is served first
+WORKERS_STOP_TIMEOUT = 5  # seconds the workers have to close their transport cores before they are killed
+WORKERS_WATCH_INTERVAL = 1  # seconds between checks of the list of worker processes to watch
+
+# Caches of each worker process. The search engines share a transport core per proto, so switching engines costs a
+# page navigation instead of launching a new browser.
+search_engines = {}  # search engine proto: search engine
+transport_core_pool = TransportCorePool()
+light_transport_core_proto = None  # transport core proto for the engines that don't need a browser, if any
 wait_seconds_between_requests = 0
 
 
+def get_transport_core(transport_core_proto):
+    """
+    :return: the transport core of the worker process for the given proto, created on first use.
+    """
+    return transport_core_pool.get(transport_core_proto)
+
+
+def get_search_engine(search_engine_proto):
+    """
+    :return: the search engine of the worker process for the given proto, created on first use.
+    """
+    if search_engine_proto not in search_engines:
+        search_engines[search_engine_proto] = search_engine_proto(transport_core_provider=get_transport_core,
+                                                                  light_transport_core_proto=light_transport_core_proto)
+
+    return search_engines[search_engine_proto]
+
+
 def process(queue_element):
     """
     Generic process function.
@@ -24,7 +53,7 @@ def process(queue_element):
     :param queue_element: element extracted from the queue.
     :return: search engine request result.
     """
-    global search_engine, wait_seconds_between_requests
+    global wait_seconds_between_requests
 
     sleep(wait_seconds_between_requests)
 
@@ -35,15 +64,9 @@ def process(queue_element):
     global_status.update_proc("Processing request \"{}\" from {}".format(search_request.get_words(),
                                                                   search_request.get_search_engine_proto().__name__))
 
-    search_engine_proto = search_request.get_search_engine_proto()
-
-    # This way we cache the search_engine between requests in the same thread.
-    if not search_engine or search_engine.__class__ != search_engine_proto:
-        search_engine = search_engine_proto()
-
     try:
 
-        retrieved_result = search_engine.retrieve(search_request)
+        retrieved_result = get_search_engine(search_request.get_search_engine_proto()).retrieve(search_request)
 
     except Exception as ex:
 
@@ -52,39 +75,152 @@ def process(queue_element):
     return [search_request, retrieved_result]
 
 
+def work(requests_queue, results_queue, worker_index, time_secs_between_requests, transport_core_options):
+    """
+    Loop of a worker process: processes the requests of its own queue until it gets None. The transport cores are
+    checked after reporting each result, so a crashed or worn out browser is replaced while the worker is idle.
+    """
+    RequestPool._init_pool_worker(time_secs_between_requests, transport_core_options)
+
+    for queue_element in iter(requests_queue.get, None):
+        try:
+            wrapped_result = process(queue_element)
+        except Exception as ex:
+            logging.info("Request {} could not be processed: {}".format(queue_element[0], ex))
+            wrapped_result = [queue_element[0], None]
+
+        results_queue.put([worker_index, wrapped_result])
+        transport_core_pool.check()
+
+    transport_core_pool.close()
+
+
+class PoolWorker(object):
+    """
+    Worker process of the RequestPool, with its own queue of requests. It keeps warm the search engines and the
+    transport cores it used, so it is preferred for the requests of the engine it processed last.
+    """
+
+    def __init__(self, index, results_queue, time_secs_between_requests, transport_core_options=None):
+        self.index = index
+        self.requests_queue = SimpleQueue()
+        self.process = Process(target=work, args=(self.requests_queue, results_queue, index,
+                                                  time_secs_between_requests, transport_core_options or {}),
+                               daemon=True)
+        self.busy = False
+        self.current_request = None  # search request being processed
+        self.last_engine = None  # search engine proto of the last request
+
+    def start(self):
+        self.process.start()
+
+    def get_sentinel(self):
+        """
+        :return: handle that becomes ready when the process ends, or None if it was not started.
+        """
+        return self.process.sentinel if self.process.pid is not None else None
+
+    def has_died(self):
+        """
+        :return: True if the process was started and is not running anymore.
+        """
+        return self.process.exitcode is not None
+
+    def submit(self, queue_element):
+        self.requests_queue.put(queue_element)
+
+    def stop(self):
+        """
+        Asks the worker to finish once its current request is processed, closing its transport cores.
+        """
+        if self.process.is_alive():
+            self.requests_queue.put(None)
+
+    def terminate(self, timeout=0):
+        """
+        Waits for the worker to finish up to timeout seconds, and kills it if it didn't.
+        """
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
 class RequestPool(object):
     """
     Pool processes for search engine requests.
     Allows to process requests by using a defined search engine, in parallel
+
+    Queued requests are kept in an in-process deque and handed to a free worker as soon as there is one: when they
+    are queued and when a worker finishes, without polling. Waiters on queue_condition are woken up whenever the
+    queue or the free workers change.
+
+    Each worker has its own queue, so requests are dispatched with engine affinity: a free worker takes the queued
+    request of the engine it is warmed up for (browser open on the site, cookies and consents accepted), and only if
+    there is none it steals the oldest request of any engine. A request can't be overtaken more than MAX_SKIPS times.
+
+    Worker processes that die (a crash, the OOM killer) are respawned, and the request they held is reported without
+    result so it is processed again.
     """
 
-    def __init__(self, pool_limit=1, time_secs_between_requests=None):
+    def __init__(self, pool_limit=1, time_secs_between_requests=None, warm_transport_cores=None,
+                 max_pages_per_core=None, max_core_memory=None, light_transport_core=None):
+        """
+        :param pool_limit: number of worker processes.
+        :param time_secs_between_requests:
+        :param warm_transport_cores: list of transport core protos that each worker launches when it starts, so the
+        first request doesn't pay their startup.
+        :param max_pages_per_core: pages a transport core may load before it is recycled. None for no limit.
+        :param max_core_memory: memory in MB a transport core may use before it is recycled. None for no limit.
+        :param light_transport_core: transport core proto to serve the requests of the search engines that don't
+        need the capabilities it lacks, like HttpCore. None to serve the requests with the transport core they ask for.
+        """
+        self.processing_queue = deque()  # [search request, times it was overtaken]
+        self.queue_condition = Condition()
+
+        transport_core_options = {'warm_transport_cores': warm_transport_cores or [],
+                                  'max_pages': max_pages_per_core, 'max_memory': max_core_memory,
+                                  'light_transport_core': light_transport_core}
 
-        self.manager = Manager()
+        self.results_queue = SimpleQueue()
+        self.worker_settings = [time_secs_between_requests, transport_core_options]
+        self.workers = [PoolWorker(index, self.results_queue, *self.worker_settings) for index in range(pool_limit)]
+        [worker.start() for worker in self.workers]
 
-        self.processing_queue = self.manager.Queue()
+        self.results_thread = Thread(target=self._collect_results, daemon=True)
+        self.results_thread.start()
 
-        self.pool = Pool(processes=pool_limit, initializer=self._init_pool_worker,
-                         initargs=[time_secs_between_requests])
+        self._terminated = Event()
+        self.watch_thread = Thread(target=self._watch_workers, daemon=True)
+        self.watch_thread.start()
 
-        self.processes_free = pool_limit
+        self.pool_limit = pool_limit
+        self.dispatch_times = {}  # search request id: time it was handed to a worker
+        self.mean_request_duration = None
         self._stop_processing = False
         self.lock_process_variable = Lock()
 
     @staticmethod
-    def _init_pool_worker(time_secs_between_requests):
+    def _init_pool_worker(time_secs_between_requests, transport_core_options):
         """
         Initializes the worker thread. Each worker of the pool has its own firefox and display instance.
         :return:
         """
-        global wait_seconds_between_requests
+        global wait_seconds_between_requests, light_transport_core_proto
 
         wait_seconds_between_requests = time_secs_between_requests
+        light_transport_core_proto = transport_core_options.get('light_transport_core')
+        transport_core_pool.configure(transport_core_options.get('max_pages'), transport_core_options.get('max_memory'))
+        transport_core_pool.warm_up(transport_core_options.get('warm_transport_cores', []))
 
     def do_stop(self):
         with self.lock_process_variable:
             self._stop_processing = True
 
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+
     def _stop_requested(self):
         with self.lock_process_variable:
             stop_requested = self._stop_processing
@@ -98,64 +234,222 @@ class RequestPool(object):
         :return:
         """
         logging.info("Queued request {}.".format(search_request))
-        self.processing_queue.put([search_request])
+
+        with self.queue_condition:
+            self.processing_queue.append([search_request, 0])
+
+        self.process_queue()
+
+    def get_queue_size(self):
+        """
+        :return: number of requests queued, waiting for a free worker.
+        """
+        with self.queue_condition:
+            queue_size = len(self.processing_queue)
+
+        return queue_size
+
+    def clear_queue(self):
+        """
+        Removes the requests queued that were not handed to a worker yet.
+        :return: list of the removed search requests.
+        """
+        with self.queue_condition:
+            removed_requests = [queue_element[0] for queue_element in self.processing_queue]
+            self.processing_queue.clear()
+            self.queue_condition.notify_all()
+
+        return removed_requests
+
+    def wait_for_queue(self, predicate, timeout):
+        """
+        Waits until the predicate is satisfied. It is evaluated with queue_condition acquired every time the queue or
+        the free workers change.
+        :param predicate: callable that returns True when the wait is over.
+        :param timeout: maximum seconds to wait.
+        :return: the last result of the predicate.
+        """
+        with self.queue_condition:
+            result = self.queue_condition.wait_for(predicate, timeout)
+
+        return result
+
+    def get_mean_request_duration(self):
+        """
+        :return: mean seconds a worker takes to process a request, or None if none was processed yet. Recent
+        requests weight more.
+        """
+        with self.queue_condition:
+            mean_request_duration = self.mean_request_duration
+
+        return mean_request_duration
 
     def get_processes_free(self):
 
-        with self.lock_process_variable:
-            processes_free = self.processes_free
+        with self.queue_condition:
+            processes_free = len([worker for worker in self.workers if not worker.busy])
 
         return processes_free
 
-    def take_process(self):
+    @staticmethod
+    def _pick_worker(free_workers, search_engine_proto, wanted_engines):
+        """
+        Picks the free worker for a request: the one warmed up for its engine, or else a cold one, or else one warmed
+        up for an engine no queued request wants.
+        """
+        for is_suitable in [lambda worker: worker.last_engine == search_engine_proto,
+                            lambda worker: worker.last_engine is None,
+                            lambda worker: worker.last_engine not in wanted_engines]:
+            suitable_workers = [worker for worker in free_workers if is_suitable(worker)]
+
+            if suitable_workers:
+                return suitable_workers[0]
 
-        with self.lock_process_variable:
-            self.processes_free -= 1
+        return free_workers[0]
+
+    def _match_request(self, free_workers):
+        """
+        Matches a queued request with a free worker. Must be invoked with queue_condition acquired.
+        :return: [worker, position of the request in the queue]
+        """
+        window = [self.processing_queue[index][0].get_search_engine_proto() for index in
+                  range(min(len(self.processing_queue), AFFINITY_WINDOW))]
 
-    def process_freed(self):
+        # The oldest request goes first if it was overtaken too many times.
+        if self.processing_queue[0][1] < MAX_SKIPS:
+            for index, search_engine_proto in enumerate(window):
+                for worker in free_workers:
+                    if worker.last_engine == search_engine_proto:
+                        return worker, index
 
-        with self.lock_process_variable:
-            self.processes_free += 1
+        # No free worker is warmed up for the queued requests: the oldest one is stolen by the most suitable.
+        return self._pick_worker(free_workers, window[0], set(window)), 0
 
     def process_queue(self):
         """
-        Processes the queue until all the processes are busy or until the queue is empty
+        Hands the queued requests to the free workers until all of them are busy or until the queue is empty
         :return:
         """
+        assignments = []
 
-        while self.get_processes_free() > 0 and not self._stop_requested():
-            try:
-                queue_element = self.processing_queue.get(False)
-                logging.info(
-                    "Processing queue with {} free processes (stop flag is {}).".format(self.get_processes_free(),
-                                                                                        self._stop_requested()))
-                self.take_process()
+        with self.queue_condition:
+            free_workers = [worker for worker in self.workers if not worker.busy]
 
-                result = self.pool.apply_async(process, args=(queue_element,), callback=self._process_finished)
+            while free_workers and self.processing_queue and not self._stop_requested():
+                worker, position = self._match_request(free_workers)
+                search_request = self.processing_queue[position][0]
+                del self.processing_queue[position]
 
-            except Empty:
-                logging.info("No elements queued.")
-                break
+                for index in range(position):
+                    self.processing_queue[index][1] += 1
 
-    def _process_finished(self, wrapped_result):
+                worker.busy = True
+                worker.current_request = search_request
+                worker.last_engine = search_request.get_search_engine_proto()
+                free_workers.remove(worker)
+                self.dispatch_times[search_request.get_id()] = time()
+                assignments.append([worker, search_request])
+
+            if assignments:
+                self.queue_condition.notify_all()
+
+        for worker, search_request in assignments:
+            logging.info("Processing request {} in worker {}.".format(search_request, worker.index))
+            worker.submit([search_request])
+
+    def _collect_results(self):
+        """
+        Receives the results of the workers, until it gets None.
+        """
+        for worker_index, wrapped_result in iter(self.results_queue.get, None):
+            self._process_finished(wrapped_result, self.workers[worker_index])
+
+    def _process_finished(self, wrapped_result, worker):
         """
         Callback when the worker's thread is finished.
         This is an internal callback.
-        It will call process_finished method if available to notify the result.
+        It will call process_finished method if available to notify the result, and hands the next queued request to
+        the freed worker.
         :param wrapped_result:
+        :param worker: worker that processed the request.
         :return:
         """
-        self.process_freed()
+        with self.queue_condition:
+            search_request = worker.current_request
+
+            # The result of a worker that died may come after the request was already reported without result.
+            if search_request is None or search_request.get_id() != wrapped_result[0].get_id():
+                logging.info("Result of request {} is not expected anymore. Dropped.".format(wrapped_result[0]))
+                return None
+
+            worker.busy = False
+            worker.current_request = None
+            dispatch_time = self.dispatch_times.pop(wrapped_result[0].get_id(), None)
+
+            if dispatch_time is not None:
+                duration = time() - dispatch_time
+
+                if self.mean_request_duration is None:
+                    self.mean_request_duration = duration
+                else:
+                    self.mean_request_duration += DURATION_SMOOTHING * (duration - self.mean_request_duration)
 
         if hasattr(self, 'process_finished'):
             self.process_finished(wrapped_result)
 
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+
+        self.process_queue()
+
         return None
 
+    def _watch_workers(self):
+        """
+        Respawns the workers whose process died, until the pool is terminated. The list of processes watched is
+        refreshed every WORKERS_WATCH_INTERVAL seconds.
+        """
+        while not self._terminated.is_set():
+            sentinels = [worker.get_sentinel() for worker in self.workers]
+            wait([sentinel for sentinel in sentinels if sentinel is not None], WORKERS_WATCH_INTERVAL)
+
+            for worker in list(self.workers):
+                if worker.has_died():
+                    self._respawn_worker(worker)
+
+    def _respawn_worker(self, worker):
+        """
+        Replaces a dead worker with a new one, and reports without result the request it held.
+        """
+        with self.queue_condition:
+            if self._terminated.is_set() or self.workers[worker.index] is not worker:
+                return
+
+            search_request = worker.current_request
+            new_worker = PoolWorker(worker.index, self.results_queue, *self.worker_settings)
+            new_worker.start()
+            self.workers[worker.index] = new_worker
+
+        logging.info("Worker {} died with exit code {}. Respawned.".format(worker.index, worker.process.exitcode))
+
+        if search_request is not None:
+            self._process_finished([search_request, None], worker)
+        else:
+            self.process_queue()
+
     def terminate(self):
         """
         Finishes safely the pool.
         :return:
         """
-        self.pool.terminate()
-        self.pool.join()
+        self._terminated.set()
+        self.do_stop()
+        [worker.stop() for worker in self.workers]
+        deadline = time() + WORKERS_STOP_TIMEOUT
+
+        for worker in self.workers:
+            worker.terminate(max(0, deadline - time()))
+
+        self.results_queue.put(None)
+        self.results_thread.join()
+        self.watch_thread.join()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class TransportCorePool(object):
+    """
+    Transport cores of a worker process, one per proto, shared by its search engines.
+
+    The cores can be launched in advance, so the first request doesn't pay the startup of a browser. Between
+    requests they are checked: a core that is not healthy (a crashed browser) or that should be recycled (too many
+    pages loaded or too much memory used) is closed and launched again, so the next request gets a fresh one.
+
+    Transport cores may implement is_healthy(), get_pages_loaded(), get_memory_usage() and close() to take part in
+    the checks. Those that don't are always kept.
+    """
+
+    def __init__(self, max_pages=None, max_memory=None):
+        """
+        :param max_pages: pages a transport core may load before it is recycled. None for no limit.
+        :param max_memory: memory in MB a transport core may use before it is recycled. None for no limit.
+        """
+        self.transport_cores = {}  # transport core proto: transport core
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+
+    def configure(self, max_pages=None, max_memory=None):
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+
+    def get(self, transport_core_proto):
+        """
+        :return: the transport core for the given proto, launched on first use.
+        """
+        if transport_core_proto not in self.transport_cores:
+            self._launch(transport_core_proto)
+
+        return self.transport_cores[transport_core_proto]
+
+    def warm_up(self, transport_core_protos):
+        """
+        Launches in advance the transport cores of the given protos.
+        """
+        for transport_core_proto in transport_core_protos:
+            try:
+                self.get(transport_core_proto)
+            except Exception as ex:
+                logging.info("Could not warm up transport core {}: {}".format(transport_core_proto.__name__, ex))
+
+    def _launch(self, transport_core_proto):
+        logging.info("Launching transport core {}.".format(transport_core_proto.__name__))
+        self.transport_cores[transport_core_proto] = transport_core_proto()
+
+    def _get_recycle_reason(self, transport_core):
+        """
+        :return: the reason why the transport core must be replaced, or None if it can keep working.
+        """
+        is_healthy = getattr(transport_core, 'is_healthy', None)
+
+        if is_healthy is not None and not is_healthy():
+            return "it is not healthy"
+
+        get_pages_loaded = getattr(transport_core, 'get_pages_loaded', None)
+
+        if self.max_pages is not None and get_pages_loaded is not None and get_pages_loaded() >= self.max_pages:
+            return "it loaded {} pages".format(get_pages_loaded())
+
+        get_memory_usage = getattr(transport_core, 'get_memory_usage', None)
+        memory_usage = get_memory_usage() if self.max_memory is not None and get_memory_usage is not None else None
+
+        if memory_usage is not None and memory_usage > self.max_memory:
+            return "it uses {:.0f} MB".format(memory_usage)
+
+        return None
+
+    def check(self):
+        """
+        Replaces the transport cores that are not healthy or that must be recycled. Invoked between requests.
+        """
+        for transport_core_proto, transport_core in list(self.transport_cores.items()):
+            try:
+                reason = self._get_recycle_reason(transport_core)
+            except Exception as ex:
+                reason = "its check failed: {}".format(ex)
+
+            if reason is None:
+                continue
+
+            logging.info("Recycling transport core {} since {}.".format(transport_core_proto.__name__, reason))
+            self._close(transport_core_proto)
+
+            try:
+                self._launch(transport_core_proto)
+            except Exception as ex:
+                # It is launched again on first use.
+                logging.info("Could not launch transport core {}: {}".format(transport_core_proto.__name__, ex))
+
+    def _close(self, transport_core_proto):
+        transport_core = self.transport_cores.pop(transport_core_proto)
+        close = getattr(transport_core, 'close', None)
+
+        if close is not None:
+            try:
+                close()
+            except Exception as ex:
+                logging.info("Could not close transport core {}: {}".format(transport_core_proto.__name__, ex))
+
+    def close(self):
+        """
+        Closes all the transport cores.
+        """
+        for transport_core_proto in list(self.transport_cores):
+            self._close(transport_core_proto)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+
+from bs4 import BeautifulSoup
+
+from main.service.http_client import get_http_client
+from main.transport_core.transport_cores import register_transport_core
+
+__author__ = "Ivan de Paz Centeno"
+
+HTML_ACCEPT_HEADER = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0"
+
+
+class HttpCore(object):
+    """
+    Represents a lightweight transport core for the surface web: pages are fetched with the pooled HTTP client of
+    the process and parsed as they come, without running their JavaScript. It offers the same methods as WebCore to
+    read the page, so the search engines whose result pages don't need JavaScript can use it, at a fraction of the
+    memory and latency of a browser.
+
+    It offers no capabilities: it can't type nor click, and waits and scrolls do nothing. Search engines that need
+    them are refused when they prepare it (see SearchEngine.required_capabilities).
+    """
+    capabilities = []
+
+    def __init__(self):
+        self.http_client = get_http_client()
+        self.document = BeautifulSoup("", 'html.parser')
+        self.pages_loaded = 0
+
+    def get(self, url):
+        logging.debug("Get started")
+        self.pages_loaded += 1
+        response = self.http_client.get(url, headers={'Accept': HTML_ACCEPT_HEADER, 'User-Agent': USER_AGENT})
+
+        if response.status_code >= 400:
+            logging.info("Page {} answered with status {}".format(url, response.status_code))
+
+        self.document = BeautifulSoup(response.text, 'html.parser')
+        logging.debug("Get finished")
+
+    @staticmethod
+    def _get_html(elements, innerHTML):
+        if innerHTML:
+            result = [element.decode_contents() for element in elements]
+        else:
+            result = [str(element) for element in elements]
+
+        return result
+
+    def get_elements_html_by_class(self, class_name, innerHTML=True):
+        logging.debug("Getting elements by class {}".format(class_name))
+
+        return self._get_html(self.document.find_all(class_=class_name), innerHTML)
+
+    def get_elements_html_by_tag(self, tag_name, innerHTML=True):
+        return self._get_html(self.document.find_all(tag_name), innerHTML)
+
+    def get_elements_html_by_id(self, id, innerHTML=True):
+        return self._get_html(self.document.find_all(id=id), innerHTML)
+
+    def get_elements_attribute_by_class(self, class_name, attribute_name):
+        values = [element.get(attribute_name) for element in self.document.find_all(class_=class_name)]
+
+        # Multi-valued attributes, like class, are read as in the browser.
+        return [" ".join(value) if isinstance(value, list) else value for value in values]
+
+    def count_elements_by_class(self, class_name):
+        return len(self.document.find_all(class_=class_name))
+
+    def scroll_to_bottom(self):
+        # The whole page is already loaded: there is nothing to reveal by scrolling.
+        pass
+
+    def wait_for_elements_from_class(self, class_name):
+        # The page doesn't change once it is loaded.
+        pass
+
+    def manual_wait_for_element_from_class(self, class_name):
+        pass
+
+    def wait_for_element_count(self, class_name, count, timeout=None, idle_time=None):
+        return self.count_elements_by_class(class_name)
+
+    def wait_for_dom_idle(self, idle_time=None, timeout=None):
+        pass
+
+    def get_pages_loaded(self):
+        return self.pages_loaded
+
+    def is_healthy(self):
+        return True
+
+    def close(self):
+        # The HTTP client is shared by the process.
+        self.document = BeautifulSoup("", 'html.parser')
+
+# Register the class to enable deserialization.
+register_transport_core(HttpCore)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+
+from main.transport_core.transport_cores import register_transport_core
+from main.transport_core.webcore import WebCore
+
+__author__ = "Ivan de Paz Centeno"
+
+# Environment variable with the directory of the recordings, inherited by the worker processes.
+RECORDINGS_VARIABLE = "TRANSPORT_RECORDINGS"
+DEFAULT_RECORDINGS_DIR = "recordings"
+
+
+def get_recordings_dir():
+    return os.environ.get(RECORDINGS_VARIABLE, DEFAULT_RECORDINGS_DIR)
+
+
+class PageRecording(object):
+    """
+    What a transport core returned for a page. The page goes through a new state with every action that may change
+    it (a scroll, a click, a text typed), and the elements read are kept by state, so the page can be replayed as
+    long as the same actions are done in the same order.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.states = [{}]  # state index: {read key: result}
+
+    @staticmethod
+    def get_filename(recordings_dir, url):
+        return os.path.join(recordings_dir, "{}.json".format(hashlib.sha1(url.encode()).hexdigest()))
+
+    @staticmethod
+    def get_read_key(method_name, *args):
+        return json.dumps([method_name] + list(args))
+
+    def add_read(self, state, read_key, result):
+        while len(self.states) <= state:
+            self.states.append({})
+
+        self.states[state][read_key] = result
+
+    def get_read(self, state, read_key):
+        """
+        :return: the result recorded for the read, or None if it was not recorded.
+        """
+        return self.states[state].get(read_key, None) if state < len(self.states) else None
+
+    def save(self, recordings_dir):
+        os.makedirs(recordings_dir, exist_ok=True)
+
+        with open(self.get_filename(recordings_dir, self.url), "w") as file:
+            json.dump({'url': self.url, 'states': self.states}, file)
+
+    @staticmethod
+    def load(recordings_dir, url):
+        """
+        :return: the recording of the page, or None if it was not recorded.
+        """
+        filename = PageRecording.get_filename(recordings_dir, url)
+
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename) as file:
+            serial = json.load(file)
+
+        page_recording = PageRecording(serial['url'])
+        page_recording.states = serial['states']
+
+        return page_recording
+
+
+class RecordingCore(object):
+    """
+    Transport core that drives a WebCore and records the elements it returns for every page, in the directory given
+    by the TRANSPORT_RECORDINGS environment variable. ReplayCore serves them back offline.
+
+    The reads of a page are kept in memory and the recording is saved once, when the next page is requested or the
+    core is closed.
+    """
+    recorded_core_proto = WebCore
+    capabilities = WebCore.capabilities
+
+    def __init__(self, recorded_core=None, recordings_dir=None):
+        """
+        :param recorded_core: transport core to record. A new one of recorded_core_proto if None.
+        :param recordings_dir: directory to store the recordings in. Taken from the environment if None.
+        """
+        self.recorded_core = recorded_core if recorded_core is not None else self.recorded_core_proto()
+        self.recordings_dir = recordings_dir or get_recordings_dir()
+        self.page_recording = None
+        self.state = 0
+
+    def _save(self):
+        """
+        Saves the recording of the current page, if any.
+        """
+        if self.page_recording is not None:
+            self.page_recording.save(self.recordings_dir)
+            self.page_recording = None
+
+    def get(self, url):
+        self._save()
+        self.recorded_core.get(url)
+        self.page_recording = PageRecording(url)
+        self.state = 0
+
+    def _record(self, method_name, *args):
+        result = getattr(self.recorded_core, method_name)(*args)
+
+        if self.page_recording is not None:
+            self.page_recording.add_read(self.state, PageRecording.get_read_key(method_name, *args), result)
+
+        return result
+
+    def _act(self, method_name, *args):
+        result = getattr(self.recorded_core, method_name)(*args)
+        self.state += 1
+
+        return result
+
+    def get_elements_html_by_class(self, class_name, innerHTML=True):
+        return self._record("get_elements_html_by_class", class_name, innerHTML)
+
+    def get_elements_html_by_tag(self, tag_name, innerHTML=True):
+        return self._record("get_elements_html_by_tag", tag_name, innerHTML)
+
+    def get_elements_html_by_id(self, id, innerHTML=True):
+        return self._record("get_elements_html_by_id", id, innerHTML)
+
+    def get_elements_attribute_by_class(self, class_name, attribute_name):
+        return self._record("get_elements_attribute_by_class", class_name, attribute_name)
+
+    def count_elements_by_class(self, class_name):
+        return self._record("count_elements_by_class", class_name)
+
+    def scroll_to_bottom(self):
+        self._act("scroll_to_bottom")
+
+    def send_text_to_input_by_id(self, param, text):
+        self._act("send_text_to_input_by_id", param, text)
+
+    def click_button_by_class(self, param):
+        self._act("click_button_by_class", param)
+
+    def wait_for_elements_from_class(self, class_name):
+        self.recorded_core.wait_for_elements_from_class(class_name)
+
+    def manual_wait_for_element_from_class(self, class_name):
+        self.recorded_core.manual_wait_for_element_from_class(class_name)
+
+    def wait_for_element_count(self, class_name, count, *args):
+        return self._record("wait_for_element_count", class_name, count, *args)
+
+    def wait_for_dom_idle(self, *args):
+        self.recorded_core.wait_for_dom_idle(*args)
+
+    def get_pages_loaded(self):
+        return self.recorded_core.get_pages_loaded()
+
+    def is_healthy(self):
+        return self.recorded_core.is_healthy()
+
+    def get_memory_usage(self):
+        return self.recorded_core.get_memory_usage()
+
+    def close(self):
+        self._save()
+        self.recorded_core.close()
+
+
+class ReplayCore(object):
+    """
+    Transport core that serves back the pages recorded by RecordingCore, without any network or browser, so the
+    parsing of the search engines can be profiled and benchmarked offline and reproducibly. Waits return at once.
+    Elements that were not recorded are returned as not found.
+    """
+    capabilities = WebCore.capabilities
+
+    def __init__(self, recordings_dir=None):
+        """
+        :param recordings_dir: directory of the recordings. Taken from the environment if None.
+        """
+        self.recordings_dir = recordings_dir or get_recordings_dir()
+        self.page_recording = None
+        self.state = 0
+        self.pages_loaded = 0
+
+    def get(self, url):
+        self.pages_loaded += 1
+        self.page_recording = PageRecording.load(self.recordings_dir, url)
+        self.state = 0
+
+        if self.page_recording is None:
+            logging.info("Page {} was not recorded.".format(url))
+
+    def _replay(self, default, method_name, *args):
+        """
+        :return: the result recorded for the read, or the default if it was not recorded.
+        """
+        result = None
+
+        if self.page_recording is not None:
+            result = self.page_recording.get_read(self.state, PageRecording.get_read_key(method_name, *args))
+
+        if result is None:
+            logging.debug("Read {}{} was not recorded in state {}.".format(method_name, args, self.state))
+            result = default
+
+        return result
+
+    def get_elements_html_by_class(self, class_name, innerHTML=True):
+        return self._replay([], "get_elements_html_by_class", class_name, innerHTML)
+
+    def get_elements_html_by_tag(self, tag_name, innerHTML=True):
+        return self._replay([], "get_elements_html_by_tag", tag_name, innerHTML)
+
+    def get_elements_html_by_id(self, id, innerHTML=True):
+        return self._replay([], "get_elements_html_by_id", id, innerHTML)
+
+    def get_elements_attribute_by_class(self, class_name, attribute_name):
+        return self._replay([], "get_elements_attribute_by_class", class_name, attribute_name)
+
+    def count_elements_by_class(self, class_name):
+        return self._replay(0, "count_elements_by_class", class_name)
+
+    def scroll_to_bottom(self):
+        self.state += 1
+
+    def send_text_to_input_by_id(self, param, text):
+        self.state += 1
+
+    def click_button_by_class(self, param):
+        self.state += 1
+
+    def wait_for_elements_from_class(self, class_name):
+        pass
+
+    def manual_wait_for_element_from_class(self, class_name):
+        pass
+
+    def wait_for_element_count(self, class_name, count, *args):
+        return self._replay(0, "wait_for_element_count", class_name, count, *args)
+
+    def wait_for_dom_idle(self, *args):
+        pass
+
+    def get_pages_loaded(self):
+        return self.pages_loaded
+
+    def is_healthy(self):
+        return True
+
+# Register the classes to enable deserialization.
+register_transport_core(RecordingCore)
+register_transport_core(ReplayCore)
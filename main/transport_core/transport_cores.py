@@ -5,5 +5,37 @@ __author__ = "Ivan de Paz Centeno"
 
 # This file reflects the transport cores available in the project. Useful for serialization/deserialization
 
-# It is full of transport-core-proto-str : transport-core-proto lines
-TRANSPORT_CORES = {}
\ No newline at end of file
+# It is full of transport-core-id : transport-core-proto lines. Each transport core is registered by its compact id and by
+# its legacy id (str of the class), which older versions used to serialize it.
+TRANSPORT_CORES = {}
+
+# Capabilities a transport core may offer besides getting a page and reading its elements. Each transport core lists
+# the ones it offers in its "capabilities" attribute, and each search engine the ones it needs in its
+# "required_capabilities" attribute. Transport cores that don't list them are assumed to offer all of them.
+CAPABILITY_JAVASCRIPT = "javascript"  # runs the scripts of the pages, so scrolling or waiting reveals new elements
+CAPABILITY_INTERACTION = "interaction"  # types in inputs and clicks buttons
+ALL_CAPABILITIES = [CAPABILITY_JAVASCRIPT, CAPABILITY_INTERACTION]
+
+
+def get_transport_core_id(transport_core_proto):
+    """
+    :return: compact id of the transport core, used to serialize it.
+    """
+    return transport_core_proto.__name__
+
+
+def get_missing_capabilities(transport_core_proto, required_capabilities):
+    """
+    :return: list of the required capabilities that the transport core doesn't offer.
+    """
+    capabilities = getattr(transport_core_proto, 'capabilities', ALL_CAPABILITIES)
+
+    return [capability for capability in required_capabilities if capability not in capabilities]
+
+
+def register_transport_core(transport_core_proto):
+    """
+    Registers the transport core to enable its deserialization.
+    """
+    TRANSPORT_CORES[get_transport_core_id(transport_core_proto)] = transport_core_proto
+    TRANSPORT_CORES[str(transport_core_proto)] = transport_core_proto
@@ -1,88 +1,264 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from main.transport_core.transport_cores import TRANSPORT_CORES
+from main.transport_core.transport_cores import register_transport_core, ALL_CAPABILITIES
 
 __author__ = "Ivan de Paz Centeno"
 import logging
+import os
 from pyvirtualdisplay import Display
-from selenium.webdriver import Firefox
-from selenium import webdriver
+from selenium.webdriver import Firefox, FirefoxOptions, FirefoxProfile
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 
-from time import sleep, time
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 TIMEOUT = 5
+IDLE_TIME = 0.5  # seconds without changes in the page nor resources loaded, after which no more content is expected
+SCRIPT_TIMEOUT = 60  # seconds the driver waits for an asynchronous script. Waits are bounded by their own timeout.
+
+# Environment variables, inherited by the worker processes that launch the browsers.
+HEADLESS_VARIABLE = "WEBCORE_HEADLESS"  # "0" to run the browsers in a display instead of in headless mode
+SHARED_DISPLAY_VARIABLE = "WEBCORE_SHARED_DISPLAY"  # X display shared by all the browsers, if any
+LEAN_VARIABLE = "WEBCORE_LEAN"  # "0" to load the pages fully instead of with the lean profile
+
+# Preferences of the lean profile. The crawler only needs the DOM of the pages: images, fonts, media and trackers are
+# not downloaded, nor third-party cookies kept.
+LEAN_PREFERENCES = {
+    "permissions.default.image": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "media.autoplay.default": 5,
+    "media.autoplay.blocking_policy": 2,
+    "browser.chrome.site_icons": False,
+    "network.cookie.cookieBehavior": 1,
+    "privacy.trackingprotection.enabled": True,
+    "privacy.trackingprotection.socialtracking.enabled": True,
+    "privacy.trackingprotection.cryptomining.enabled": True,
+    "privacy.trackingprotection.fingerprinting.enabled": True,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+}
+
+# The lean profile returns from get() once the DOM is ready, without waiting for the rest of the resources.
+LEAN_PAGE_LOAD_STRATEGY = "eager"
+
+# Waits for the page, resolved by its own events instead of polling: a MutationObserver on the DOM and a
+# PerformanceObserver on the resources loaded. It finishes as soon as there are at least arguments[1] elements of the
+# class arguments[0] (if given), or once the page was idle for arguments[3] seconds (if given), or after arguments[2]
+# seconds. It returns the number of elements of the class.
+WAIT_FOR_PAGE_SCRIPT = """
+var className = arguments[0], count = arguments[1], timeout = arguments[2] * 1000;
+var idleTime = arguments[3] === null ? null : arguments[3] * 1000;
+var done = arguments[arguments.length - 1];
+var elements = className === null ? null : document.getElementsByClassName(className);
+var finished = false, idleTimer = null, resourceObserver = null;
+
+function finish() {
+    if (finished) {
+        return;
+    }
+
+    finished = true;
+    observer.disconnect();
+
+    if (resourceObserver !== null) {
+        resourceObserver.disconnect();
+    }
+
+    clearTimeout(timeoutTimer);
+    clearTimeout(idleTimer);
+    done(elements === null ? 0 : elements.length);
+}
+
+function onActivity() {
+    if (elements !== null && elements.length >= count) {
+        finish();
+    } else if (idleTime !== null) {
+        clearTimeout(idleTimer);
+        idleTimer = setTimeout(finish, idleTime);
+    }
+}
+
+var timeoutTimer = setTimeout(finish, timeout);
+var observer = new MutationObserver(onActivity);
+observer.observe(document, {childList: true, subtree: true, attributes: true});
+
+if (idleTime !== null && window.PerformanceObserver) {
+    resourceObserver = new PerformanceObserver(onActivity);
+    resourceObserver.observe({entryTypes: ['resource']});
+}
+
+onActivity();
+"""
+
+shared_display = None
+
+# Reads the elements selected by arguments[0] ('class', 'tag' or 'id') and arguments[1], in the page. arguments[2]
+# tells what to read of them ('property', 'attribute' or 'count') and arguments[3] the name of it.
+READ_ELEMENTS_SCRIPT = """
+var selector = arguments[0], value = arguments[1], read = arguments[2], name = arguments[3];
+var elements;
+
+if (selector === 'class') {
+    elements = document.getElementsByClassName(value);
+} else if (selector === 'tag') {
+    elements = document.getElementsByTagName(value);
+} else {
+    elements = document.querySelectorAll('[id="' + CSS.escape(value) + '"]');
+}
+
+if (read === 'count') {
+    return elements.length;
+}
+
+return Array.prototype.map.call(elements, function (element) {
+    return read === 'attribute' ? element.getAttribute(name) : element[name];
+});
+"""
+
+
+def is_headless_enabled():
+    """
+    :return: True unless the headless mode was disabled through the WEBCORE_HEADLESS environment variable.
+    """
+    return os.environ.get(HEADLESS_VARIABLE, "1") != "0"
+
+
+def is_lean_enabled():
+    """
+    :return: True unless the lean profile was disabled through the WEBCORE_LEAN environment variable.
+    """
+    return os.environ.get(LEAN_VARIABLE, "1") != "0"
+
+
+def start_shared_display(size=(1280, 1000)):
+    """
+    Starts a virtual display to be shared by the browsers that are not headless, instead of one display per
+    browser. It is used by the browsers launched from this process and from the processes started afterwards.
+    """
+    global shared_display
+
+    if shared_display is None:
+        shared_display = Display(visible=0, size=size)
+        shared_display.start()
+        os.environ[SHARED_DISPLAY_VARIABLE] = os.environ.get("DISPLAY", "")
+
+
+def stop_shared_display():
+    global shared_display
+
+    if shared_display is not None:
+        shared_display.stop()
+        shared_display = None
+        os.environ.pop(SHARED_DISPLAY_VARIABLE, None)
 
 
 class WebCore(object):
     """
     Represents the transport core for the surface web.
     """
+    capabilities = ALL_CAPABILITIES
+
+    def __init__(self, gui=False, window_size=(1280, 1000), headless=None, lean=None):
+        """
+        :param gui: True to show the browser in the current display.
+        :param window_size:
+        :param headless: True to run the browser in its own headless mode, without any display. False to run it in
+        the shared virtual display, or in a display of its own if there is none. None to take it from the
+        WEBCORE_HEADLESS environment variable (headless by default).
+        :param lean: True to browse with the lean profile: no images, fonts, media nor trackers, and pages loaded
+        until their DOM is ready. None to take it from the WEBCORE_LEAN environment variable (lean by default).
+        """
+        self.gui = gui
+        self.headless = not gui and (is_headless_enabled() if headless is None else headless)
+        self.lean = is_lean_enabled() if lean is None else lean
+        self.virtual_browser = None
+        self.virtual_browser_display = None
+        self.pages_loaded = 0
+
+        profile = FirefoxProfile()
+        profile.set_preference("browser.cache.disk.enable", False)
+        profile.set_preference("browser.cache.memory.enable", False)
+        profile.set_preference("browser.cache.offline.enable", False)
+        profile.set_preference("network.http.use-cache", False)
+
+        options = FirefoxOptions()
 
-    def __init__(self, gui=False, window_size=(1280, 1000)):
+        if self.lean:
+            [profile.set_preference(name, value) for name, value in LEAN_PREFERENCES.items()]
+            options.set_capability("pageLoadStrategy", LEAN_PAGE_LOAD_STRATEGY)
+
+        # Selenium 4.10 dropped the firefox_profile argument: the profile goes in the options.
+        options.profile = profile
+
+        if self.headless:
+            options.add_argument("-headless")
+
+        elif not gui and not os.environ.get(SHARED_DISPLAY_VARIABLE):
+            print("Virtual browser display!")
+            self.virtual_browser_display = Display(visible=0, size=(800, 600))
+            self.virtual_browser_display.start()
+
+        # A browser that can't be launched is reported to the caller, after releasing what was started.
         try:
-            self.gui = gui
-            profile = webdriver.FirefoxProfile()
-            profile.set_preference("browser.cache.disk.enable", False)
-            profile.set_preference("browser.cache.memory.enable", False)
-            profile.set_preference("browser.cache.offline.enable", False)
-            profile.set_preference("network.http.use-cache", False)
-
-            if not gui:
-                print("Virtual browser display!")
-                self.virtual_browser_display = Display(visible=0, size=(800, 600))
-                self.virtual_browser_display.start()
-
-            self.virtual_browser = Firefox(profile)
+            self.virtual_browser = Firefox(options=options)
             self.virtual_browser.set_window_size(*window_size)
-        except Exception as ex:
-            logging.info("Error: {}".format(ex))
+            self.virtual_browser.set_script_timeout(SCRIPT_TIMEOUT)
+        except Exception:
+            self.close()
+            raise
         #self.virtual_browser.set_window_position(-1000, -1000)
 
     def get(self, url):
         logging.debug("Get started")
+        self.pages_loaded += 1
         self.virtual_browser.get(url)
         logging.debug("Get finished")
 
-    def get_elements_html_by_class(self, class_name, innerHTML=True):
-        if innerHTML:
-            attribute = 'innerHTML'
-        else:
-            attribute = 'outerHTML'
-
-        logging.debug("Getting elements by class {}".format(class_name))
-
-        elements_by_class =[]
-
+    def _read_elements(self, selector, value, read, name=None):
+        """
+        Reads all the matching elements of the page with a single script, instead of a round trip with the driver per
+        element.
+        :param selector: 'class', 'tag' or 'id'.
+        :param value: class name, tag name or id of the elements.
+        :param read: 'property', 'attribute' or 'count'.
+        :param name: name of the property or attribute to read.
+        :return: list with the property or attribute of each element, or the number of elements if read is 'count'.
+        """
         try:
-            elements_by_class = self.virtual_browser.find_elements_by_class_name(class_name)
-            logging.debug("Retrieved {} elements of class {}".format(len(elements_by_class), class_name))
+            result = self.virtual_browser.execute_script(READ_ELEMENTS_SCRIPT, selector, value, read, name)
+            logging.debug("Read {} of the elements of {} {}".format(read, selector, value))
         except Exception as ex:
-            logging.debug("Error while retrieving the elements by class {}: {}".format(len(elements_by_class),
-                                                                                      class_name))
+            logging.debug("Error while reading the elements of {} {}: {}".format(selector, value, ex))
+            result = 0 if read == 'count' else []
 
-        result = [element.get_attribute(attribute) for element in elements_by_class]
         return result
 
-    def get_elements_html_by_tag(self, tag_name, innerHTML=True):
-        if innerHTML:
-            attribute = 'innerHTML'
-        else:
-            attribute = 'outerHTML'
+    def get_elements_html_by_class(self, class_name, innerHTML=True):
+        logging.debug("Getting elements by class {}".format(class_name))
 
-        return [element.get_attribute(attribute) for element in
-                self.virtual_browser.find_elements_by_tag_name(tag_name)]
+        return self._read_elements('class', class_name, 'property', 'innerHTML' if innerHTML else 'outerHTML')
+
+    def get_elements_html_by_tag(self, tag_name, innerHTML=True):
+        return self._read_elements('tag', tag_name, 'property', 'innerHTML' if innerHTML else 'outerHTML')
 
     def get_elements_html_by_id(self, id, innerHTML=True):
-        if innerHTML:
-            attribute = 'innerHTML'
-        else:
-            attribute = 'outerHTML'
+        return self._read_elements('id', id, 'property', 'innerHTML' if innerHTML else 'outerHTML')
 
-        return [element.get_attribute(attribute) for element in
-                self.virtual_browser.find_elements_by_id(id)]
+    def get_elements_attribute_by_class(self, class_name, attribute_name):
+        """
+        :return: list with the value of the attribute of each element of the class (None where it is missing).
+        """
+        return self._read_elements('class', class_name, 'attribute', attribute_name)
+
+    def count_elements_by_class(self, class_name):
+        """
+        :return: number of elements of the class. Cheaper than reading their HTML, to check if a page grew.
+        """
+        return self._read_elements('class', class_name, 'count')
 
     def scroll_to_bottom(self):
         try:
@@ -91,24 +267,70 @@ class WebCore(object):
             logging.info("Could not scroll to the bottom")
             pass
         logging.info("Scrolling to the bottom")
-        sleep(0.2)
 
-    def __del__(self):
+    def get_pages_loaded(self):
+        return self.pages_loaded
+
+    def is_healthy(self):
+        """
+        :return: True if the browser is up and answers to the driver.
+        """
+        if self.virtual_browser is None:
+            return False
+
+        try:
+            self.virtual_browser.execute_script("return 1;")
+            healthy = True
+        except Exception as ex:
+            logging.info("Browser is not responding: {}".format(ex))
+            healthy = False
+
+        return healthy
+
+    def get_memory_usage(self):
+        """
+        :return: resident memory in MB of the browser (driver included), or None if it can't be measured. Requires
+        the psutil package.
+        """
+        if psutil is None or self.virtual_browser is None:
+            return None
+
         try:
-            self.virtual_browser.quit()
+            driver_process = psutil.Process(self.virtual_browser.service.process.pid)
+            processes = [driver_process] + driver_process.children(recursive=True)
+            memory_usage = sum(process.memory_info().rss for process in processes) / (1024 * 1024)
+        except Exception as ex:
+            logging.debug("Could not measure the memory of the browser: {}".format(ex))
+            memory_usage = None
+
+        return memory_usage
+
+    def close(self):
+        """
+        Quits the browser and its display.
+        """
+        try:
+            if self.virtual_browser is not None:
+                self.virtual_browser.quit()
         except:
             pass
 
-        if not self.gui and self.virtual_browser_display:
+        self.virtual_browser = None
+
+        if self.virtual_browser_display is not None:
             self.virtual_browser_display.stop()
+            self.virtual_browser_display = None
+
+    def __del__(self):
+        self.close()
 
     def send_text_to_input_by_id(self, param, text):
-        input_box = self.virtual_browser.find_element_by_id(param)
+        input_box = self.virtual_browser.find_element(By.ID, param)
         input_box.send_keys(text)
 
     def click_button_by_class(self, param):
         try:
-            button = self.virtual_browser.find_element_by_class_name(param)
+            button = self.virtual_browser.find_element(By.CLASS_NAME, param)
         except Exception as ex:
             logging.info("Error: {}".format(ex))
             button= None
@@ -116,21 +338,54 @@ class WebCore(object):
         if button:
             button.click()
 
+    def _wait_for_page(self, class_name, count, timeout, idle_time):
+        """
+        Waits for the page to have count elements of the class, or to be idle for idle_time seconds.
+        :return: number of elements of the class.
+        """
+        timeout = min(timeout, SCRIPT_TIMEOUT - 1)
+
+        try:
+            result = self.virtual_browser.execute_async_script(WAIT_FOR_PAGE_SCRIPT, class_name, count, timeout,
+                                                               idle_time)
+        except Exception as ex:
+            logging.debug("Error while waiting for the page: {}".format(ex))
+            result = 0 if class_name is None else self.count_elements_by_class(class_name)
+
+        return result
+
+    def wait_for_element_count(self, class_name, count, timeout=TIMEOUT, idle_time=IDLE_TIME):
+        """
+        Waits until there are at least count elements of the class, like the results added after a scroll. It
+        finishes as soon as they arrive, or when the page stops changing for idle_time seconds (no more content is
+        coming), or after timeout seconds.
+        :param idle_time: seconds without changes after which the wait gives up. None to wait until the timeout.
+        :return: number of elements of the class.
+        """
+        return self._wait_for_page(class_name, count, timeout, idle_time)
+
+    def wait_for_dom_idle(self, idle_time=IDLE_TIME, timeout=TIMEOUT):
+        """
+        Waits until the page doesn't change nor load resources for idle_time seconds, or for timeout seconds.
+        """
+        self._wait_for_page(None, None, timeout, idle_time)
+
     def wait_for_elements_from_class(self, class_name):
-        sleep(0.5)
-        WebDriverWait(self.virtual_browser, 5).until(EC.presence_of_element_located((By.CLASS_NAME, class_name)))
+        """
+        Waits for an element of the class to be in the page, for a timeout of 5 seconds.
+        :raises TimeoutException: if there is none after the timeout.
+        """
+        if self.wait_for_element_count(class_name, 1, idle_time=None) == 0:
+            raise TimeoutException("No element of class {} after {} seconds".format(class_name, TIMEOUT))
 
     def manual_wait_for_element_from_class(self, class_name):
         """
-        Waits for the element by manually polling the amoung of elements of the given class in the DOM, for a timeout
-        of 5 seconds.
+        Waits for an element of the class to be in the page, for a timeout of 5 seconds. It doesn't fail if there is
+        none.
         :param class_name:
         :return:
         """
-        init_time = time()
-
-        while len(self.get_elements_html_by_class(class_name)) == 0 and time() - init_time < TIMEOUT:
-            sleep(1)
+        self.wait_for_element_count(class_name, 1, idle_time=None)
 
 # Register the class to enable deserialization.
-TRANSPORT_CORES[str(WebCore)] = WebCore
+register_transport_core(WebCore)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from threading import Thread
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from main.controllers.controller_factory import ControllerFactory
+from main.search_engine.google_images import GoogleImages
+from main.search_session.remote_search_session import RemoteSearchSession
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.service.codec import CONTENT_CODECS, CONTENT_TYPE_JSON, CONTENT_TYPE_MSGPACK, choose_content_type, \
+    encode, decode
+from main.service.global_status import global_status
+from main.service.http_client import HttpClient
+from main.transport_core.webcore import WebCore
+from test.fixtures import SingleSessionFactory
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class ContentTypeRecorder(object):
+    """
+    WSGI middleware that records the Content-Type of the requests received.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.content_types = []
+
+    def __call__(self, environ, start_response):
+        self.content_types.append(environ.get('CONTENT_TYPE', None))
+        return self.wsgi_app(environ, start_response)
+
+
+class CodecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = SearchSession(autostart=False)
+        self.app = Flask(__name__)
+        ControllerFactory(self.app, SingleSessionFactory(self.session)).search_session_controller()
+        self.client = self.app.test_client()
+
+    def test_search_request_uses_compact_ids(self):
+        search_request = SearchRequest("cat", search_engine_proto=GoogleImages, transport_core_proto=WebCore)
+        serial = search_request.serialize()
+
+        self.assertEqual(serial['search_engine'], "GoogleImages")
+        self.assertEqual(serial['transport_core'], "WebCore")
+        self.assertEqual(SearchRequest.deserialize(serial).get_id(), search_request.get_id())
+
+        # Serials of older versions carry the str of the classes.
+        serial['search_engine'] = str(GoogleImages)
+        serial['transport_core'] = str(WebCore)
+        self.assertEqual(SearchRequest.deserialize(serial).get_id(), search_request.get_id())
+
+    def test_content_type_is_negotiated(self):
+        self.assertEqual(choose_content_type(None), CONTENT_TYPE_JSON)
+        self.assertEqual(choose_content_type("text/html, */*"), CONTENT_TYPE_JSON)
+
+        if CONTENT_TYPE_MSGPACK in CONTENT_CODECS:
+            self.assertEqual(choose_content_type("application/msgpack, application/json;q=0.9"),
+                             CONTENT_TYPE_MSGPACK)
+            self.assertEqual(choose_content_type("application/msgpack;q=0, application/json"), CONTENT_TYPE_JSON)
+
+    def test_malformed_content_is_rejected(self):
+        self.assertRaises(ValueError, decode, b"{not json", CONTENT_TYPE_JSON)
+        self.assertRaises(ValueError, decode, b"{}", "application/xml")
+
+        response = self.client.put("/dataset/dataset/session/search-request", data=b"{not json",
+                                   headers={'Content-Type': CONTENT_TYPE_JSON})
+
+        self.assertEqual(response.status_code, 400)
+
+        for body in [b"[]", b"3", b'{"history": [1]}']:
+            response = self.client.post("/dataset/dataset/session/exchange", data=body,
+                                        headers={'Content-Type': CONTENT_TYPE_JSON})
+
+            self.assertEqual(response.status_code, 400)
+
+    @unittest.skipIf(CONTENT_TYPE_MSGPACK not in CONTENT_CODECS, "msgpack is not installed")
+    def test_controller_speaks_msgpack(self):
+        search_requests = [SearchRequest("cat {}".format(index)) for index in range(5)]
+        body = encode({'search_requests': [search_request.serialize() for search_request in search_requests]},
+                      CONTENT_TYPE_MSGPACK)
+
+        response = self.client.put("/dataset/dataset/session/search-request", data=body,
+                                   headers={'Content-Type': CONTENT_TYPE_MSGPACK})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.size(), 5)
+
+        response = self.client.get("/dataset/dataset/session/data", headers={'Accept': CONTENT_TYPE_MSGPACK})
+
+        self.assertEqual(response.mimetype, CONTENT_TYPE_MSGPACK)
+        self.assertEqual(len(decode(response.data, CONTENT_TYPE_MSGPACK)['result']['search_requests']), 5)
+
+        # Clients that don't ask for it keep receiving JSON.
+        response = self.client.get("/dataset/dataset/session/data")
+
+        self.assertEqual(response.mimetype, CONTENT_TYPE_JSON)
+        self.assertEqual(len(json.loads(response.data)['result']['search_requests']), 5)
+
+    @unittest.skipIf(CONTENT_TYPE_MSGPACK not in CONTENT_CODECS, "msgpack is not installed")
+    def test_client_switches_to_msgpack_once_the_backend_answers_in_it(self):
+        recorder = ContentTypeRecorder(self.app.wsgi_app)
+        self.app.wsgi_app = recorder
+        server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            remote_session = RemoteSearchSession("http://127.0.0.1:{}/dataset/dataset/session".format(server.port),
+                                                 HttpClient())
+            remote_session.append_search_requests([SearchRequest("cat")])
+            search_request = remote_session.pop_new_search_request()
+
+            self.assertEqual(search_request.words, "cat")
+            self.assertIsNotNone(search_request.get_lease_id())
+
+            # The backend answered in msgpack, so the next bodies are sent in msgpack.
+            remote_session.append_search_requests([SearchRequest("dog")])
+
+            self.assertEqual(recorder.content_types[0], CONTENT_TYPE_JSON)
+            self.assertEqual(recorder.content_types[-1], CONTENT_TYPE_MSGPACK)
+            self.assertEqual(remote_session.size(), 1)
+
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
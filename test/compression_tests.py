@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import unittest
+from threading import Thread
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from main.controllers.compression_middleware import CompressionMiddleware
+from main.controllers.controller_factory import ControllerFactory
+from main.search_session.remote_search_session import RemoteSearchSession
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.service.compression import CODECS, ENCODING_GZIP, ENCODING_ZSTD, CHUNK_SIZE, ContentTooLarge, \
+    choose_encoding, compress, decompress, compress_stream, decompress_stream
+from main.service.global_status import global_status
+from main.service.http_client import HttpClient
+from test.fixtures import SingleSessionFactory
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class EncodingRecorder(object):
+    """
+    WSGI middleware that records the Content-Encoding of the requests received.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.encodings = []
+
+    def __call__(self, environ, start_response):
+        self.encodings.append(environ.get('HTTP_CONTENT_ENCODING', None))
+        return self.wsgi_app(environ, start_response)
+
+
+class CompressionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = SearchSession(autostart=False)
+        self.app = Flask(__name__)
+        ControllerFactory(self.app, SingleSessionFactory(self.session)).search_session_controller()
+        self.app.wsgi_app = CompressionMiddleware(self.app.wsgi_app)
+        self.client = self.app.test_client()
+
+    @staticmethod
+    def _search_requests(count):
+        return [SearchRequest("some long keywords to fill the body {}".format(index)) for index in range(count)]
+
+    def test_accepted_encoding_is_chosen_by_preference(self):
+        self.assertEqual(choose_encoding("gzip, deflate"), ENCODING_GZIP)
+        self.assertEqual(choose_encoding("gzip;q=0, deflate"), None)
+        self.assertEqual(choose_encoding(None), None)
+
+        if ENCODING_ZSTD in CODECS:
+            self.assertEqual(choose_encoding("gzip, zstd"), ENCODING_ZSTD)
+            self.assertEqual(choose_encoding("*"), ENCODING_ZSTD)
+
+    def test_codecs_round_trip(self):
+        data = b"search request line\n" * 1000
+
+        for encoding in CODECS:
+            self.assertEqual(decompress(compress(data, encoding), encoding), data)
+            compressed = b"".join(compress_stream([data[:100], data[100:].decode()], encoding))
+            self.assertEqual(decompress_stream(io.BytesIO(compressed), encoding).read(), data)
+
+    def test_decompressed_size_is_limited(self):
+        data = b"\0" * (8 * 1024 * 1024)
+
+        for encoding in CODECS:
+            compressed = compress(data, encoding)
+            self.assertEqual(decompress_stream(io.BytesIO(compressed), encoding, max_size=len(data)).read(), data)
+
+            stream = decompress_stream(io.BytesIO(compressed), encoding, max_size=1024 * 1024)
+
+            with self.assertRaises(ContentTooLarge):
+                stream.read()
+
+        # The content is expanded step by step, not all at once.
+        stream = decompress_stream(io.BytesIO(compress(data, ENCODING_GZIP)), ENCODING_GZIP)
+        stream.read(1)
+        self.assertLessEqual(stream.raw.size, CHUNK_SIZE)
+
+    def test_decompression_bombs_are_rejected(self):
+        self.app.wsgi_app.max_body_size = 1024 * 1024
+        bomb = gzip.compress(b" " * (8 * 1024 * 1024))
+
+        for url, content_type in [("/dataset/dataset/session/search-request", "application/json"),
+                                  ("/dataset/dataset/session/stream", "application/x-ndjson")]:
+            response = self.client.put(url, data=bomb, headers={'Content-Encoding': "gzip",
+                                                                'Content-Type': content_type})
+
+            self.assertEqual(response.status_code, 413)
+            self.assertIn("larger than", json.loads(response.data)['message'])
+
+        self.assertEqual(self.session.size(), 0)
+
+    def test_large_responses_are_compressed(self):
+        self.session.append_search_requests(self._search_requests(50))
+
+        response = self.client.get("/dataset/dataset/session/data", headers={'Accept-Encoding': "gzip"})
+
+        self.assertEqual(response.headers['Content-Encoding'], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['result']['search_requests']), 50)
+
+        response = self.client.get("/dataset/dataset/session/size", headers={'Accept-Encoding': "gzip"})
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn("gzip", response.headers['Accept-Encoding'])
+
+    def test_compressed_requests_are_decompressed(self):
+        body = json.dumps({'search_requests': [search_request.serialize() for search_request in
+                                               self._search_requests(10)]}).encode()
+
+        response = self.client.put("/dataset/dataset/session/search-request", data=gzip.compress(body),
+                                   headers={'Content-Encoding': "gzip", 'Content-Type': "application/json"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.size(), 10)
+
+        lines = "".join(self.session.stream_serialize()).encode()
+        self.session.stream_deserialize(SearchSession(autostart=False).stream_serialize())
+        self.assertEqual(self.session.size(), 0)
+
+        response = self.client.put("/dataset/dataset/session/stream", data=gzip.compress(lines),
+                                   headers={'Content-Encoding': "gzip", 'Content-Type': "application/x-ndjson"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.size(), 10)
+
+    def test_unknown_encoding_is_rejected(self):
+        response = self.client.put("/dataset/dataset/session/search-request", data=b"data",
+                                   headers={'Content-Encoding': "br"})
+
+        self.assertEqual(response.status_code, 415)
+
+    def test_client_compresses_once_the_backend_advertises_it(self):
+        recorder = EncodingRecorder(self.app.wsgi_app)
+        self.app.wsgi_app = recorder
+        server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            remote_session = RemoteSearchSession("http://127.0.0.1:{}/dataset/dataset/session".format(server.port),
+                                                 HttpClient())
+            remote_session.append_search_requests(self._search_requests(20))
+            remote_session.append_search_requests(self._search_requests(40))
+
+            self.assertEqual(recorder.encodings[0], None)
+            self.assertIn(recorder.encodings[1], CODECS)
+            self.assertEqual(remote_session.size(), 40)
+
+            # Streamed uploads are compressed on the fly.
+            lines = list(remote_session.stream_serialize())
+            self.session.stream_deserialize(SearchSession(autostart=False).stream_serialize())
+            remote_session.stream_deserialize(iter(lines))
+
+            self.assertIn(recorder.encodings[-1], CODECS)
+            self.assertEqual(remote_session.size(), 40)
+
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
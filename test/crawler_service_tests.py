@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from threading import Thread
+
+from flask import Flask
+
+from main.controllers.controller_factory import ControllerFactory
+from main.crawler_service import CrawlerService
+from main.dataset.dataset_factory import DatasetFactory
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession, MAX_EXCHANGE_REQUESTS
+from main.service.global_status import global_status
+from test.fixtures import SessionHolder, use_recording_workers
+
+__author__ = "Ivan de Paz Centeno"
+
+RESULT = [{'url': 'http://a/1.jpg', 'width': 1, 'height': 1, 'desc': '', 'searchwords': 'word', 'source': 'google'}]
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class UnreachableSearchSession(SearchSession):
+
+    def exchange_search_requests(self, finished_requests=None, failed_requests=None, max_requests=1,
+                                 lease_time=None):
+        raise Exception("Backend unreachable")
+
+
+def build_session(session_class=SearchSession, requests_count=3, priority=0, prefix="word"):
+    session = session_class(autostart=False)
+    session.append_search_requests([SearchRequest("{}{}".format(prefix, index), priority=priority) for index in
+                                    range(requests_count)])
+
+    return session
+
+
+def build_factory(**sessions):
+    dataset_factory = DatasetFactory(autostart=False)
+    dataset_factory.datasets_builders_working = {name: SessionHolder(session) for name, session in sessions.items()}
+
+    return dataset_factory
+
+
+class ExchangeTests(unittest.TestCase):
+
+    def test_exchange_is_capped(self):
+        session = build_session(requests_count=MAX_EXCHANGE_REQUESTS + 10)
+
+        leased_requests, _ = session.exchange_search_requests(max_requests=10 ** 6)
+
+        self.assertEqual(len(leased_requests), MAX_EXCHANGE_REQUESTS)
+
+        with self.assertRaises(ValueError):
+            session.exchange_search_requests(max_requests=-1)
+
+    def test_exchange_reports_and_leases(self):
+        session = build_session()
+        leased_requests, _ = session.exchange_search_requests(max_requests=2)
+        leased_requests[0].associate_result(RESULT)
+
+        new_requests, progress = session.exchange_search_requests([leased_requests[0]], [leased_requests[1]], 1)
+
+        self.assertEqual(len(new_requests), 1)
+        self.assertEqual(progress, 33)
+        self.assertEqual(session.size(), 1)
+
+
+class CrawlerServiceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = build_session()
+        self.crawler_service = CrawlerService(self.session)
+
+    def tearDown(self):
+        self.crawler_service.terminate()
+
+    def test_results_are_reported_to_the_session_they_were_leased_from(self):
+        search_request = self.crawler_service._exchange_requests(1)[0]
+
+        new_session = build_session()
+        self.crawler_service.update_search_session(new_session)
+        self.crawler_service.process_finished([search_request, RESULT])
+        leased_requests = self.crawler_service._exchange_requests(1)
+
+        self.assertEqual(list(self.session.get_history()), [search_request.get_id()])
+        self.assertEqual(len(new_session.get_history()), 0)
+        self.assertEqual(len(leased_requests), 1)
+        self.assertEqual(new_session.size(), 2)
+        self.assertEqual([entry[1] for entry in self.crawler_service.leased_requests.values()], [new_session])
+
+    def test_reports_are_kept_while_their_session_is_unreachable(self):
+        unreachable_session = build_session(UnreachableSearchSession)
+        search_request = unreachable_session.pop_new_search_request()
+        self.crawler_service._track_lease(search_request, unreachable_session)
+        self.crawler_service.process_finished([search_request, None])
+
+        self.crawler_service._exchange_requests(0)
+
+        self.assertEqual(self.crawler_service.outbox, [[unreachable_session, search_request, False]])
+        self.assertEqual(self.session.size(), 3)
+
+
+class PrefetchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = build_session(requests_count=10)
+        self.crawler_service = CrawlerService(self.session, processes=2)
+        self.workers = use_recording_workers(self.crawler_service)
+
+    def tearDown(self):
+        self.crawler_service.terminate()
+
+    def test_requests_are_handed_to_the_free_workers(self):
+        leased_requests = self.crawler_service._exchange_requests(3)
+
+        for search_request in leased_requests:
+            self.crawler_service.queue_request(search_request)
+
+        self.assertEqual([len(worker.calls) for worker in self.workers], [1, 1])
+        self.assertEqual(self.crawler_service.get_queue_size(), 1)
+
+        # The worker that finishes takes the next request at once, and the waiters are woken up.
+        waiter = Thread(target=self.crawler_service.wait_for_queue,
+                        args=(self.crawler_service._has_pending_reports, 10))
+        waiter.start()
+        self.crawler_service._process_finished([self.workers[0].calls[0], RESULT], self.workers[0])
+        waiter.join(10)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual([len(worker.calls) for worker in self.workers], [2, 1])
+        self.assertEqual(self.crawler_service.get_queue_size(), 0)
+        self.assertIsNotNone(self.crawler_service.get_mean_request_duration())
+
+    def test_prefetch_size_follows_the_latency(self):
+        self.assertEqual(self.crawler_service.get_prefetch_size(), 2)
+
+        self.crawler_service.mean_request_duration = 1
+        self.crawler_service.exchange_latency = 1
+
+        self.assertEqual(self.crawler_service.get_prefetch_size(), 4)
+
+        self.crawler_service.exchange_latency = 100
+
+        self.assertEqual(self.crawler_service.get_prefetch_size(), 8)
+
+        self.crawler_service.exchange_latency = 0.01
+
+        self.assertEqual(self.crawler_service.get_prefetch_size(), 2)
+
+    def test_buffered_leases_are_released_on_stop(self):
+        for worker in self.workers:  # no worker is free
+            worker.busy = True
+
+        for search_request in self.crawler_service._exchange_requests(4):
+            self.crawler_service.queue_request(search_request)
+
+        self.crawler_service.stop()
+
+        self.assertEqual(self.crawler_service.get_queue_size(), 0)
+        self.assertEqual(self.session.size(), 10)
+
+
+class CrawlLeaseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session_a = build_session(prefix="a")
+        self.session_b = build_session(prefix="b")
+        self.dataset_factory = build_factory(a=self.session_a, b=self.session_b)
+
+    def test_requests_are_leased_by_priority_across_datasets(self):
+        self.session_b.append_search_requests([SearchRequest("urgent", priority=5)])
+
+        leased_requests = self.dataset_factory.lease_search_requests(2)
+
+        self.assertEqual(leased_requests[0][0], "b")
+        self.assertEqual(leased_requests[0][1].words, "urgent")
+        self.assertIsNotNone(leased_requests[0][1].get_lease_id())
+
+    def test_least_completed_dataset_goes_first(self):
+        search_request = self.session_a.pop_new_search_request()
+        search_request.associate_result(RESULT)
+        self.session_a.add_history_entry(search_request)
+
+        leased_requests = self.dataset_factory.lease_search_requests(2)
+
+        self.assertEqual([name for name, _ in leased_requests], ["b", "b"])
+
+    def test_all_the_work_is_leased(self):
+        leased_requests = self.dataset_factory.lease_search_requests(10)
+
+        self.assertEqual(len(leased_requests), 6)
+        self.assertEqual(self.dataset_factory.lease_search_requests(1), [])
+
+        with self.assertRaises(ValueError):
+            self.dataset_factory.lease_search_requests(-1)
+
+    def test_lease_endpoint(self):
+        app = Flask(__name__)
+        ControllerFactory(app, self.dataset_factory).dataset_factory_controller()
+        client = app.test_client()
+
+        response = client.post("/crawl/lease?max_requests=4&lease_time=60")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(serial['dataset'] for serial in response.get_json()['result']), ["a", "a", "b", "b"])
+        self.assertEqual(response.get_json()['result'][0]['lease']['lease_time'], 60)
+
+        self.assertEqual(client.post("/crawl/lease?max_requests=-1").status_code, 400)
+        self.assertEqual(client.post("/crawl/lease?lease_time=0").status_code, 400)
+
+    def test_crawler_leases_from_the_factory(self):
+        crawler_service = CrawlerService(dataset_factory=self.dataset_factory)
+
+        try:
+            leased_requests = crawler_service._exchange_requests(4)
+
+            for search_request in leased_requests:
+                crawler_service.process_finished([search_request, RESULT])
+
+            crawler_service._exchange_requests(0)
+
+            self.assertEqual(len(leased_requests), 4)
+            self.assertEqual(len(self.session_a.get_history()), 2)
+            self.assertEqual(len(self.session_b.get_history()), 2)
+            self.assertEqual(crawler_service.leased_requests, {})
+
+        finally:
+            crawler_service.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
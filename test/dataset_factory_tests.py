@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from threading import Event, Thread
+
+from main.dataset.dataset_factory import DatasetFactory
+from main.search_session.search_session import SearchSession
+from main.service.global_status import global_status
+from test.fixtures import SessionHolder
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class BlockedDatasetFactory(DatasetFactory):
+    """
+    Dataset factory whose creation of sessions blocks until it is released, and then fails.
+    """
+
+    def __init__(self):
+        self.creating = Event()
+        self.release = Event()
+        DatasetFactory.__init__(self, autostart=False)
+
+    def _create_search_session(self, name, dataset_type):
+        self.creating.set()
+        self.release.wait(10)
+        raise Exception("Session could not be created.")
+
+
+class DatasetFactoryRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset_factory = BlockedDatasetFactory()
+        self.session = SearchSession(autostart=False)
+        self.holder = SessionHolder(self.session)
+        self.dataset_factory.datasets_builders_working = {'ready': self.holder}
+
+    def tearDown(self):
+        self.dataset_factory.release.set()
+
+    def _create_in_background(self, name):
+        errors = []
+
+        def create():
+            try:
+                self.dataset_factory.create_dataset(name)
+            except Exception as ex:
+                errors.append(ex)
+
+        thread = Thread(target=create, daemon=True)
+        thread.start()
+        self.assertTrue(self.dataset_factory.creating.wait(10))
+
+        return thread, errors
+
+    def test_lookups_are_not_blocked_by_a_creation(self):
+        thread, _ = self._create_in_background("new")
+
+        # The creation is in progress, and it holds no lock that the lookups need.
+        self.assertIs(self.dataset_factory.get_session_from_dataset_name("ready"), self.session)
+        self.assertEqual(self.dataset_factory.get_dataset_builder_names(), ["ready"])
+        self.assertEqual(self.dataset_factory.lease_search_requests(1), [])
+
+        self.dataset_factory.release.set()
+        thread.join(10)
+
+    def test_name_is_reserved_while_it_is_created(self):
+        thread, errors = self._create_in_background("new")
+
+        self.assertIsNone(self.dataset_factory.create_dataset("new"))
+        self.assertIsNone(self.dataset_factory.create_dataset("ready"))
+
+        self.dataset_factory.release.set()
+        thread.join(10)
+
+        # The creation failed, so the name is free again.
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.dataset_factory.reserved_names, set())
+        self.assertEqual(self.dataset_factory.get_dataset_builder_names(), ["ready"])
+
+    def test_registry_is_replaced_on_removal(self):
+        registry = self.dataset_factory.datasets_builders_working
+
+        self.dataset_factory.remove_dataset_builder_by_name("ready")
+
+        self.assertTrue(self.holder.stopped)
+        self.assertIsNone(self.dataset_factory.get_session_from_dataset_name("ready"))
+        self.assertEqual(list(registry), ["ready"])
+
+
+if __name__ == '__main__':
+    unittest.main()
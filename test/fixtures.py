@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from main.service.request_pool import PoolWorker
+
+__author__ = "Ivan de Paz Centeno"
+
+# Stand-ins shared by the test modules.
+
+
+class SingleSessionFactory(object):
+    """
+    Dataset factory with a single dataset, to exercise the controllers.
+    """
+
+    def __init__(self, search_session):
+        self.search_session = search_session
+
+    def get_session_from_dataset_name(self, name):
+        return self.search_session if name == "dataset" else None
+
+
+class SessionHolder(object):
+    """
+    Stands for a dataset builder, which only needs to hold its session for the factory to lease its requests.
+    """
+
+    def __init__(self, search_session):
+        self.search_session = search_session
+        self.stopped = False
+
+    def get_search_session(self):
+        return self.search_session
+
+    def stop(self, wait_for_finish=True):
+        self.stopped = True
+
+
+class RecordingWorker(PoolWorker):
+    """
+    Stands for a worker process: records the requests handed to it instead of processing them.
+    """
+
+    def __init__(self, index):
+        PoolWorker.__init__(self, index, None, None)
+        self.calls = []
+
+    def start(self):
+        pass
+
+    def submit(self, queue_element):
+        self.calls.append(queue_element[0])
+
+    def terminate(self, timeout=0):
+        pass
+
+
+def use_recording_workers(request_pool):
+    """
+    Replaces the worker processes of the pool with recording workers.
+    :return: the recording workers.
+    """
+    # The workers are replaced before they are killed, so the pool doesn't respawn them.
+    workers = request_pool.workers
+    request_pool.workers = [RecordingWorker(index) for index in range(request_pool.pool_limit)]
+
+    for worker in workers:
+        worker.terminate()
+
+    return request_pool.workers
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.search_session.session_journal import SessionJournal
+from main.search_session.session_store.sqlite_session_store import SQLiteSessionStore
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class HistoryFeedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _new_sessions(self):
+        return [SearchSession(autostart=False),
+                SearchSession(autostart=False, store=SQLiteSessionStore(os.path.join(self.folder, "feed.sqlite")))]
+
+    @staticmethod
+    def _finish(session, words):
+        session.add_history_entry(SearchRequest(words))
+
+    @staticmethod
+    def _words(search_requests):
+        return [search_request.get_words() for search_request in search_requests]
+
+    def test_entries_are_retrieved_in_order_from_the_cursor(self):
+        for session in self._new_sessions():
+            for words in ["a", "b", "c"]:
+                self._finish(session, words)
+
+            search_requests, next_sequence = session.get_history_since(0, 2)
+            self.assertEqual(self._words(search_requests), ["a", "b"])
+
+            search_requests, next_sequence = session.get_history_since(next_sequence)
+            self.assertEqual(self._words(search_requests), ["c"])
+            self.assertEqual(session.get_history_since(next_sequence), ([], next_sequence))
+
+    def test_entry_added_again_is_retrieved_again(self):
+        for session in self._new_sessions():
+            self._finish(session, "a")
+            self._finish(session, "b")
+            _, next_sequence = session.get_history_since()
+            self._finish(session, "a")
+
+            self.assertEqual(self._words(session.get_history_since(next_sequence)[0]), ["a"])
+            self.assertEqual(self._words(session.get_history_since()[0]), ["b", "a"])
+
+    def test_cursor_is_valid_after_a_reset(self):
+        for session in self._new_sessions():
+            self._finish(session, "a")
+            _, next_sequence = session.get_history_since()
+            session.reset()
+            self._finish(session, "b")
+
+            self.assertEqual(self._words(session.get_history_since(next_sequence)[0]), ["b"])
+
+    def test_negative_values_are_rejected(self):
+        for session in self._new_sessions():
+            with self.assertRaises(ValueError):
+                session.get_history_since(-1)
+
+            with self.assertRaises(ValueError):
+                session.get_history_since(0, -1)
+
+    def test_sequences_survive_a_journal_recovery(self):
+        path = os.path.join(self.folder, "session")
+        session = SearchSession(autostart=False, journal=SessionJournal(path))
+
+        for words in ["a", "b", "c"]:
+            self._finish(session, words)
+
+        self._finish(session, "a")
+        session.reset()
+        self._finish(session, "b")
+        self._finish(session, "d")
+        session._compact_journal()
+        self._finish(session, "e")
+        session.journal.close()
+
+        expected = session.get_history_since(3)
+
+        recovered = SearchSession(autostart=False, journal=SessionJournal(path))
+
+        self.assertEqual(self._words(recovered.get_history_since(3)[0]), self._words(expected[0]))
+        self.assertEqual(recovered.get_history_since(3)[1], expected[1])
+        self.assertEqual(self._words(recovered.get_history_since(4)[0]), ["b", "d", "e"])
+
+
+if __name__ == '__main__':
+    unittest.main()
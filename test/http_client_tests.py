@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+import requests
+
+from main.service.http_client import HttpClient
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        server = self.server
+        server.calls += 1
+        server.connections.add(self.client_address)
+        status_code = server.status_codes.pop(0) if server.status_codes else 200
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(status_code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_PUT = do_POST = do_PATCH = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.server.calls = 0
+        self.server.connections = set()
+        self.server.status_codes = []
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_port)
+
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = HttpClient(retries=2, backoff=0.01)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(3):
+            self.assertEqual(self.client.put(self.url, data=b"body").content, b"body")
+
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.client.get_stats()['PUT']['count'], 3)
+
+    def test_safe_calls_are_retried(self):
+        self.server.status_codes = [503, 502]
+
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.server.calls, 3)
+        self.assertEqual(self.client.get_stats()['GET']['retries'], 2)
+
+    def test_retries_are_bounded(self):
+        self.server.status_codes = [503, 503, 503, 503]
+
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.assertEqual(self.server.calls, 3)
+        self.assertEqual(self.client.get_stats()['GET']['errors'], 1)
+
+    def test_unsafe_calls_are_not_retried(self):
+        self.server.status_codes = [503]
+
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 503)
+        self.assertEqual(self.server.calls, 1)
+
+        self.server.status_codes = [503]
+
+        self.assertEqual(self.client.put(self.url, data=b"body").status_code, 503)
+        self.assertEqual(self.server.calls, 2)
+
+    def test_unsafe_calls_are_retried_on_demand(self):
+        self.server.status_codes = [503]
+
+        self.assertEqual(self.client.patch(self.url, retry=True).status_code, 200)
+        self.assertEqual(self.server.calls, 2)
+        self.assertEqual(self.client.get_stats()['PATCH']['retries'], 1)
+
+    def test_unreachable_backend_raises(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        with self.assertRaises(requests.ConnectionError):
+            self.client.get(self.url)
+
+        self.assertEqual(self.client.get_stats()['GET']['retries'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
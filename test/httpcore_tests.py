@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from threading import Thread
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from main.search_engine.google_images import GoogleImages
+from main.search_engine.howold_images import HowOldImages
+from main.search_session.search_request import SearchRequest
+from main.service.global_status import global_status
+from main.transport_core.httpcore import HttpCore
+from main.transport_core.webcore import WebCore
+
+__author__ = "Ivan de Paz Centeno"
+
+PAGE = """<html><body>
+<div id="results">
+<a class="result first" href="/1"><img src="/1.jpg"></a>
+<a class="result" href="/2"><img src="/2.jpg"></a>
+</div>
+<script>document.write('<a class="result" href="/3"></a>');</script>
+</body></html>"""
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class HttpCoreTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app = Flask(__name__)
+        app.route("/search")(lambda: PAGE)
+        cls.server = make_server("127.0.0.1", 0, app, threaded=True)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.http_core = HttpCore()
+        self.http_core.get("http://127.0.0.1:{}/search".format(self.server.port))
+
+    def test_elements_are_read_as_in_the_browser(self):
+        self.assertEqual(self.http_core.get_elements_html_by_class("result"),
+                         ['<img src="/1.jpg"/>', '<img src="/2.jpg"/>'])
+        self.assertEqual(self.http_core.get_elements_html_by_class("first", False),
+                         ['<a class="result first" href="/1"><img src="/1.jpg"/></a>'])
+        self.assertEqual(len(self.http_core.get_elements_html_by_tag("img")), 2)
+        self.assertEqual(len(self.http_core.get_elements_html_by_id("results")), 1)
+        self.assertEqual(self.http_core.get_elements_html_by_id("missing"), [])
+        self.assertEqual(self.http_core.get_pages_loaded(), 1)
+
+    def test_elements_are_counted_and_their_attributes_read(self):
+        self.assertEqual(self.http_core.count_elements_by_class("result"), 2)
+        self.assertEqual(self.http_core.count_elements_by_class("missing"), 0)
+        self.assertEqual(self.http_core.get_elements_attribute_by_class("result", "href"), ["/1", "/2"])
+        self.assertEqual(self.http_core.get_elements_attribute_by_class("result", "class"),
+                         ["result first", "result"])
+        self.assertEqual(self.http_core.get_elements_attribute_by_class("result", "title"), [None, None])
+
+    def test_waits_and_scrolls_do_nothing(self):
+        self.http_core.scroll_to_bottom()
+        self.http_core.wait_for_elements_from_class("result")
+
+        self.assertEqual(len(self.http_core.get_elements_html_by_class("result")), 2)
+
+    def test_requests_can_choose_it(self):
+        serial = SearchRequest("word", transport_core_proto=HttpCore).serialize()
+
+        self.assertEqual(serial['transport_core'], "HttpCore")
+        self.assertIs(SearchRequest.deserialize(serial).get_transport_core_proto(), HttpCore)
+
+    def test_engines_that_need_a_browser_refuse_it(self):
+        with self.assertRaises(ValueError):
+            GoogleImages()._get_transport_core_proto(SearchRequest("word", transport_core_proto=HttpCore))
+
+        search_request = SearchRequest("word", transport_core_proto=WebCore)
+
+        self.assertIs(HowOldImages(light_transport_core_proto=HttpCore)._get_transport_core_proto(search_request),
+                      HttpCore)
+        self.assertIs(GoogleImages(light_transport_core_proto=HttpCore)._get_transport_core_proto(search_request),
+                      WebCore)
+
+
+if __name__ == '__main__':
+    unittest.main()
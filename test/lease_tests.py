@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from main.search_session.lease_timer_wheel import LeaseTimerWheel
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class LeaseTimerWheelTests(unittest.TestCase):
+
+    def test_leases_expire_after_their_slot(self):
+        now = time.time()
+        wheel = LeaseTimerWheel(resolution=1.0)
+        wheel.add("a", now + 5)
+        wheel.add("b", now + 20)
+
+        self.assertEqual(wheel.expire(now + 1), [])
+        self.assertEqual(wheel.expire(now + 7), ["a"])
+        self.assertEqual(wheel.expire(now + 100), ["b"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_moved_and_removed_leases(self):
+        now = time.time()
+        wheel = LeaseTimerWheel()
+        wheel.add("a", now + 5)
+        wheel.add("b", now + 5)
+        wheel.add("a", now + 50)
+        wheel.remove("b")
+
+        self.assertEqual(wheel.expire(now + 10), [])
+        self.assertEqual(wheel.expire(now + 60), ["a"])
+
+
+class SessionLeaseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = SearchSession(autostart=False)
+        self.session.append_search_requests([SearchRequest("word{}".format(index)) for index in range(3)])
+
+    def test_expired_lease_requeues_the_request(self):
+        search_request = self.session.pop_new_search_request(lease_time=0.1)
+        self.assertEqual(self.session.size(), 2)
+
+        # Leases expire once their slot of the wheel (1 second) is over.
+        time.sleep(2.1)
+        self.session._expire_leases()
+
+        self.assertEqual(self.session.size(), 3)
+        self.assertFalse(self.session.renew_lease(search_request.get_lease_id()))
+
+    def test_renew_and_release(self):
+        search_request = self.session.pop_new_search_request()
+
+        self.assertTrue(self.session.renew_lease(search_request.get_lease_id(), 10))
+        self.assertTrue(self.session.release_lease(search_request.get_lease_id()))
+        self.assertFalse(self.session.release_lease(search_request.get_lease_id()))
+        self.assertEqual(self.session.size(), 3)
+
+    def test_late_report_removes_the_requeued_request(self):
+        search_request = self.session.pop_new_search_request()
+        self.session.release_lease(search_request.get_lease_id())
+        self.session.add_history_entry(search_request)
+
+        self.assertEqual(self.session.size(), 2)
+        self.assertEqual(len(self.session.leases), 0)
+
+    def test_invalid_lease_times_are_rejected_before_popping(self):
+        for lease_time in [float('inf'), float('nan'), 0, -5, 10 ** 9]:
+            with self.assertRaises(ValueError):
+                self.session.pop_new_search_request(lease_time)
+
+            with self.assertRaises(ValueError):
+                self.session.exchange_search_requests(max_requests=1, lease_time=lease_time)
+
+        self.assertEqual(self.session.size(), 3)
+        self.assertEqual(self.session.store.count_in_progress(), 0)
+
+        search_request = self.session.pop_new_search_request()
+
+        with self.assertRaises(ValueError):
+            self.session.renew_lease(search_request.get_lease_id(), float('inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
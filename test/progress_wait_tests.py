@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from threading import Timer
+
+from flask import Flask
+
+from main.controllers.controller_factory import ControllerFactory
+from main.dataset.dataset_factory import DatasetFactory
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.service.global_status import global_status
+from test.fixtures import SingleSessionFactory
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class ProgressWaitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = SearchSession(autostart=False)
+        self.session.append_search_requests([SearchRequest("word")])
+
+    def _finish_later(self, delay=0.2):
+        search_request = self.session.pop_new_search_request()
+        Timer(delay, self.session.add_history_entry, [search_request]).start()
+
+    def test_changed_progress_is_returned_immediately(self):
+        start_time = time.time()
+
+        self.assertEqual(self.session.wait_for_completion_progress(50, 5), 0)
+        self.assertLess(time.time() - start_time, 1)
+
+    def test_wait_expires_without_changes(self):
+        self.assertEqual(self.session.wait_for_completion_progress(0, 0.2), 0)
+
+    def test_waiter_is_woken_up_by_the_change(self):
+        self._finish_later()
+        start_time = time.time()
+
+        self.assertEqual(self.session.wait_for_completion_progress(0, 5), 100)
+        self.assertLess(time.time() - start_time, 2)
+
+    def test_build_progress_is_throttled(self):
+        previous = {'status': "SERVICE_CRAWLING_DATA", 'percent': 10}
+
+        self.assertFalse(DatasetFactory._has_progressed({'status': "SERVICE_CRAWLING_DATA", 'percent': 14}, previous, 5))
+        self.assertTrue(DatasetFactory._has_progressed({'status': "SERVICE_CRAWLING_DATA", 'percent': 15}, previous, 5))
+        self.assertTrue(DatasetFactory._has_progressed({'status': "SERVICE_FETCHING_DATA", 'percent': 0}, previous, 5))
+        self.assertTrue(DatasetFactory._has_progressed({'status': "SERVICE_CRAWLING_DATA", 'percent': 100},
+                                                       {'status': "SERVICE_CRAWLING_DATA", 'percent': 99}, 5))
+
+    def test_completion_progress_long_poll(self):
+        app = Flask(__name__)
+        ControllerFactory(app, SingleSessionFactory(self.session)).search_session_controller()
+        client = app.test_client()
+
+        self._finish_later()
+        response = client.get("/dataset/dataset/session/completion-progress?wait=5&progress=0")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b"100")
+        self.assertEqual(client.get("/dataset/dataset/session/completion-progress?wait=-1").status_code, 400)
+        self.assertEqual(client.get("/dataset/dataset/session/completion-progress").data, b"100")
+
+
+if __name__ == '__main__':
+    unittest.main()
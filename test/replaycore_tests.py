@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.search_engine.google_images import GoogleImages
+from main.search_session.search_request import SearchRequest
+from main.service.global_status import global_status
+from main.transport_core.replaycore import RecordingCore, ReplayCore
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class ScrollingCore(object):
+    """
+    Stands for a browser on a results page that reveals one more result on every scroll, up to three.
+    """
+
+    def __init__(self):
+        self.revealed = 0
+        self.pages_loaded = 0
+
+    def get(self, url):
+        self.revealed = 1
+        self.pages_loaded += 1
+
+    def scroll_to_bottom(self):
+        self.revealed = min(self.revealed + 1, 3)
+
+    def get_elements_html_by_class(self, class_name, innerHTML=True):
+        return [json.dumps({'ou': "http://a/{}.jpg".format(index), 'ow': 1, 'oh': 1, 'pt': ''}) for index in
+                range(self.revealed)] if class_name == "rg_meta" else []
+
+    def count_elements_by_class(self, class_name):
+        return len(self.get_elements_html_by_class(class_name))
+
+    def wait_for_element_count(self, class_name, count, *args):
+        return self.count_elements_by_class(class_name)
+
+    def close(self):
+        pass
+
+
+class ReplayCoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.recordings_dir = tempfile.mkdtemp()
+        self.search_request = SearchRequest("cat", search_engine_proto=GoogleImages,
+                                            transport_core_proto=ReplayCore)
+
+    def tearDown(self):
+        shutil.rmtree(self.recordings_dir)
+
+    def _retrieve(self, transport_core):
+        return GoogleImages(transport_core_provider=lambda proto: transport_core).retrieve(self.search_request)
+
+    def test_engine_gets_the_same_results_replayed(self):
+        recording_core = RecordingCore(ScrollingCore(), self.recordings_dir)
+        recorded_result = self._retrieve(recording_core)
+
+        # The reads are saved at once, when the core is done with the page.
+        self.assertEqual(os.listdir(self.recordings_dir), [])
+        recording_core.close()
+        self.assertEqual(len(os.listdir(self.recordings_dir)), 1)
+
+        replay_core = ReplayCore(self.recordings_dir)
+
+        self.assertEqual(len(recorded_result), 3)
+        self.assertEqual(self._retrieve(replay_core), recorded_result)
+        self.assertEqual(self._retrieve(replay_core), recorded_result)
+        self.assertEqual(replay_core.get_pages_loaded(), 2)
+
+    def test_page_is_saved_when_the_next_one_is_requested(self):
+        recording_core = RecordingCore(ScrollingCore(), self.recordings_dir)
+        recording_core.get("http://a/1")
+        recording_core.count_elements_by_class("rg_meta")
+        recording_core.get("http://a/2")
+
+        replay_core = ReplayCore(self.recordings_dir)
+        replay_core.get("http://a/1")
+
+        self.assertEqual(replay_core.count_elements_by_class("rg_meta"), 1)
+
+    def test_unrecorded_pages_have_no_elements(self):
+        replay_core = ReplayCore(self.recordings_dir)
+
+        self.assertEqual(self._retrieve(replay_core), [])
+        self.assertEqual(replay_core.get_elements_html_by_id("results"), [])
+        self.assertEqual(replay_core.count_elements_by_class("rg_meta"), 0)
+
+    def test_requests_can_choose_it(self):
+        serial = self.search_request.serialize()
+
+        self.assertEqual(serial['transport_core'], "ReplayCore")
+        self.assertIs(SearchRequest.deserialize(serial).get_transport_core_proto(), ReplayCore)
+
+
+if __name__ == '__main__':
+    unittest.main()
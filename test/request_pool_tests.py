@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from time import sleep
+
+from main.search_engine.search_engine import SearchEngine
+from main.search_session.search_request import SearchRequest
+from main.service import request_pool
+from main.service.global_status import global_status
+from main.service.request_pool import RequestPool, MAX_SKIPS
+from test.fixtures import use_recording_workers
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class CountingCore(object):
+    """
+    Transport core that counts how many times it was launched.
+    """
+    launched = 0
+
+    def __init__(self):
+        CountingCore.launched += 1
+
+
+class OtherCore(CountingCore):
+    pass
+
+
+class FirstEngine(SearchEngine):
+
+    def retrieve(self, search_request):
+        self._prepare_transport_core(search_request)
+        return [{'core': self.transport_core}]
+
+
+class SecondEngine(FirstEngine):
+    pass
+
+
+class StuckEngine(FirstEngine):
+
+    def retrieve(self, search_request):
+        sleep(60)
+        return []
+
+
+class WorkerCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        CountingCore.launched = 0
+        request_pool.search_engines.clear()
+        request_pool.transport_core_pool.close()
+
+    def tearDown(self):
+        request_pool.search_engines.clear()
+        request_pool.transport_core_pool.close()
+
+    @staticmethod
+    def _process(search_engine_proto, transport_core_proto=CountingCore):
+        search_request = SearchRequest("word", search_engine_proto=search_engine_proto,
+                                       transport_core_proto=transport_core_proto)
+
+        return request_pool.process([search_request])[1][0]['core']
+
+    def test_engines_share_the_transport_core(self):
+        cores = [self._process(FirstEngine), self._process(SecondEngine), self._process(FirstEngine)]
+
+        self.assertEqual(CountingCore.launched, 1)
+        self.assertIs(cores[0], cores[1])
+        self.assertIs(cores[0], cores[2])
+        self.assertEqual(set(request_pool.search_engines), {FirstEngine, SecondEngine})
+
+    def test_one_transport_core_per_proto(self):
+        counting_core = self._process(FirstEngine)
+        other_core = self._process(FirstEngine, OtherCore)
+
+        self.assertIsInstance(other_core, OtherCore)
+        self.assertIs(self._process(SecondEngine), counting_core)
+        self.assertEqual(CountingCore.launched, 2)
+
+    def test_engines_follow_the_replaced_transport_core(self):
+        first_core = self._process(FirstEngine)
+        request_pool.transport_core_pool.close()
+
+        second_core = self._process(FirstEngine)
+
+        self.assertIsNot(second_core, first_core)
+        self.assertEqual(CountingCore.launched, 2)
+
+    def test_standalone_engine_creates_its_own_core(self):
+        search_request = SearchRequest("word", search_engine_proto=FirstEngine, transport_core_proto=CountingCore)
+        search_engine = FirstEngine()
+
+        self.assertIsNone(search_engine.transport_core)
+
+        first_core = search_engine.retrieve(search_request)[0]['core']
+
+        self.assertIs(search_engine.retrieve(search_request)[0]['core'], first_core)
+        self.assertEqual(CountingCore.launched, 1)
+        self.assertEqual(request_pool.transport_core_pool.transport_cores, {})
+
+
+class AffinityTests(unittest.TestCase):
+
+    def setUp(self):
+        self.request_pool = RequestPool(pool_limit=2)
+        self.workers = use_recording_workers(self.request_pool)
+
+    def tearDown(self):
+        self.request_pool.terminate()
+
+    def _queue(self, *search_engine_protos):
+        search_requests = [SearchRequest("word{}".format(index), search_engine_proto=search_engine_proto) for
+                           index, search_engine_proto in enumerate(search_engine_protos)]
+
+        for search_request in search_requests:
+            self.request_pool.queue_request(search_request)
+
+        return search_requests
+
+    def _finish(self, worker):
+        self.request_pool._process_finished([worker.calls[-1], None], worker)
+
+    def test_free_worker_takes_the_request_of_its_engine(self):
+        first, second = self._queue(FirstEngine, SecondEngine)
+
+        self.assertEqual(self.workers[0].calls, [first])
+        self.assertEqual(self.workers[1].calls, [second])
+
+        _, _, first_again = self._queue(SecondEngine, SecondEngine, FirstEngine)
+        self._finish(self.workers[0])
+
+        # The worker warmed up for the first engine skips the older requests of the second one.
+        self.assertEqual(self.workers[0].calls, [first, first_again])
+        self.assertEqual(self.request_pool.get_queue_size(), 2)
+
+    def test_idle_worker_steals_requests_of_other_engines(self):
+        self._queue(FirstEngine, FirstEngine)
+        waiting = self._queue(FirstEngine)[0]
+
+        self.assertEqual(self.workers[1].last_engine, FirstEngine)
+
+        self._finish(self.workers[1])
+
+        self.assertEqual(self.workers[1].calls[-1], waiting)
+
+        # No request of its engine is queued, so the worker takes the oldest one of any engine.
+        second = self._queue(SecondEngine)[0]
+        self._finish(self.workers[0])
+
+        self.assertEqual(self.workers[0].calls[-1], second)
+        self.assertEqual(self.workers[0].last_engine, SecondEngine)
+
+    def test_overtaken_request_is_served_first(self):
+        self._queue(FirstEngine, FirstEngine)
+        overtaken = self._queue(SecondEngine)[0]
+
+        for _ in range(MAX_SKIPS):
+            self._queue(FirstEngine)
+            self._finish(self.workers[0])
+
+            self.assertNotEqual(self.workers[0].calls[-1], overtaken)
+
+        self._queue(FirstEngine)
+        self._finish(self.workers[0])
+
+        self.assertEqual(self.workers[0].calls[-1], overtaken)
+        self.assertEqual(self.request_pool.get_queue_size(), 1)
+
+
+class DeadWorkerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.request_pool = RequestPool(pool_limit=1, time_secs_between_requests=0)
+        self.results = []
+        self.request_pool.process_finished = self.results.append
+
+    def tearDown(self):
+        self.request_pool.terminate()
+
+    def test_dead_worker_is_respawned(self):
+        stuck = SearchRequest("stuck", search_engine_proto=StuckEngine)
+        self.request_pool.queue_request(stuck)
+        dead_worker = self.request_pool.workers[0]
+        dead_worker.process.kill()
+
+        # The request held by the dead worker is reported without result.
+        self.assertTrue(self.request_pool.wait_for_queue(lambda: len(self.results) == 1, 10))
+        self.assertEqual(self.results[0][0].get_id(), stuck.get_id())
+        self.assertIsNone(self.results[0][1])
+
+        worker = self.request_pool.workers[0]
+        self.assertIsNot(worker, dead_worker)
+        self.assertEqual(self.request_pool.get_processes_free(), 1)
+
+        self.request_pool.queue_request(SearchRequest("next", search_engine_proto=FirstEngine,
+                                                      transport_core_proto=CountingCore))
+
+        self.assertTrue(self.request_pool.wait_for_queue(lambda: len(self.results) == 2, 10))
+        self.assertIsNotNone(self.results[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from main.dataset.data_fetcher import DataFetcher
+from main.search_session.result_set import ResultSet
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def build_result(index, source="google"):
+    return {'url': 'http://a/{}.jpg'.format(index), 'width': index, 'height': str(index * 2),
+            'desc': 'description {}'.format(index), 'searchwords': 'cat', 'source': source}
+
+
+class ResultSetTests(unittest.TestCase):
+
+    def test_results_are_rebuilt_as_dicts(self):
+        results = [build_result(index, source) for index, source in [(1, "google"), (2, "yahoo"), (3, "google")]]
+        result_set = ResultSet(results)
+
+        self.assertEqual(len(result_set), 3)
+        self.assertEqual(result_set[1], {'url': 'http://a/2.jpg', 'width': 2, 'height': 4, 'desc': 'description 2',
+                                         'searchwords': 'cat', 'source': 'yahoo'})
+        self.assertEqual(result_set[-1]['url'], 'http://a/3.jpg')
+        self.assertEqual(result_set.strings, ['cat', 'google', 'yahoo'])
+
+    def test_incomplete_results_are_discarded(self):
+        incomplete = build_result(2)
+        del incomplete['desc']
+
+        result_set = ResultSet([build_result(1), incomplete])
+
+        self.assertEqual([result['url'] for result in result_set], ['http://a/1.jpg'])
+
+    def test_irregular_values_are_kept(self):
+        result = build_result(1)
+        result['width'] = None
+        result['height'] = "unknown"
+        result['url'] = None
+        result['thumbnail'] = "http://a/1_s.jpg"
+
+        rebuilt = ResultSet([result, build_result(2)])
+
+        self.assertEqual(rebuilt[0], result)
+        self.assertEqual(rebuilt[1], {'url': 'http://a/2.jpg', 'width': 2, 'height': 4, 'desc': 'description 2',
+                                      'searchwords': 'cat', 'source': 'google'})
+        self.assertEqual(list(rebuilt.extras), [0])
+
+    def test_invalid_results_are_not_fetched(self):
+        result = build_result(1)
+        result['url'] = None
+
+        valid_results = DataFetcher._discard_invalid_requests(ResultSet([result, build_result(2)]))
+
+        self.assertEqual([valid_result['url'] for valid_result in valid_results], ['http://a/2.jpg'])
+
+    def test_serialization_round_trip(self):
+        result_set = ResultSet([build_result(index) for index in range(5)])
+
+        self.assertEqual(ResultSet.deserialize(result_set.serialize()).serialize(), result_set.serialize())
+
+    def test_out_of_range_index(self):
+        with self.assertRaises(IndexError):
+            ResultSet([build_result(1)])[1]
+
+        self.assertEqual(list(ResultSet()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
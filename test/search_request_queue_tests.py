@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from main.search_engine.google_images import GoogleImages
+from main.search_engine.yahoo_images import YahooImages
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_request_queue import SearchRequestQueue
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class SearchRequestQueueTests(unittest.TestCase):
+
+    def _pop_all_words(self, queue):
+        words = []
+        search_request = queue.pop_next()
+
+        while search_request is not None:
+            words.append(search_request.get_words())
+            search_request = queue.pop_next()
+
+        return words
+
+    def test_round_robin_across_engines_and_groups(self):
+        queue = SearchRequestQueue()
+
+        for words, engine, group in [("a1", GoogleImages, "a"), ("a2", GoogleImages, "a"), ("b1", GoogleImages, "b"),
+                                     ("y1", YahooImages, "a")]:
+            queue.put(SearchRequest(words, search_engine_proto=engine, group=group))
+
+        self.assertEqual(self._pop_all_words(queue), ["a1", "y1", "b1", "a2"])
+        self.assertEqual(len(queue), 0)
+
+    def test_higher_priority_first(self):
+        queue = SearchRequestQueue()
+        queue.put(SearchRequest("low"))
+        queue.put(SearchRequest("high", priority=5))
+
+        self.assertEqual(queue.get_next_priority(), 5)
+        self.assertEqual(self._pop_all_words(queue), ["high", "low"])
+        self.assertIsNone(queue.get_next_priority())
+
+    def test_removed_levels_are_not_reported(self):
+        queue = SearchRequestQueue()
+        high = SearchRequest("high", priority=5)
+        queue.put(high)
+        queue.put(SearchRequest("moved", priority=3))
+        queue.put(SearchRequest("low"))
+
+        queue.pop(high.get_id())
+        self.assertEqual(queue.get_next_priority(), 3)
+
+        queue.put(SearchRequest("moved", priority=1))
+        self.assertEqual(queue.get_next_priority(), 1)
+        self.assertEqual(self._pop_all_words(queue), ["moved", "low"])
+        self.assertIsNone(queue.get_next_priority())
+
+    def test_removed_request_is_skipped(self):
+        queue = SearchRequestQueue()
+        first = SearchRequest("first")
+        queue.put(first)
+        queue.put(SearchRequest("second"))
+
+        self.assertIs(queue.pop(first.get_id()), first)
+        self.assertNotIn(first.get_id(), queue)
+        self.assertEqual(self._pop_all_words(queue), ["second"])
+
+    def test_duplicated_request_keeps_its_turn(self):
+        queue = SearchRequestQueue()
+        queue.put(SearchRequest("first"))
+        queue.put(SearchRequest("second"))
+        queue.put(SearchRequest("first"))
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(self._pop_all_words(queue), ["first", "second"])
+
+    def test_changed_priority_is_enqueued_again(self):
+        queue = SearchRequestQueue()
+        queue.put(SearchRequest("first"))
+        queue.put(SearchRequest("second"))
+        queue.put(SearchRequest("second", priority=3))
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue[SearchRequest("second").get_id()].get_priority(), 3)
+        self.assertEqual(self._pop_all_words(queue), ["second", "first"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from main.search_engine.yahoo_images import YahooImages
+from main.search_session.search_request import SearchRequest
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class SearchRequestTests(unittest.TestCase):
+
+    def test_id_depends_on_content_only(self):
+        self.assertEqual(SearchRequest("cat", {'face': 'true'}).get_id(), SearchRequest("cat", {'face': 'true'}).get_id())
+        self.assertNotEqual(SearchRequest("cat").get_id(), SearchRequest("dog").get_id())
+        self.assertNotEqual(SearchRequest("cat").get_id(),
+                            SearchRequest("cat", search_engine_proto=YahooImages).get_id())
+        self.assertEqual(SearchRequest("cat", priority=3, group="pets").get_id(), SearchRequest("cat").get_id())
+
+    def test_serialization_round_trip(self):
+        search_request = SearchRequest("cat", {'face': 'true'}, YahooImages, priority=2, group="pets")
+        search_request.associate_result([{'url': 'http://a/1.jpg', 'width': '10', 'height': 20, 'desc': 'a cat',
+                                          'searchwords': 'cat', 'source': 'yahoo'}])
+
+        copy = SearchRequest.deserialize(search_request.serialize())
+
+        self.assertEqual(copy.get_id(), search_request.get_id())
+        self.assertEqual(copy.get_priority(), 2)
+        self.assertEqual(copy.get_group(), "pets")
+        self.assertEqual(copy.get_result().serialize(), search_request.get_result().serialize())
+
+    def test_serial_without_id_is_accepted(self):
+        serial = SearchRequest("cat").serialize()
+        del serial['id']
+
+        self.assertEqual(SearchRequest.deserialize(serial).get_id(), SearchRequest("cat").get_id())
+
+    def test_id_not_matching_the_content_is_rejected(self):
+        serial = SearchRequest("cat").serialize()
+        serial['id'] = SearchRequest("dog").get_id()
+
+        with self.assertRaises(ValueError):
+            SearchRequest.deserialize(serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
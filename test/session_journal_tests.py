@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.search_session.session_journal import SessionJournal
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class SessionJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "session")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _new_session(self):
+        return SearchSession(autostart=False, journal=SessionJournal(self.path))
+
+    def _fill_session(self, session):
+        session.append_search_requests([SearchRequest("word{}".format(index)) for index in range(4)])
+
+        finished = session.pop_new_search_request()
+        finished.associate_result([{'url': 'http://a/1.jpg', 'width': 1, 'height': 1, 'desc': '',
+                                    'searchwords': 'word', 'source': 'google'}])
+        session.add_history_entry(finished)
+        session.pop_new_search_request()
+
+        return finished
+
+    def test_session_is_recovered_from_the_journal(self):
+        session = self._new_session()
+        finished = self._fill_session(session)
+        session.journal.close()
+
+        recovered = self._new_session()
+
+        self.assertEqual(recovered.size(), 2)
+        self.assertEqual(recovered.store.count_in_progress(), 1)
+        self.assertEqual(len(recovered.leases), 1)
+        self.assertEqual(list(recovered.get_history()), [finished.get_id()])
+        self.assertEqual(len(recovered.get_history()[finished.get_id()].get_result()), 1)
+
+    def test_truncated_record_is_discarded(self):
+        session = self._new_session()
+        self._fill_session(session)
+        session.journal.close()
+
+        with open(glob.glob(self.path + ".journal.*")[0], 'a') as journal_file:
+            journal_file.write('["a",{"words":')
+
+        recovered = self._new_session()
+
+        self.assertEqual(recovered.size(), 2)
+        self.assertEqual(len(recovered.get_history()), 1)
+
+    def test_compaction_replaces_the_journal_with_a_snapshot(self):
+        session = self._new_session()
+        self._fill_session(session)
+        session._compact_journal()
+        session.append_search_requests([SearchRequest("after snapshot")])
+        session.journal.close()
+
+        self.assertTrue(os.path.exists(self.path + ".snapshot"))
+        self.assertEqual(len(glob.glob(self.path + ".journal.*")), 1)
+
+        recovered = self._new_session()
+
+        self.assertEqual(recovered.size(), 3)
+        self.assertEqual(len(recovered.get_history()), 1)
+
+    def test_older_snapshot_never_overwrites_a_newer_one(self):
+        session = self._new_session()
+        self._fill_session(session)
+
+        with session.lock:
+            older_snapshot = session._capture_snapshot()
+
+        session.append_search_requests([SearchRequest("late")])
+        session._compact_journal()
+        session._write_snapshot(*older_snapshot)
+        session.journal.close()
+
+        self.assertEqual(glob.glob(os.path.join(self.folder, "*.tmp")), [])
+        self.assertEqual(self._new_session().size(), 3)
+
+    def test_unfinished_replacement_recovers_the_previous_content(self):
+        session = self._new_session()
+        self._fill_session(session)
+
+        replacement = SearchSession(autostart=False)
+        replacement.append_search_requests([SearchRequest("new{}".format(index)) for index in range(5)])
+
+        # Crash before the snapshot of the new content is written.
+        session._write_snapshot = lambda *args: None
+        session.stream_deserialize(replacement.stream_serialize())
+        session.append_search_requests([SearchRequest("newer")])
+        session.journal.close()
+
+        self.assertEqual(session.size(), 6)
+        self.assertEqual(self._new_session().size(), 2)
+
+        # The discarded journal doesn't hide the records written after the recovery.
+        recovered = self._new_session()
+        recovered.append_search_requests([SearchRequest("after")])
+        recovered.journal.close()
+
+        self.assertEqual(self._new_session().size(), 3)
+
+    def test_remove_deletes_all_the_files(self):
+        session = self._new_session()
+        self._fill_session(session)
+        session._compact_journal()
+        session.journal.remove()
+
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class SessionStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.session = SearchSession(autostart=False)
+        self.session.append_search_requests([SearchRequest("word{}".format(index)) for index in range(4)])
+
+        finished = self.session.pop_new_search_request()
+        finished.associate_result([{'url': 'http://a/1.jpg', 'width': 1, 'height': 1, 'desc': '',
+                                    'searchwords': 'word', 'source': 'google'}])
+        self.session.add_history_entry(finished)
+        self.session.pop_new_search_request()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _get_counts(session):
+        return [session.size(), session.store.count_in_progress(), len(session.get_history())]
+
+    def test_round_trip_keeping_requests_in_progress(self):
+        lines = list(self.session.stream_serialize(dump_in_progress_as_pending=False))
+
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['format'], "oculus-session-ndjson")
+
+        copy = SearchSession(autostart=False)
+        copy.stream_deserialize(io.BytesIO("".join(lines).encode()), load_in_progress_as_pending=False)
+
+        self.assertEqual(self._get_counts(copy), [2, 1, 1])
+        self.assertEqual(len(copy.leases), 1)
+        self.assertEqual(sorted(copy.get_history()), sorted(self.session.get_history()))
+        self.assertEqual(copy.get_history_since(0)[1], self.session.get_history_since(0)[1])
+
+    def test_content_is_replaced(self):
+        copy = SearchSession(autostart=False)
+        copy.append_search_requests([SearchRequest("previous")])
+        copy.stream_deserialize(self.session.stream_serialize())
+
+        self.assertEqual(self._get_counts(copy), [3, 0, 1])
+        self.assertNotIn(SearchRequest("previous").get_id(), [search_request.get_id() for search_request in
+                                                               copy.store.get_pending()])
+
+    def test_malformed_stream_leaves_the_session_untouched(self):
+        copy = SearchSession(autostart=False)
+        copy.append_search_requests([SearchRequest("previous")])
+
+        with self.assertRaises(ValueError):
+            copy.stream_deserialize(['{"format":"oculus-session-ndjson","version":1}\n', '{"words":"a"}\n'])
+
+        with self.assertRaises(ValueError):
+            copy.stream_deserialize(['{"unknown": true}\n'])
+
+        self.assertEqual(self._get_counts(copy), [1, 0, 0])
+
+    def test_save_and_load_session(self):
+        filename = os.path.join(self.folder, "backup.ndjson")
+
+        self.assertTrue(self.session.save_session(filename))
+
+        copy = SearchSession(autostart=False)
+        self.assertTrue(copy.load_session(filename))
+        self.assertEqual(self._get_counts(copy), [3, 0, 1])
+
+    def test_legacy_json_backups_are_loaded(self):
+        for indent in [None, 4]:
+            filename = os.path.join(self.folder, "backup.json")
+
+            with open(filename, 'w') as outfile:
+                json.dump(self.session.serialize(), outfile, indent=indent)
+
+            copy = SearchSession(autostart=False)
+
+            self.assertTrue(copy.load_session(filename))
+            self.assertEqual(self._get_counts(copy), [3, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
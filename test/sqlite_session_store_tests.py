@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.search_engine.google_images import GoogleImages
+from main.search_engine.yahoo_images import YahooImages
+from main.search_session.search_request import SearchRequest
+from main.search_session.search_session import SearchSession
+from main.search_session.session_journal import SessionJournal
+from main.search_session.session_store.sqlite_session_store import SQLiteSessionStore
+from main.service.global_status import global_status
+
+__author__ = "Ivan de Paz Centeno"
+
+
+def tearDownModule():
+    global_status.stop()
+
+
+class SQLiteSessionStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "session.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _words(search_requests):
+        return [search_request.get_words() for search_request in search_requests]
+
+    @staticmethod
+    def _get_counts(store):
+        return [store.count_pending(), store.count_in_progress(), store.count_history()]
+
+    def test_operations_are_committed_when_they_return(self):
+        session = SearchSession(autostart=False, store=SQLiteSessionStore(self.path))
+        session.append_search_requests([SearchRequest("a"), SearchRequest("b"), SearchRequest("c")])
+        session.add_history_entry(session.pop_new_search_request())
+        session.pop_new_search_request()
+
+        # Another connection only sees the committed writes, as the process would after a crash.
+        reader = SQLiteSessionStore(self.path)
+
+        self.assertEqual(self._get_counts(reader), [1, 1, 1])
+        self.assertEqual(self._words(reader.get_history()), ["a"])
+
+    def test_scheduling_is_kept_after_reopening(self):
+        store = SQLiteSessionStore(self.path)
+
+        for words, engine in [("g1", GoogleImages), ("g2", GoogleImages), ("y1", YahooImages)]:
+            store.put_pending(SearchRequest(words, search_engine_proto=engine))
+
+        store.close()
+        store = SQLiteSessionStore(self.path)
+
+        self.assertEqual(store.count_pending(), 3)
+        self.assertEqual(store.get_next_pending_priority(), 0)
+        self.assertEqual(self._words([store.pop_next_pending() for _ in range(3)]), ["g1", "y1", "g2"])
+        self.assertIsNone(store.pop_next_pending())
+        self.assertIsNone(store.get_next_pending_priority())
+
+    def test_collections_are_snapshots(self):
+        store = SQLiteSessionStore(self.path)
+        store.put_pending(SearchRequest("a"))
+        store.put_history(SearchRequest("h"))
+
+        pending = store.get_pending()
+        history = store.get_history_with_sequences()
+
+        store.put_pending(SearchRequest("b"))
+        store.clear_history()
+        store.flush()
+
+        self.assertEqual(self._words(pending), ["a"])
+        self.assertEqual([[sequence, search_request.get_words()] for sequence, search_request in history], [[1, "h"]])
+        self.assertEqual(self._words(store.get_pending()), ["a", "b"])
+
+    def test_replace_with_keeps_the_feed_cursor(self):
+        store = SQLiteSessionStore(self.path)
+        store.put_history(SearchRequest("old"))
+
+        staging_store = store.create_staging()
+        staging_store.put_pending(SearchRequest("p"))
+        staging_store.put_in_progress(SearchRequest("i"))
+        staging_store.put_history(SearchRequest("new"))
+
+        store.replace_with(staging_store)
+
+        self.assertFalse(os.path.exists(staging_store.path))
+        self.assertEqual(self._get_counts(store), [1, 1, 1])
+        self.assertEqual(self._words(store.get_history_since(1)[0]), ["new"])
+        self.assertEqual(self._words([store.pop_next_pending()]), ["p"])
+
+    def test_journal_is_ignored_with_a_persistent_store(self):
+        journal = SessionJournal(os.path.join(self.folder, "journal"))
+        session = SearchSession(autostart=False, journal=journal, store=SQLiteSessionStore(self.path))
+        session.append_search_requests([SearchRequest("a")])
+
+        self.assertIsNone(session.journal)
+        self.assertFalse(journal.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+from main.service.transport_core_pool import TransportCorePool
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class FakeBrowser(object):
+    """
+    Transport core that takes part in the checks of the pool.
+    """
+    launched = []
+
+    def __init__(self):
+        self.healthy = True
+        self.pages_loaded = 0
+        self.memory_usage = 100
+        self.closed = False
+        FakeBrowser.launched.append(self)
+
+    def is_healthy(self):
+        return self.healthy
+
+    def get_pages_loaded(self):
+        return self.pages_loaded
+
+    def get_memory_usage(self):
+        return self.memory_usage
+
+    def close(self):
+        self.closed = True
+
+
+class PlainCore(object):
+    pass
+
+
+class BrokenBrowser(FakeBrowser):
+
+    def __init__(self):
+        raise Exception("Browser could not be launched")
+
+
+class TransportCorePoolTests(unittest.TestCase):
+
+    def setUp(self):
+        FakeBrowser.launched = []
+        self.transport_core_pool = TransportCorePool(max_pages=10, max_memory=500)
+
+    def test_cores_are_warmed_up_once(self):
+        self.transport_core_pool.warm_up([FakeBrowser, PlainCore, BrokenBrowser])
+
+        self.assertEqual(len(FakeBrowser.launched), 1)
+        self.assertIs(self.transport_core_pool.get(FakeBrowser), FakeBrowser.launched[0])
+        self.assertEqual(set(self.transport_core_pool.transport_cores), {FakeBrowser, PlainCore})
+
+    def test_unhealthy_core_is_replaced(self):
+        browser = self.transport_core_pool.get(FakeBrowser)
+        plain_core = self.transport_core_pool.get(PlainCore)
+
+        self.transport_core_pool.check()
+
+        self.assertIs(self.transport_core_pool.get(FakeBrowser), browser)
+
+        browser.healthy = False
+        self.transport_core_pool.check()
+
+        self.assertTrue(browser.closed)
+        self.assertIsNot(self.transport_core_pool.get(FakeBrowser), browser)
+        self.assertIs(self.transport_core_pool.get(PlainCore), plain_core)
+
+    def test_worn_out_cores_are_recycled(self):
+        browser = self.transport_core_pool.get(FakeBrowser)
+        browser.pages_loaded = 10
+        self.transport_core_pool.check()
+
+        self.assertTrue(browser.closed)
+
+        browser = self.transport_core_pool.get(FakeBrowser)
+        browser.memory_usage = 501
+        self.transport_core_pool.check()
+
+        self.assertTrue(browser.closed)
+        self.assertEqual(len(FakeBrowser.launched), 3)
+
+    def test_no_limits_by_default(self):
+        transport_core_pool = TransportCorePool()
+        browser = transport_core_pool.get(FakeBrowser)
+        browser.pages_loaded = 10000
+        browser.memory_usage = 10000
+
+        transport_core_pool.check()
+
+        self.assertIs(transport_core_pool.get(FakeBrowser), browser)
+
+        transport_core_pool.close()
+
+        self.assertTrue(browser.closed)
+        self.assertEqual(transport_core_pool.transport_cores, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from main.transport_core import webcore
+from main.transport_core.webcore import WebCore, HEADLESS_VARIABLE, SHARED_DISPLAY_VARIABLE, LEAN_VARIABLE, \
+    IDLE_TIME, TimeoutException
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class RecordingOptions(object):
+
+    def __init__(self):
+        self.arguments = []
+        self.capabilities = {}
+        self.profile = None
+
+    def add_argument(self, argument):
+        self.arguments.append(argument)
+
+    def set_capability(self, name, value):
+        self.capabilities[name] = value
+
+
+class RecordingProfile(object):
+
+    def __init__(self):
+        self.preferences = {}
+
+    def set_preference(self, name, value):
+        self.preferences[name] = value
+
+
+class RecordingFirefox(object):
+    """
+    Stands for the browser: records the options it is launched with.
+    """
+
+    def __init__(self, options=None):
+        self.profile = options.profile
+        self.options = options
+        self.quitted = False
+        self.scripts = []
+
+    def set_window_size(self, width, height):
+        pass
+
+    def execute_script(self, script, *args):
+        if self.quitted:
+            raise Exception("Browser is gone")
+
+        self.scripts.append(args)
+
+        # Stands for a page with three elements of the class "tile".
+        if args and args[:2] != ('class', 'tile'):
+            return 0 if args[2] == 'count' else []
+
+        if args and args[2] == 'count':
+            return 3
+
+        return ["{} {}".format(args[3], index) for index in range(3)] if args else 1
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def execute_async_script(self, script, *args):
+        self.scripts.append(args)
+
+        # The elements of the class "tile" arrive up to three.
+        return min(args[1], 3) if args[0] == 'tile' else 0
+
+    def quit(self):
+        self.quitted = True
+
+
+class FailingFirefox(RecordingFirefox):
+    """
+    Stands for a browser that can't be launched.
+    """
+
+    def __init__(self, options=None):
+        raise OSError("geckodriver not found")
+
+
+class RecordingDisplay(object):
+    """
+    Stands for the virtual display, which is made the display of the process when it is started.
+    """
+    started = 0
+    stopped = 0
+
+    def __init__(self, visible=0, size=None):
+        pass
+
+    def start(self):
+        RecordingDisplay.started += 1
+        os.environ["DISPLAY"] = ":{}".format(1000 + RecordingDisplay.started)
+
+    def stop(self):
+        RecordingDisplay.stopped += 1
+
+
+class WebCoreModeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.originals = [webcore.Firefox, webcore.FirefoxOptions, webcore.FirefoxProfile, webcore.Display,
+                          dict(os.environ)]
+        webcore.Firefox, webcore.FirefoxOptions, webcore.FirefoxProfile, webcore.Display = \
+            RecordingFirefox, RecordingOptions, RecordingProfile, RecordingDisplay
+        RecordingDisplay.started = RecordingDisplay.stopped = 0
+
+        for variable in [HEADLESS_VARIABLE, SHARED_DISPLAY_VARIABLE, LEAN_VARIABLE]:
+            os.environ.pop(variable, None)
+
+    def tearDown(self):
+        webcore.stop_shared_display()
+        webcore.Firefox, webcore.FirefoxOptions, webcore.FirefoxProfile, webcore.Display, environment = \
+            self.originals
+        os.environ.clear()
+        os.environ.update(environment)
+
+    def test_headless_by_default(self):
+        web_core = WebCore()
+
+        self.assertTrue(web_core.headless)
+        self.assertEqual(web_core.virtual_browser.options.arguments, ["-headless"])
+        self.assertEqual(RecordingDisplay.started, 0)
+        self.assertTrue(web_core.is_healthy())
+
+        web_core.close()
+
+        self.assertFalse(web_core.is_healthy())
+
+    def test_headless_mode_can_be_disabled(self):
+        os.environ[HEADLESS_VARIABLE] = "0"
+
+        web_core = WebCore()
+
+        self.assertEqual(web_core.virtual_browser.options.arguments, [])
+        self.assertEqual(RecordingDisplay.started, 1)
+        self.assertFalse(WebCore(gui=True).headless)
+
+    def test_browsers_share_the_display(self):
+        webcore.start_shared_display()
+        webcore.start_shared_display()
+
+        [WebCore(headless=False) for _ in range(3)]
+
+        self.assertEqual(RecordingDisplay.started, 1)
+        self.assertIn(SHARED_DISPLAY_VARIABLE, os.environ)
+
+        webcore.stop_shared_display()
+
+        self.assertNotIn(SHARED_DISPLAY_VARIABLE, os.environ)
+
+    def test_lean_profile_by_default(self):
+        browser = WebCore().virtual_browser
+
+        self.assertEqual(browser.profile.preferences["permissions.default.image"], 2)
+        self.assertTrue(browser.profile.preferences["privacy.trackingprotection.enabled"])
+        self.assertEqual(browser.options.capabilities, {"pageLoadStrategy": "eager"})
+
+        os.environ[LEAN_VARIABLE] = "0"
+        browser = WebCore().virtual_browser
+
+        self.assertNotIn("permissions.default.image", browser.profile.preferences)
+        self.assertFalse(browser.profile.preferences["browser.cache.disk.enable"])
+        self.assertEqual(browser.options.capabilities, {})
+        self.assertTrue(WebCore(lean=True).lean)
+
+    def test_launch_errors_are_raised(self):
+        webcore.Firefox = FailingFirefox
+
+        with self.assertRaises(OSError):
+            WebCore(headless=False)
+
+        # The display of the browser is not left behind.
+        self.assertEqual(RecordingDisplay.started, 1)
+        self.assertEqual(RecordingDisplay.stopped, 1)
+
+
+class WebCoreBulkReadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.original_firefox = webcore.Firefox
+        webcore.Firefox = RecordingFirefox
+        self.web_core = WebCore(headless=True)
+        self.browser = self.web_core.virtual_browser
+
+    def tearDown(self):
+        webcore.Firefox = self.original_firefox
+
+    def test_elements_are_read_in_a_single_script(self):
+        self.assertEqual(self.web_core.get_elements_html_by_class("tile"),
+                         ["innerHTML 0", "innerHTML 1", "innerHTML 2"])
+        self.assertEqual(self.web_core.get_elements_html_by_class("tile", False)[0], "outerHTML 0")
+        self.assertEqual(self.web_core.get_elements_attribute_by_class("tile", "m")[2], "m 2")
+        self.assertEqual(self.web_core.count_elements_by_class("tile"), 3)
+        self.assertEqual(len(self.browser.scripts), 4)
+
+    def test_missing_elements(self):
+        self.assertEqual(self.web_core.get_elements_html_by_id("missing"), [])
+        self.assertEqual(self.web_core.count_elements_by_class("missing"), 0)
+
+        self.browser.quit()
+
+        self.assertEqual(self.web_core.get_elements_html_by_tag("img"), [])
+        self.assertEqual(self.web_core.count_elements_by_class("tile"), 0)
+
+
+    def test_waits_are_resolved_in_the_page(self):
+        self.assertEqual(self.web_core.wait_for_element_count("tile", 2), 2)
+        self.assertEqual(self.browser.scripts[-1], ("tile", 2, 5, IDLE_TIME))
+        self.assertEqual(self.web_core.wait_for_element_count("tile", 10), 3)
+
+        self.web_core.wait_for_elements_from_class("tile")
+        self.web_core.manual_wait_for_element_from_class("missing")
+
+        # Waiting for a single element never gives up before the timeout.
+        self.assertEqual(self.browser.scripts[-1], ("missing", 1, 5, None))
+        self.assertRaises(TimeoutException, self.web_core.wait_for_elements_from_class, "missing")
+
+
+if __name__ == '__main__':
+    unittest.main()